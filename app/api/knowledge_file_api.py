@@ -7,8 +7,9 @@ from app.core.auth import get_current_admin_user
 from app.db.db import get_session
 from app.models.user import AdminUser
 from app.schemas.json_response import JsonData
-from app.schemas.knowledge_schema import CompleteUploadRequest, UploadRequest
+from app.schemas.knowledge_schema import CompleteUploadRequest, UploadRequest, PartUrlRequest, BulkDeleteRequest
 from app.services.knowledge_service import knowledge_service
+from app.services.vector_store import get_vector_store
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +49,24 @@ def request_file_upload(
     return JsonData.success(upload_credentials)
 
 
+@router.post("/upload-part-urls", summary="1.1 分页获取分片上传URL")
+def request_part_upload_urls(
+        request_data: PartUrlRequest,
+        session: Session = Depends(get_session),
+        current_admin: AdminUser = Depends(get_current_admin_user)
+) -> JsonData:
+    """
+    分片较多时，上传凭证只包含第一页分片的URL，客户端根据 next_part_number 在此端点获取后续分片的URL。
+    """
+    part_urls = knowledge_service.get_part_upload_urls(
+        session=session,
+        file_id=request_data.file_id,
+        start_part_number=request_data.start_part_number,
+        count=request_data.count
+    )
+    return JsonData.success(part_urls)
+
+
 @router.post("/finalize-upload", summary="2. 确认文件上传完成")
 def finalize_file_upload(
     request_data: CompleteUploadRequest,
@@ -66,3 +85,31 @@ def finalize_file_upload(
     )
 
     return JsonData.success(data={"file_id": db_file.id, "status": db_file.status,"msg":"文件已确认上传，等待后续处理"})
+
+
+@router.post("/bulk-delete", summary="批量删除文件/知识库")
+def bulk_delete_files(
+    request_data: BulkDeleteRequest,
+    session: Session = Depends(get_session),
+    current_admin: AdminUser = Depends(get_current_admin_user)
+) -> JsonData:
+    """
+    按文件ID列表或知识库ID批量删除：向量按批删除、只flush一次，文件记录批量逻辑删除。
+    删除产生的已删除记录由worker的compaction调度在超过阈值后清理。
+    """
+    logger.info(f"管理员 {current_admin.username} 请求批量删除，知识库ID: {request_data.knowledge_base_id}，"
+                f"文件数: {len(request_data.file_ids or [])}")
+    result = knowledge_service.delete_files(
+        session=session,
+        file_ids=request_data.file_ids,
+        knowledge_base_id=request_data.knowledge_base_id
+    )
+    return JsonData.success(result)
+
+
+@router.get("/vector-stats", summary="向量库删除与compaction统计")
+def get_vector_stats(current_admin: AdminUser = Depends(get_current_admin_user)) -> JsonData:
+    """
+    当前向量库（Milvus为当前版本Collection）的总记录数、可见记录数和尚未被compaction清理的已删除记录占比。
+    """
+    return JsonData.success(get_vector_store().deletion_stats())
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
+from typing import Optional, Dict
 
 # 构建到项目根目录的.env文件的绝对路径
 # Path(__file__) -> app/core/config.py
@@ -37,21 +38,182 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str
     MINIO_SECURE: bool
     MINIO_DEFAULT_BUCKET: str
+    # 区域，用于本地计算预签名URL（避免查询桶区域的网络请求）
+    MINIO_REGION: str = "us-east-1"
+    # 分片上传时每次返回的预签名URL数量
+    MINIO_PART_URL_PAGE_SIZE: int = 1000
+    # 大于该大小的对象按字节范围并行下载
+    MINIO_PARALLEL_DOWNLOAD_THRESHOLD: int = 64 * 1024 * 1024
+    # 并行下载的分段大小和并发数，并发数为1时关闭并行下载
+    MINIO_DOWNLOAD_PART_SIZE: int = 16 * 1024 * 1024
+    MINIO_DOWNLOAD_WORKERS: int = 8
+
+    # --- 向量存储 ---
+    # milvus / local（进程内的NumPy向量库，数据mmap自LOCAL_VECTOR_STORE_PATH，不需要Milvus）
+    VECTOR_STORE_BACKEND: str = "milvus"
+    LOCAL_VECTOR_STORE_PATH: str = "data/vector_store"
+    # 本地向量库的检索方式：flat（精确）/ ivf（行数足够的segment按k-means聚类，只扫描最近的nprobe个簇）
+    LOCAL_VECTOR_INDEX: str = "flat"
+    LOCAL_VECTOR_IVF_NLIST: int = 256
+    LOCAL_VECTOR_IVF_NPROBE: int = 16
+    # 本地向量库的segment数量上限，超过后按行数分层合并（小于LOCAL_VECTOR_MERGE_ROWS行为最低层，每层行数为上一层的4倍）
+    LOCAL_VECTOR_MAX_SEGMENTS: int = 32
+    LOCAL_VECTOR_MERGE_ROWS: int = 100000
 
     # --- Milvus 配置 ---
-    MILVUS_HOST: str
-    MILVUS_PORT: int
-    MILVUS_DB_NAME: str
+    # 只在首次使用时连接，VECTOR_STORE_BACKEND=local 时不需要Milvus
+    MILVUS_HOST: str = "localhost"
+    MILVUS_PORT: int = 19530
+    MILVUS_DB_NAME: str = "healthlink_db"
+
+    # 向量存储类型：float / float16 / bfloat16 / binary（二值粗排+float16精排）
+    MILVUS_VECTOR_TYPE: str = "float"
+    # binary模式下粗排候选数量 = top_k * 该倍数
+    MILVUS_BINARY_RERANK_FACTOR: int = 10
+    # 文本块的存储位置：inline（Milvus的chunk_text字段，最长4000字节）/ mysql（zstd压缩后按块存入MySQL，
+    # Milvus只保存引用，不占用查询节点内存，也不截断文本）；只影响新建的Collection
+    MILVUS_TEXT_STORE: str = "inline"
+    # file_id/knowledge_base_id的标量索引类型：INVERTED / STL_SORT，为空时不建立（过滤和按文件删除需要全表扫描）
+    MILVUS_SCALAR_INDEX_TYPE: str = "INVERTED"
+    # 新建Collection时为向量和文本字段开启mmap，原始数据从磁盘映射而不是全部常驻查询节点内存
+    MILVUS_MMAP_ENABLED: bool = False
+    # 服务检查别名health_documents是否已切换到新版本Collection的间隔（秒）
+    MILVUS_ALIAS_REFRESH_SECONDS: float = 30.0
+    # 外部文本存储：每个压缩块的原始文本字节数上限、zstd压缩级别、进程内解压后文本块的LRU缓存大小(MB)
+    CHUNK_TEXT_BLOCK_BYTES: int = 64 * 1024
+    CHUNK_TEXT_ZSTD_LEVEL: int = 3
+    CHUNK_TEXT_CACHE_MB: int = 64
+
+    # --- Milvus 写入缓冲配置 ---
+    # 缓冲区达到任一阈值（行数/字节数/时长）即触发一次批量写入
+    MILVUS_INSERT_BATCH_ROWS: int = 2000
+    MILVUS_INSERT_BATCH_BYTES: int = 16 * 1024 * 1024
+    MILVUS_INSERT_MAX_AGE_SECONDS: float = 2.0
+    # 缓冲区内等待写入的最大行数，超过后写入方会被阻塞（背压）
+    MILVUS_INSERT_MAX_PENDING_ROWS: int = 20000
+    # --- Milvus BulkInsert配置 ---
+    # Milvus读取导入文件的MinIO桶（milvus.yaml中的minio.bucketName）
+    MILVUS_BULK_INSERT_BUCKET: str = "a-bucket"
+    # 每个BulkInsert任务（一组.npy文件）的行数
+    MILVUS_BULK_INSERT_ROWS_PER_FILE: int = 500000
+    # 批量删除时每个 file_id in [...] 表达式中的文件数量
+    MILVUS_DELETE_BATCH_SIZE: int = 1000
+    # compaction调度：检查间隔（秒，0表示不检查）、触发compaction的已删除记录占比、等待完成的超时（秒）
+    MILVUS_COMPACTION_CHECK_INTERVAL_SECONDS: int = 600
+    MILVUS_COMPACTION_DELETED_RATIO: float = 0.1
+    MILVUS_COMPACTION_TIMEOUT_SECONDS: int = 1800
 
     # --- 大语言模型 API Key ---
     # 重要提示: API密钥必须在.env文件中设置，而不是在这里硬编码。
     MODEL_KEY: str
     EMBEDDING_MODEL: str
     EMBEDDING_MODEL_URL: str
-    TEXT_EMBEDDING_MODEL: str
+    # 文本向量模型：dashscope（TEXT_EMBEDDING_MODEL接口）/ hashing（字符n-gram特征哈希，离线、无需模型）/
+    # onnx（ONNX_EMBEDDING_MODEL_PATH下的本地模型，需要onnxruntime）；更换后需要重建Collection
+    EMBEDDING_PROVIDER: str = "dashscope"
+    TEXT_EMBEDDING_MODEL: str = "text-embedding-v4"
+    # 文本向量模型的输出维度（text-embedding-v3/v4 支持 1024/768/512/256/128/64；hashing任意；onnx不超过模型维度）
+    TEXT_EMBEDDING_DIMENSION: int = 1024
+    # 本地ONNX模型目录，需包含 model.onnx 和 tokenizer.json
+    ONNX_EMBEDDING_MODEL_PATH: Optional[str] = None
+    # 特征哈希的最大字符n-gram长度
+    HASHING_EMBEDDING_NGRAM: int = 3
+    # 本地模型（hashing/onnx）每批向量化的文本块数量，本地模型不受 EMBEDDING_REQUESTS_PER_SECOND 限流
+    LOCAL_EMBEDDING_BATCH_SIZE: int = 64
+    # Milvus中存储的向量维度，配置了投影矩阵时应等于投影的输出维度
+    VECTOR_DIMENSION: int = 1024
+    # 离线拟合的PCA投影矩阵(.npy)路径，为空则不做投影；只用于文本向量，图片向量不投影
+    EMBEDDING_PROJECTION_PATH: Optional[str] = None
+    # 文本块向量缓存后端：sqlite（本节点文件，只在同一节点内命中）/ mysql（chunk_embedding表，所有节点共享）
+    # 向量化worker部署在多个节点时应使用mysql，否则重新向量化落到其他节点时缓存不会命中
+    EMBEDDING_CACHE_BACKEND: str = "sqlite"
+    # 文本块向量缓存(SQLite)路径，为空则不启用缓存（仅sqlite后端）
+    EMBEDDING_CACHE_PATH: Optional[str] = "data/embedding_cache.sqlite3"
     MODEL_URL: str
     MODE_NAME: str
 
+    # --- 向量化流水线配置 ---
+    # 文档解析进程池大小，0表示使用CPU核数
+    INGESTION_PROCESS_WORKERS: int = 0
+    # PDF按页分片并行加载时每个分片的页数
+    INGESTION_PAGES_PER_TASK: int = 8
+    # 解析子进程的内存上限(MB)，0表示不限制
+    INGESTION_WORKER_MEMORY_MB: int = 4096
+    # 解析子进程执行多少个任务后重建，0表示不重建
+    INGESTION_MAX_TASKS_PER_CHILD: int = 50
+    # 每次embedding请求的最大文本块数量（同时受模型限制，遇到限流时自动减小）
+    EMBEDDING_BATCH_SIZE: int = 10
+    # 单个文件同时在途的embedding批次上限
+    EMBEDDING_MAX_INFLIGHT: int = 4
+    # embedding接口每秒请求数上限（所有线程共享），0表示不限制
+    EMBEDDING_REQUESTS_PER_SECOND: float = 10
+    # 限流/超时等可重试错误的最大重试次数
+    EMBEDDING_MAX_RETRIES: int = 3
+    # 文本切分器：token（按句子边界和token数切分）/ recursive（旧的按字符切分）
+    TEXT_SPLITTER: str = "token"
+    # 每个文本块的最大token数和相邻文本块的重叠token数
+    CHUNK_TOKENS: int = 512
+    CHUNK_OVERLAP_TOKENS: int = 64
+    # token计数方式：estimate（估算，无额外依赖）/ dashscope（通义千问分词器，需要tiktoken）
+    TEXT_SPLITTER_TOKENIZER: str = "estimate"
+    # --- 网页抓取配置 ---
+    # 连接池大小（所有网站共享）
+    WEB_CRAWLER_MAX_CONNECTIONS: int = 16
+    # 同一网站同时在途的请求数，以及相邻两次请求的最小间隔（秒）
+    WEB_CRAWLER_PER_HOST_CONCURRENCY: int = 2
+    WEB_CRAWLER_PER_HOST_DELAY_SECONDS: float = 1.0
+    WEB_CRAWLER_TIMEOUT_SECONDS: float = 20
+    # 网页大小上限（字节），超过时放弃
+    WEB_CRAWLER_MAX_BYTES: int = 10 * 1024 * 1024
+    WEB_CRAWLER_USER_AGENT: str = "MedicalKnowledgeBot/1.0"
+    # 网页的刷新周期（秒），0表示不刷新；worker每隔检查间隔检查一次到期的网页
+    WEB_REFRESH_INTERVAL_SECONDS: int = 86400
+    WEB_REFRESH_CHECK_INTERVAL_SECONDS: int = 600
+    # 每次检查最多刷新的网页数
+    WEB_REFRESH_BATCH_SIZE: int = 200
+    # --- JSON/CSV流式加载配置 ---
+    # JSON条目的ijson路径，默认顶层数组的元素
+    STRUCTURED_JSON_ITEM_PATH: str = "item"
+    # 每条记录拼接成文本的模板，字段名用{}引用，缺失字段为空；为空时按 "字段: 值" 逐行拼接全部字段
+    STRUCTURED_TEXT_TEMPLATE: str = ""
+    # 每次切分的记录数
+    STRUCTURED_BATCH_ITEMS: int = 200
+    # --- 图片向量化配置 ---
+    # 每次请求携带的图片数量（需模型支持单次多图，multimodal-embedding-v1 保持为1）
+    IMAGE_EMBEDDING_BATCH_SIZE: int = 1
+    # 同时在途的请求数（也是连接池大小）
+    IMAGE_EMBEDDING_MAX_CONCURRENCY: int = 4
+    IMAGE_EMBEDDING_TIMEOUT_SECONDS: float = 30
+    # 图片长边或文件大小超过限制时缩放并重新编码为JPEG后再向量化
+    IMAGE_EMBEDDING_MAX_SIDE: int = 1024
+    IMAGE_EMBEDDING_MAX_BYTES: int = 3 * 1024 * 1024
+    IMAGE_EMBEDDING_JPEG_QUALITY: int = 85
+    # --- PDF分层提取配置 ---
+    # 文本层有效字符数少于该值且页面含图片时做OCR
+    PDF_MIN_TEXT_CHARS: int = 50
+    # 文本层乱码字符占比超过该值时做OCR
+    PDF_MAX_GARBLED_RATIO: float = 0.3
+    # unstructured的OCR策略（ocr_only / hi_res）和tesseract语言
+    PDF_OCR_STRATEGY: str = "ocr_only"
+    PDF_OCR_LANGUAGES: str = "chi_sim+eng"
+    # 页面OCR结果缓存(SQLite)路径，为空则不缓存
+    PDF_PAGE_CACHE_PATH: Optional[str] = "data/pdf_page_cache.sqlite3"
+
+    # --- 向量化任务队列配置 ---
+    # 每个worker进程同时执行的任务数
+    INGESTION_WORKER_CONCURRENCY: int = 2
+    # 任务租约时长，worker执行期间每隔1/3租约时长续约一次
+    INGESTION_LEASE_SECONDS: int = 120
+    INGESTION_MAX_ATTEMPTS: int = 5
+    INGESTION_RETRY_BACKOFF_SECONDS: int = 30
+    INGESTION_RETRY_BACKOFF_MAX_SECONDS: int = 900
+    # 处于processing/completed状态超过该时长且不在队列中的文件会被重新入队
+    INGESTION_STUCK_SECONDS: int = 1800
+    INGESTION_REAPER_INTERVAL_SECONDS: int = 60
+    INGESTION_POLL_INTERVAL_SECONDS: float = 1.0
+    # 知识库优先级，JSON格式，例如 {"123": 10}，数值越大越优先，未配置为0
+    INGESTION_KB_PRIORITIES: Dict[int, int] = {}
+
     # --- ai业务相关 ---
     TEMP_MEMORY_SIZE: int
 
@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from app.db.db import engine
+from app.models.knowledge import ChunkEmbedding
+
+"""
+按内容寻址的文本块向量缓存
+
+每个文本块以 sha256(规范化文本, 模型名, 输出维度) 作为键，向量以float32字节保存，存储后端由 EMBEDDING_CACHE_BACKEND 选择：
+- sqlite: 本节点的SQLite文件，只在同一节点内共享；向量化worker部署在多个节点时，重新向量化落到其他节点会全部未命中
+- mysql: MySQL的 chunk_embedding 表，所有节点共享，多节点部署时使用
+缓存的是模型的原始输出（投影之前），因此：
+- 重新上传/重新向量化未变化的文件不会产生任何embedding接口调用
+- 只改了几页的文档只需要为变化的文本块调用接口
+- 更换投影矩阵、重建集合等不更换模型的迁移也可以完全命中缓存
+查询向量（text_type=query）与文档向量不同，不经过缓存。
+"""
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    规范化文本：NFKC归一化（全角半角等），合并连续空白，去掉首尾空白
+    :param text:
+    :return:
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def chunk_key(text: str, model: str, dimension: int) -> bytes:
+    """
+    计算文本块的缓存键
+    :param text:
+    :param model: embedding模型名称
+    :param dimension: 模型输出维度
+    :return: 32字节的sha256摘要
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{model}\x00{dimension}\x00".encode("utf-8"))
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.digest()
+
+
+class EmbeddingStore(ABC):
+    """
+    向量缓存的存储后端
+    """
+
+    @abstractmethod
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        批量读取
+        :param keys:
+        :return: 命中的键到向量的映射
+        """
+
+    @abstractmethod
+    def put_many(self, items: Dict[bytes, Sequence[float]]):
+        """
+        批量写入，已存在的键保持不变
+        :param items:
+        :return:
+        """
+
+
+class ChunkEmbeddingStore(EmbeddingStore):
+    """
+    基于SQLite的向量缓存存储，WAL模式下支持多线程/多进程并发读写，只在本节点内共享
+    """
+    # SQLite单条语句的参数数量上限
+    _MAX_PARAMS = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embedding (key BLOB PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        每个线程使用独立的连接
+        :return:
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        connection = self._connection()
+        for start in range(0, len(keys), self._MAX_PARAMS):
+            batch = keys[start:start + self._MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(f"SELECT key, vector FROM chunk_embedding WHERE key IN ({placeholders})", batch)
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[bytes, Sequence[float]]):
+        if not items:
+            return
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        with self._connection() as connection:
+            connection.executemany("INSERT OR IGNORE INTO chunk_embedding (key, vector) VALUES (?, ?)", rows)
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunk_embedding").fetchone()[0]
+
+
+class MySQLChunkEmbeddingStore(EmbeddingStore):
+    """
+    基于MySQL chunk_embedding 表的向量缓存存储，所有节点共享
+    """
+    # 单条语句的键数量上限
+    _MAX_PARAMS = 500
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with Session(engine) as session:
+            for start in range(0, len(keys), self._MAX_PARAMS):
+                rows = session.exec(select(ChunkEmbedding.key, ChunkEmbedding.vector)
+                                    .where(ChunkEmbedding.key.in_(keys[start:start + self._MAX_PARAMS]))).all()
+                for key, vector in rows:
+                    found[bytes(key)] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[bytes, Sequence[float]]):
+        if not items:
+            return
+        rows = [{"key": key, "vector": np.asarray(vector, dtype=np.float32).tobytes()} for key, vector in items.items()]
+        with Session(engine) as session:
+            for start in range(0, len(rows), self._MAX_PARAMS):
+                # 多个节点可能同时写入相同的文本块，INSERT IGNORE保留先写入的向量
+                session.execute(insert(ChunkEmbedding).prefix_with("IGNORE"), rows[start:start + self._MAX_PARAMS])
+            session.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    为文档向量化增加内容寻址缓存的Embeddings包装器，只对缓存未命中的文本块调用底层模型
+    """
+
+    def __init__(self, base: Embeddings, store: EmbeddingStore, model: str, dimension: int):
+        self.base = base
+        self.store = store
+        self.model = model
+        self.dimension = dimension
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, texts: List[str]):
+        """
+        查询缓存
+        :return: (每个文本的键, 命中结果, 需要调用模型的去重文本及其键)
+        """
+        keys = [chunk_key(text, self.model, self.dimension) for text in texts]
+        cached = self.store.get_many(list(set(keys)))
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._stats_lock:
+            self.hits += len(texts) - sum(1 for key in keys if key not in cached)
+            self.misses += len(missing)
+        return keys, cached, missing
+
+    def _assemble(self, keys: List[bytes], cached: Dict[bytes, np.ndarray], missing: Dict[bytes, str],
+                  vectors: List[List[float]]) -> List[List[float]]:
+        fresh = dict(zip(missing.keys(), vectors))
+        self.store.put_many(fresh)
+        return [cached[key].tolist() if key in cached else list(fresh[key]) for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        keys, cached, missing = self._lookup(texts)
+        vectors = self.base.embed_documents(list(missing.values())) if missing else []
+        return self._assemble(keys, cached, missing, vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        keys, cached, missing = self._lookup(texts)
+        vectors = await self.base.aembed_documents(list(missing.values())) if missing else []
+        return self._assemble(keys, cached, missing, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.base.aembed_query(text)
+
+
+def build_cached_embeddings(base: Embeddings, path: Optional[str], model: str, dimension: int,
+                            backend: str = "sqlite") -> Embeddings:
+    """
+    根据配置为embeddings增加缓存，sqlite后端未配置路径时原样返回
+    :param base:
+    :param path: SQLite文件路径
+    :param model:
+    :param dimension:
+    :param backend: sqlite / mysql
+    :return:
+    """
+    if backend == "mysql":
+        logger.info("已启用文本块向量缓存: MySQL chunk_embedding 表（所有节点共享）")
+        return CachedEmbeddings(base, MySQLChunkEmbeddingStore(), model, dimension)
+    if backend != "sqlite":
+        raise ValueError(f"不支持的向量缓存后端: {backend}")
+    if not path:
+        return base
+    store = ChunkEmbeddingStore(path)
+    logger.info(f"已启用文本块向量缓存: {path}，已缓存 {store.count()} 条（仅本节点共享）")
+    return CachedEmbeddings(base, store, model, dimension)
@@ -0,0 +1,352 @@
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_community.embeddings.dashscope import embed_with_retry
+from langchain_core.embeddings import Embeddings
+
+from app.core.embedding_cache import normalize_text
+
+"""
+Embedding相关的封装
+
+- DashScopeTextEmbeddings: 支持指定输出维度的DashScope文本向量模型
+- HashingEmbeddings: 字符n-gram特征哈希，纯NumPy实现，不依赖模型和网络
+- OnnxEmbeddings: 从本地目录加载的ONNX文本向量模型（需要安装onnxruntime）
+- EmbeddingProjection: 离线拟合的PCA投影矩阵，以.npy文件保存
+- ProjectedEmbeddings: 在入库和查询时统一应用投影的Embeddings包装器
+"""
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PROVIDERS = ("dashscope", "hashing", "onnx")
+
+
+class DashScopeTextEmbeddings(DashScopeEmbeddings):
+    """
+    支持dimension参数的DashScope文本向量模型（text-embedding-v3/v4支持多种输出维度）
+    """
+    dimension: Optional[int] = None
+
+    def _extra_kwargs(self) -> dict:
+        return {"dimension": self.dimension} if self.dimension else {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results = embed_with_retry(self, input=texts, text_type="document", model=self.model, **self._extra_kwargs())
+        return [item["embedding"] for item in results]
+
+    def embed_query(self, text: str) -> List[float]:
+        results = embed_with_retry(self, input=text, text_type="query", model=self.model, **self._extra_kwargs())
+        return results[0]["embedding"]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """
+    splitmix64的末尾混合，把n-gram的多项式哈希打散到64位（uint64数组运算按2^64回绕）
+    """
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    字符n-gram的特征哈希向量（signed hashing trick）
+
+    文本规范化（NFKC、合并空白、小写）后取 1..ngram 个字符的n-gram，哈希到 dimension 个桶，
+    按哈希的最高位决定正负号，计数做 sign(x)·log(1+|x|) 压缩后L2归一化。
+    同一批文本的n-gram哈希和计数全部用NumPy向量化计算；结果只取决于文本、ngram、dimension和seed，
+    不同机器、不同进程之间完全一致。文档和查询使用同一编码
+    """
+
+    _PRIME = np.uint64(0x100000001B3)
+
+    def __init__(self, dimension: int, ngram: int = 3, seed: int = 0):
+        """
+        :param dimension: 输出维度
+        :param ngram: 最大的n-gram长度（中文按字切分，2~3效果较好）
+        :param seed: 哈希种子，改变后所有向量都会变化
+        """
+        if dimension <= 0 or ngram <= 0:
+            raise ValueError(f"dimension和ngram必须为正数: {dimension}, {ngram}")
+        self.dimension = dimension
+        self.ngram = ngram
+        self.seed = np.uint64(seed)
+
+    @property
+    def model_name(self) -> str:
+        """
+        用于缓存键和日志的模型名称
+        """
+        return f"hashing-char{self.ngram}-seed{int(self.seed)}"
+
+    def _hash_ngrams(self, text: str) -> np.ndarray:
+        """
+        计算一个文本全部n-gram的64位哈希
+        """
+        codes = np.frombuffer(normalize_text(text).lower().encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        hashes = []
+        for n in range(1, min(self.ngram, len(codes)) + 1):
+            count = len(codes) - n + 1
+            values = codes[:count].copy()
+            for offset in range(1, n):
+                values = values * self._PRIME + codes[offset:offset + count]
+            # 混入n，避免不同长度的n-gram落在同一哈希上
+            hashes.append(_mix64((values * self._PRIME + np.uint64(n)) ^ self.seed))
+        return np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        向量化一批文本
+        :param texts:
+        :return: (文本数量, dimension) 的float32矩阵
+        """
+        hashes = [self._hash_ngrams(text) for text in texts]
+        lengths = np.array([len(item) for item in hashes], dtype=np.int64)
+        if not lengths.sum():
+            return np.zeros((len(texts), self.dimension), dtype=np.float32)
+        values = np.concatenate(hashes)
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        buckets = (values % np.uint64(self.dimension)).astype(np.int64)
+        signs = 1.0 - 2.0 * (values >> np.uint64(63)).astype(np.float32)
+        counts = np.bincount(rows * self.dimension + buckets, weights=signs, minlength=len(texts) * self.dimension)
+        counts = counts.reshape(len(texts), self.dimension)
+        return _normalize_rows(np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    从本地目录加载的ONNX文本向量模型，目录中需包含 model.onnx 和 tokenizer.json（如optimum导出的BGE/E5模型）
+
+    按长度排序后分批推理以减少padding，对last_hidden_state按attention_mask做均值池化
+    （模型直接输出二维句向量时直接使用），截取前 dimension 维后L2归一化。
+    onnxruntime为可选依赖，只在使用该模型时导入
+    """
+
+    def __init__(self, model_dir: str, dimension: Optional[int] = None, batch_size: int = 32,
+                 max_length: int = 512, threads: int = 0):
+        """
+        :param model_dir: 模型目录
+        :param dimension: 输出维度，为空时使用模型的隐藏层维度；只能小于等于隐藏层维度（截取前若干维）
+        :param batch_size: 每次推理的文本数量
+        :param max_length: 最大token数，超出部分截断
+        :param threads: onnxruntime的线程数，0表示由onnxruntime决定
+        """
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("使用ONNX embedding需要安装 onnxruntime 和 tokenizers（poetry install -E onnx）") from e
+        self.model_dir = model_dir
+        self.dimension = dimension
+        self.batch_size = max(1, batch_size)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), sess_options=options, providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        logger.info(f"已加载ONNX embedding模型: {model_dir}，输入: {sorted(self.input_names)}")
+
+    @property
+    def model_name(self) -> str:
+        """
+        用于缓存键和日志的模型名称
+        """
+        return f"onnx:{os.path.basename(os.path.normpath(self.model_dir))}"
+
+    def _run(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([item.ids for item in encodings], dtype=np.int64),
+            "attention_mask": np.array([item.attention_mask for item in encodings], dtype=np.int64),
+            "token_type_ids": np.array([item.type_ids for item in encodings], dtype=np.int64),
+        }
+        output = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        if output.ndim == 3:
+            mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+        if self.dimension:
+            if self.dimension > output.shape[1]:
+                raise ValueError(f"配置的维度 {self.dimension} 大于模型输出维度 {output.shape[1]}")
+            output = output[:, :self.dimension]
+        return _normalize_rows(output.astype(np.float32))
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        向量化一批文本
+        :param texts:
+        :return: (文本数量, 维度) 的float32矩阵，顺序与texts一致
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for index, vector in zip(batch, self._run([texts[i] for i in batch])):
+                results[index] = vector
+        return np.vstack(results)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+def create_text_embeddings(provider: str, dimension: int, model: Optional[str] = None, api_key: Optional[str] = None,
+                           onnx_model_path: Optional[str] = None, hashing_ngram: int = 3,
+                           batch_size: int = 32) -> Tuple[Embeddings, str]:
+    """
+    按provider创建文本向量模型
+    :param provider: dashscope / hashing / onnx
+    :param dimension: 输出维度
+    :param model: DashScope模型名称
+    :param api_key: DashScope API Key
+    :param onnx_model_path: ONNX模型目录
+    :param hashing_ngram: 特征哈希的最大n-gram长度
+    :param batch_size: 本地模型每次推理的文本数量
+    :return: (embeddings, 模型名称)，模型名称用于缓存键和批大小限制
+    """
+    if provider == "dashscope":
+        # 重试由BatchEmbeddingClient统一负责（带限流和批大小调整），这里只请求一次，避免重试次数叠加
+        embeddings = DashScopeTextEmbeddings(model=model, max_retries=1, dashscope_api_key=api_key, dimension=dimension)
+        return embeddings, model
+    if provider == "hashing":
+        embeddings = HashingEmbeddings(dimension, ngram=hashing_ngram)
+        return embeddings, embeddings.model_name
+    if provider == "onnx":
+        if not onnx_model_path:
+            raise ValueError("EMBEDDING_PROVIDER=onnx 时必须配置 ONNX_EMBEDDING_MODEL_PATH")
+        embeddings = OnnxEmbeddings(onnx_model_path, dimension=dimension, batch_size=batch_size)
+        return embeddings, embeddings.model_name
+    raise ValueError(f"不支持的embedding provider: {provider}，可选: {', '.join(EMBEDDING_PROVIDERS)}")
+
+
+class EmbeddingProjection:
+    """
+    线性投影 y = normalize(x @ W + b)
+
+    以单个.npy文件保存，形状为 (输入维度 + 1, 输出维度)：
+    前输入维度行为投影矩阵W，最后一行为偏置b（PCA中为 -mean @ W）
+    """
+
+    def __init__(self, matrix: np.ndarray):
+        """
+        :param matrix: (输入维度 + 1, 输出维度) 的投影矩阵
+        """
+        self.weights = np.ascontiguousarray(matrix[:-1], dtype=np.float32)
+        self.bias = np.ascontiguousarray(matrix[-1], dtype=np.float32)
+
+    @property
+    def input_dim(self) -> int:
+        return self.weights.shape[0]
+
+    @property
+    def output_dim(self) -> int:
+        return self.weights.shape[1]
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingProjection":
+        """
+        从.npy文件加载投影矩阵
+        :param path:
+        :return:
+        """
+        matrix = np.load(path, allow_pickle=False)
+        if matrix.ndim != 2:
+            raise ValueError(f"投影矩阵格式不正确: {path}")
+        return cls(matrix)
+
+    @classmethod
+    def from_pca(cls, mean: np.ndarray, components: np.ndarray) -> "EmbeddingProjection":
+        """
+        由PCA的均值和主成分构造投影
+        :param mean: (输入维度,)
+        :param components: (输出维度, 输入维度)，按方差从大到小排列
+        :return:
+        """
+        weights = np.asarray(components, dtype=np.float32).T
+        bias = -np.asarray(mean, dtype=np.float32) @ weights
+        return cls(np.vstack([weights, bias]))
+
+    def save(self, path: str):
+        """
+        保存为.npy文件
+        :param path:
+        :return:
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, np.vstack([self.weights, self.bias]), allow_pickle=False)
+
+    def apply(self, vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        """
+        对一批向量应用投影并做L2归一化
+        :param vectors:
+        :return:
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        projected = matrix @ self.weights + self.bias
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return projected / norms
+
+
+class ProjectedEmbeddings(Embeddings):
+    """
+    包装任意Embeddings，在输出上应用投影，保证入库和查询使用同一投影
+    """
+
+    def __init__(self, base: Embeddings, projection: EmbeddingProjection):
+        self.base = base
+        self.projection = projection
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.projection.apply(self.base.embed_documents(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.projection.apply([self.base.embed_query(text)])[0].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.projection.apply(await self.base.aembed_documents(texts)).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.projection.apply([await self.base.aembed_query(text)])[0].tolist()
+
+
+def load_projection(path: Optional[str]) -> Optional[EmbeddingProjection]:
+    """
+    加载配置的投影矩阵，未配置时返回None
+    :param path:
+    :return:
+    """
+    if not path:
+        return None
+    projection = EmbeddingProjection.load(path)
+    logger.info(f"已加载向量投影: {path}，{projection.input_dim} -> {projection.output_dim} 维")
+    return projection
@@ -1,10 +1,13 @@
 import logging
+from typing import Optional
 
-from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 
 from app.core.config import settings
+from app.core.embedding_cache import build_cached_embeddings
+from app.core.embeddings import EmbeddingProjection, ProjectedEmbeddings, create_text_embeddings, load_projection
 
 logger = logging.getLogger(__name__)
 _model = ChatOpenAI(
@@ -19,11 +22,29 @@ _model = ChatOpenAI(
     }
 )
 
-_embeddings = DashScopeEmbeddings(
+# 按EMBEDDING_PROVIDER选择文本向量模型，模型名称用于缓存键（更换模型或维度不会命中旧缓存）
+_text_embeddings, _embedding_model_name = create_text_embeddings(
+    settings.EMBEDDING_PROVIDER,
+    settings.TEXT_EMBEDDING_DIMENSION,
     model=settings.TEXT_EMBEDDING_MODEL,
-    max_retries=3,
-    dashscope_api_key=settings.MODEL_KEY,
+    api_key=settings.MODEL_KEY,
+    onnx_model_path=settings.ONNX_EMBEDDING_MODEL_PATH,
+    hashing_ngram=settings.HASHING_EMBEDDING_NGRAM,
+    batch_size=settings.LOCAL_EMBEDDING_BATCH_SIZE,
+)
+# 缓存的是模型原始输出（投影之前），更换投影时缓存依然有效；特征哈希比查缓存更快，不使用缓存
+_base_embeddings = _text_embeddings if settings.EMBEDDING_PROVIDER == "hashing" else build_cached_embeddings(
+    _text_embeddings,
+    settings.EMBEDDING_CACHE_PATH,
+    _embedding_model_name,
+    settings.TEXT_EMBEDDING_DIMENSION,
+    backend=settings.EMBEDDING_CACHE_BACKEND,
 )
+# 配置了投影矩阵时，入库和查询都在同一投影后的低维空间中进行
+_projection = load_projection(settings.EMBEDDING_PROJECTION_PATH)
+_embeddings: Embeddings = ProjectedEmbeddings(_base_embeddings, _projection) if _projection else _base_embeddings
+if (_projection.output_dim if _projection else settings.TEXT_EMBEDDING_DIMENSION) != settings.VECTOR_DIMENSION:
+    logger.warning(f"Embedding输出维度与VECTOR_DIMENSION({settings.VECTOR_DIMENSION})不一致，请检查配置")
 
 def get_default_llm() -> ChatOpenAI:
     """
@@ -34,9 +55,30 @@ def get_default_llm() -> ChatOpenAI:
     logger.info(f"API Key exists: {bool(settings.MODEL_KEY)}")
     return _model
 
-def get_default_embeddings() -> DashScopeEmbeddings:
+def get_default_embeddings() -> Embeddings:
     """
     获取默认embeddings对象
     :return:
     """
-    return _embeddings
\ No newline at end of file
+    return _embeddings
+
+def get_embedding_model_name() -> str:
+    """
+    获取当前文本向量模型的名称（dashscope为接口模型名，本地模型为 hashing-*/onnx:*）
+    :return:
+    """
+    return _embedding_model_name
+
+def get_base_embeddings() -> Embeddings:
+    """
+    获取未经投影的embeddings对象（含缓存），用于离线拟合投影
+    :return:
+    """
+    return _base_embeddings
+
+def get_embedding_projection() -> Optional[EmbeddingProjection]:
+    """
+    获取当前生效的向量投影，未配置时为None
+    :return:
+    """
+    return _projection
@@ -1,5 +1,6 @@
 import logging
 
+import redis as sync_redis
 import redis.asyncio as redis
 
 from app.core.config import settings
@@ -12,11 +13,18 @@ class RedisService:
         初始化异步redis连接池
         """
         self.pool = None
+        self.sync_pool = None
+        redis_url = f"redis://:{settings.REDIS_PASSWORD}@{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
 
         try:
             # 创建一个异步连接池 decode_responses=True 会自动将从Redis获取的bytes解码为utf-8字符串
             self.pool = redis.ConnectionPool.from_url(
-                f"redis://:{settings.REDIS_PASSWORD}@{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}",
+                redis_url,
+                decode_responses=True
+            )
+            # 同步连接池，供后台线程/worker进程等非异步场景使用
+            self.sync_pool = sync_redis.ConnectionPool.from_url(
+                redis_url,
                 decode_responses=True
             )
             logger.info(f"成功创建Redis连接池: {self.pool}")
@@ -33,5 +41,14 @@ class RedisService:
             raise ConnectionError("Redis连接池未初始化")
         return redis.Redis(connection_pool=self.pool)
 
+    def get_sync_client(self) -> sync_redis.Redis:
+        """
+        从同步连接池中获取一个redis客户端
+        :return:
+        """
+        if not self.sync_pool:
+            raise ConnectionError("Redis连接池未初始化")
+        return sync_redis.Redis(connection_pool=self.sync_pool)
+
 # 创建一个全局的redisService实例
 redis_service = RedisService()
\ No newline at end of file
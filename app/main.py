@@ -8,6 +8,10 @@ from starlette.middleware.cors import CORSMiddleware
 
 from app.api import admin_user_api,knowledge_file_api,chat_app_api,chat_web_api
 from app.core.exceptions import ApiException, api_exception_handler
+from app.services.image_embedding import image_embedding_client
+from app.services.ingestion_pipeline import shutdown_process_pool
+from app.services.milvus_insert_buffer import milvus_insert_buffer
+from app.services.web_crawler import web_crawler
 
 logging.basicConfig(
     level=logging.INFO,
@@ -34,6 +38,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 关闭时写完Milvus写入缓冲区中的剩余数据
+app.add_event_handler("shutdown", milvus_insert_buffer.close)
+app.add_event_handler("shutdown", shutdown_process_pool)
+app.add_event_handler("shutdown", image_embedding_client.close)
+app.add_event_handler("shutdown", web_crawler.close)
 app.include_router(admin_user_api.router)
 app.include_router(knowledge_file_api.router)
 app.include_router(chat_app_api.router)
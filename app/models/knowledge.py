@@ -1,6 +1,8 @@
+from datetime import datetime
 from typing import Optional
-from sqlmodel import Field
-from app.models.base import BaseModel
+from sqlalchemy import BINARY, Column, LargeBinary
+from sqlmodel import Field, SQLModel
+from app.models.base import BaseModel, get_utc_now
 from app.core.constants import FileStatus
 
 class KnowledgeBase(BaseModel, table=True):
@@ -28,8 +30,48 @@ class KnowledgeFile(BaseModel, table=True):
     admin_user_id: Optional[int] = Field(default=None, description="上传文件的管理员ID")
     knowledge_base_id: Optional[int] = Field(default=None, description="所属知识库ID")
     upload_id: Optional[str] = Field(default=None, max_length=255, description="分片上传任务ID")
+    part_count: Optional[int] = Field(default=None, description="分片上传的总分片数")
     status: str = Field(default=FileStatus.PENDING, max_length=50, nullable=False, description="文件处理状态")
 
+class WebPage(BaseModel, table=True):
+    """
+    网页类型知识库文件的抓取状态，用于条件请求和变更检测
+    """
+    __tablename__ = "web_page"
+
+    knowledge_file_id: int = Field(nullable=False, unique=True, description="对应的知识库文件ID")
+    url: str = Field(max_length=1024, nullable=False, description="网页地址")
+    etag: Optional[str] = Field(default=None, max_length=255, description="上次响应的ETag")
+    last_modified: Optional[str] = Field(default=None, max_length=64, description="上次响应的Last-Modified")
+    content_hash: Optional[str] = Field(default=None, max_length=64, description="正文文本的SHA-256")
+    http_status: Optional[int] = Field(default=None, description="上次抓取的HTTP状态码")
+    fetched_at: Optional[datetime] = Field(default=None, description="上次抓取时间 (UTC)")
+    changed_at: Optional[datetime] = Field(default=None, description="上次内容变化时间 (UTC)")
+
+class ChunkTextBlock(SQLModel, table=True):
+    """
+    外部文本存储的压缩块，每行保存同一文件的一组连续文本块
+    使用自增ID而不是雪花ID：Milvus中的引用为 (块ID << 12) | 块内序号，需要ID足够小
+    """
+    __tablename__ = "chunk_text_block"
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="自增ID")
+    collection_name: str = Field(max_length=255, nullable=False, description="所属的Milvus Collection")
+    file_id: int = Field(nullable=False, index=True, description="所属文件ID")
+    chunk_count: int = Field(nullable=False, description="块内文本块数量")
+    raw_bytes: int = Field(nullable=False, description="压缩前的文本字节数")
+    data: bytes = Field(sa_column=Column(LargeBinary(length=2 ** 24 - 1), nullable=False), description="zstd压缩的数据")
+    created_at: datetime = Field(default_factory=get_utc_now, nullable=False, description="创建时间 (UTC)")
+
+class ChunkEmbedding(SQLModel, table=True):
+    """
+    文本块向量缓存（EMBEDDING_CACHE_BACKEND=mysql），键为 sha256(规范化文本, 模型名, 输出维度)
+    """
+    __tablename__ = "chunk_embedding"
+
+    key: bytes = Field(sa_column=Column(BINARY(32), primary_key=True), description="缓存键")
+    vector: bytes = Field(sa_column=Column(LargeBinary, nullable=False), description="float32向量")
+
 class PatientFile(BaseModel, table=True):
     """
     患者上传文件表模型
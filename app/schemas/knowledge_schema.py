@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 class UploadRequest(BaseModel):
     filename: str = Field(..., description="文件名")
@@ -12,3 +12,12 @@ class UploadRequest(BaseModel):
 
 class CompleteUploadRequest(BaseModel):
     file_id: int = Field(..., description="文件ID")
+
+class PartUrlRequest(BaseModel):
+    file_id: int = Field(..., description="文件ID")
+    start_part_number: int = Field(1, description="起始分片序号，从1开始")
+    count: Optional[int] = Field(None, description="本次获取的URL数量，默认及上限为MINIO_PART_URL_PAGE_SIZE")
+
+class BulkDeleteRequest(BaseModel):
+    file_ids: Optional[List[int]] = Field(None, description="要删除的文件ID列表")
+    knowledge_base_id: Optional[int] = Field(None, description="知识库ID，只指定知识库ID时删除整个知识库的文件")
@@ -0,0 +1,249 @@
+import logging
+import struct
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from typing import Dict, List, Optional
+
+import zstandard
+from sqlalchemy import delete, func, update
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db.db import engine
+from app.models.knowledge import ChunkTextBlock
+
+"""
+外部文本存储（MILVUS_TEXT_STORE=mysql）
+
+Milvus中只保存一个INT64引用，文本块本身按文件分组、拼成不超过 CHUNK_TEXT_BLOCK_BYTES 的块，
+zstd压缩后存入MySQL的 chunk_text_block 表，并记录所属的Collection（各版本的Collection互不影响）：
+- 引用 = (块ID << 12) | 块内序号，单个块最多 4096 个文本块
+- 块格式：<文本块数量 uint32> <每个文本块的字节数 uint32...> <UTF-8文本拼接>，整体zstd压缩
+- 检索时只对最终的top-k按块批量读取，解压后的块放入进程内LRU缓存
+- 文件的向量被删除时，同时删除该文件在该Collection中的全部块；删除Collection时删除其全部块
+"""
+logger = logging.getLogger(__name__)
+
+SEQ_BITS = 12
+MAX_CHUNKS_PER_BLOCK = 1 << SEQ_BITS
+
+
+def make_ref(block_id: int, seq: int) -> int:
+    return (block_id << SEQ_BITS) | seq
+
+
+def split_ref(ref: int) -> tuple:
+    """
+    :return: (块ID, 块内序号)
+    """
+    return ref >> SEQ_BITS, ref & (MAX_CHUNKS_PER_BLOCK - 1)
+
+
+def pack_texts(texts: List[str]) -> bytes:
+    encoded = [text.encode("utf-8") for text in texts]
+    header = struct.pack(f"<I{len(encoded)}I", len(encoded), *(len(item) for item in encoded))
+    return header + b"".join(encoded)
+
+
+def unpack_texts(data: bytes) -> List[str]:
+    (count,) = struct.unpack_from("<I", data)
+    lengths = struct.unpack_from(f"<{count}I", data, 4)
+    offset = 4 + 4 * count
+    texts = []
+    for length in lengths:
+        texts.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    return texts
+
+
+class ChunkTextStore:
+    """
+    zstd压缩、按块索引的文本块存储
+    """
+
+    def __init__(
+            self,
+            block_bytes: int = settings.CHUNK_TEXT_BLOCK_BYTES,
+            level: int = settings.CHUNK_TEXT_ZSTD_LEVEL,
+            cache_mb: int = settings.CHUNK_TEXT_CACHE_MB,
+    ):
+        """
+        :param block_bytes: 每个块压缩前的文本字节数上限（单个超长文本块独占一个块）
+        :param level: zstd压缩级别
+        :param cache_mb: 解压后文本块的LRU缓存大小
+        """
+        self.block_bytes = block_bytes
+        self.level = level
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self._cache: "OrderedDict[int, List[str]]" = OrderedDict()
+        self._cache_sizes: Dict[int, int] = {}
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def iter_blocks(self, texts: List[str]):
+        """
+        把同一文件的文本块切分为若干块
+        """
+        block, size = [], 0
+        for text in texts:
+            length = len(text.encode("utf-8"))
+            if block and (size + length > self.block_bytes or len(block) >= MAX_CHUNKS_PER_BLOCK):
+                yield block
+                block, size = [], 0
+            block.append(text)
+            size += length
+        if block:
+            yield block
+
+    def put(self, collection_name: str, file_ids: List[int], texts: List[str]) -> List[int]:
+        """
+        保存一批文本块（按file_ids分组，同一文件的连续文本块压缩在一起）
+        :param collection_name: 引用这些文本块的Collection（实际名称，不是别名）
+        :param file_ids: 与texts一一对应
+        :param texts:
+        :return: 与texts一一对应的引用
+        """
+        if not texts:
+            return []
+        compressor = zstandard.ZstdCompressor(level=self.level)
+        rows, blocks = [], []
+        for file_id, group in groupby(zip(file_ids, texts), key=lambda pair: pair[0]):
+            for block in self.iter_blocks([text for _, text in group]):
+                packed = pack_texts(block)
+                rows.append(ChunkTextBlock(collection_name=collection_name, file_id=file_id, chunk_count=len(block),
+                                           raw_bytes=len(packed), data=compressor.compress(packed)))
+                blocks.append(block)
+        with Session(engine) as session:
+            session.add_all(rows)
+            session.flush()
+            block_ids = [row.id for row in rows]
+            session.commit()
+        refs = []
+        for block_id, block in zip(block_ids, blocks):
+            refs.extend(make_ref(block_id, seq) for seq in range(len(block)))
+        return refs
+
+    def get_many(self, refs: List[int]) -> List[Optional[str]]:
+        """
+        批量读取文本块，同一块只读取、解压一次
+        :param refs:
+        :return: 与refs一一对应，不存在的为None
+        """
+        if not refs:
+            return []
+        block_ids = {split_ref(ref)[0] for ref in refs}
+        blocks: Dict[int, List[str]] = {}
+        with self._lock:
+            for block_id in block_ids:
+                cached = self._cache.get(block_id)
+                if cached is not None:
+                    self._cache.move_to_end(block_id)
+                    blocks[block_id] = cached
+        missing = block_ids - blocks.keys()
+        if missing:
+            with Session(engine) as session:
+                rows = session.exec(
+                    select(ChunkTextBlock.id, ChunkTextBlock.data).where(ChunkTextBlock.id.in_(missing))
+                ).all()
+            decompressor = zstandard.ZstdDecompressor()
+            for block_id, data in rows:
+                texts = unpack_texts(decompressor.decompress(data))
+                blocks[block_id] = texts
+                self._cache_put(block_id, texts)
+        results = []
+        for ref in refs:
+            block_id, seq = split_ref(ref)
+            texts = blocks.get(block_id)
+            results.append(texts[seq] if texts is not None and seq < len(texts) else None)
+        return results
+
+    def _cache_put(self, block_id: int, texts: List[str]):
+        size = sum(len(text) for text in texts) * 2
+        if size > self.cache_bytes:
+            return
+        with self._lock:
+            if block_id in self._cache:
+                return
+            self._cache[block_id] = texts
+            self._cache_sizes[block_id] = size
+            self._cached_bytes += size
+            while self._cached_bytes > self.cache_bytes:
+                evicted, _ = self._cache.popitem(last=False)
+                self._cached_bytes -= self._cache_sizes.pop(evicted)
+
+    def delete_file(self, collection_name: str, file_id: int) -> int:
+        """
+        删除一个文件在某个Collection中的全部文本块
+        :param collection_name:
+        :param file_id:
+        :return: 删除的块数量
+        """
+        return self.delete_files(collection_name, [file_id])
+
+    def delete_files(self, collection_name: str, file_ids: List[int], batch_size: int = 1000) -> int:
+        """
+        删除多个文件在某个Collection中的全部文本块
+        :param collection_name:
+        :param file_ids:
+        :param batch_size: 每条DELETE语句中的文件数量
+        :return: 删除的块数量
+        """
+        deleted = 0
+        with Session(engine) as session:
+            for start in range(0, len(file_ids), batch_size):
+                result = session.execute(delete(ChunkTextBlock).where(
+                    ChunkTextBlock.collection_name == collection_name,
+                    ChunkTextBlock.file_id.in_(file_ids[start:start + batch_size]),
+                ))
+                deleted += result.rowcount
+            session.commit()
+        # 块ID自增不复用，缓存中已删除的块不会再被引用，无需清理
+        return deleted
+
+    def delete_collection(self, collection_name: str) -> int:
+        """
+        删除某个Collection的全部文本块，在删除Collection时调用
+        :param collection_name:
+        :return: 删除的块数量
+        """
+        with Session(engine) as session:
+            result = session.execute(delete(ChunkTextBlock).where(ChunkTextBlock.collection_name == collection_name))
+            session.commit()
+        return result.rowcount
+
+    def rename_collection(self, old_name: str, new_name: str) -> int:
+        """
+        Collection改名后同步修改文本块的归属
+        :param old_name:
+        :param new_name:
+        :return: 修改的块数量
+        """
+        with Session(engine) as session:
+            result = session.execute(update(ChunkTextBlock)
+                                     .where(ChunkTextBlock.collection_name == old_name)
+                                     .values(collection_name=new_name))
+            session.commit()
+        return result.rowcount
+
+    def stats(self, collection_name: Optional[str] = None) -> Dict[str, int]:
+        """
+        存储统计
+        :param collection_name: 为空时统计全部Collection
+        :return: 块数量、文本块数量、压缩前字节数、压缩后字节数
+        """
+        statement = select(
+            func.count(ChunkTextBlock.id),
+            func.coalesce(func.sum(ChunkTextBlock.chunk_count), 0),
+            func.coalesce(func.sum(ChunkTextBlock.raw_bytes), 0),
+            func.coalesce(func.sum(func.length(ChunkTextBlock.data)), 0),
+        )
+        if collection_name:
+            statement = statement.where(ChunkTextBlock.collection_name == collection_name)
+        with Session(engine) as session:
+            blocks, chunks, raw_bytes, stored_bytes = session.exec(statement).one()
+        return {"blocks": int(blocks), "chunks": int(chunks), "raw_bytes": int(raw_bytes), "stored_bytes": int(stored_bytes)}
+
+
+# 创建一个全局的文本存储实例
+chunk_text_store = ChunkTextStore()
@@ -0,0 +1,180 @@
+import logging
+from functools import lru_cache
+from typing import Iterator, List, Callable, Optional
+
+from langchain_community.document_loaders import (
+    TextLoader,          #文本加载
+    Docx2txtLoader,       # Word
+    UnstructuredFileLoader, # 通用文件加载器
+    WebBaseLoader          #网页加载
+)
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.core.config import settings
+from app.core.constants import SupportedMimeTypes
+from app.services.pdf_extraction import extract_pdf, count_pdf_pages
+from app.services.structured_loading import STREAMING_MIME_TYPES, iter_structured_documents, iter_document_batches
+from app.services.text_splitter import ChineseTokenTextSplitter, get_token_counter
+
+"""
+文档加载与切分
+
+这里的函数会在进程池的子进程中执行（CPU密集的解析/OCR/切分），
+因此本模块只能依赖轻量模块，不能导入Milvus、MinIO、数据库等带有连接副作用的服务。
+"""
+logger = logging.getLogger(__name__)
+
+# 定义文档加载器的类型映射，PDF使用分层提取（见 pdf_extraction），JSON/CSV使用流式加载（见 structured_loading）
+LOADER_MAPPING = {
+    SupportedMimeTypes.DOCX.value: Docx2txtLoader,
+    SupportedMimeTypes.TXT.value: TextLoader,
+    SupportedMimeTypes.DOC.value: UnstructuredFileLoader,
+    SupportedMimeTypes.WEB_URL.value: WebBaseLoader,
+    # TODO 还可以添加更多支持的类型
+}
+# recursive切分器的参数（按字符）
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# 单个文本块的最大长度，避免超过embedding接口限制
+MAX_CHUNK_CHARS = 10000
+
+
+def is_supported_mime_type(mime_type: str) -> bool:
+    """
+    是否支持该MIME类型的文本提取
+    :param mime_type:
+    :return:
+    """
+    return mime_type == SupportedMimeTypes.PDF.value or mime_type in STREAMING_MIME_TYPES or mime_type in LOADER_MAPPING
+
+
+def is_streaming_mime_type(mime_type: str) -> bool:
+    """
+    是否按记录流式加载（JSON/CSV）
+    :param mime_type:
+    :return:
+    """
+    return mime_type in STREAMING_MIME_TYPES
+
+
+def load_documents(file_path: str, mime_type: str) -> List[Document]:
+    """
+    根据MIME类型选择加载器加载文档
+    :param file_path: 本地文件路径，网页类型时为URL
+    :param mime_type: MIME类型
+    :return:
+    """
+    if mime_type == SupportedMimeTypes.PDF.value:
+        return extract_pdf(file_path)
+    if mime_type in STREAMING_MIME_TYPES:
+        return list(iter_structured_documents(file_path, mime_type))
+    loader_class = LOADER_MAPPING.get(mime_type)
+    logger.info(f"获取的加载器类型：{loader_class}")
+    if not loader_class:
+        raise ValueError(f"不支持的MIME Type: {mime_type}")
+    if loader_class is WebBaseLoader:
+        return WebBaseLoader([file_path]).load()
+    return loader_class(file_path).load()
+
+
+def count_pages(file_path: str, mime_type: str) -> Optional[int]:
+    """
+    可以按页并行加载的文档返回页数，其他类型返回None
+    DOCX/DOC没有固定的分页（分页取决于渲染），且文本提取本身很快，整文件作为一个任务加载
+    :param file_path:
+    :param mime_type:
+    :return:
+    """
+    if mime_type == SupportedMimeTypes.PDF.value:
+        return count_pdf_pages(file_path)
+    return None
+
+
+def load_pages(file_path: str, mime_type: str, start: int, end: int) -> List[Document]:
+    """
+    加载文档的一段页面 [start, end)，作为进程池任务执行
+    :param file_path:
+    :param mime_type:
+    :param start: 起始页（从0开始）
+    :param end: 结束页（不含）
+    :return: 每页一个文档，元数据中带有页码
+    """
+    if mime_type != SupportedMimeTypes.PDF.value:
+        raise ValueError(f"MIME Type {mime_type} 不支持按页加载")
+    return extract_pdf(file_path, range(start, end))
+
+
+def clean_chunks(chunk_texts: List[str]) -> List[str]:
+    """
+    过滤空白文本块，并截断过长的文本块
+    :param chunk_texts:
+    :return:
+    """
+    validated_texts = []
+    for chunk in chunk_texts:
+        str_chunk = str(chunk)
+        # 过滤掉空字符串和只包含空白字符的字符串
+        if not str_chunk or not str_chunk.strip():
+            continue
+        if len(str_chunk) > MAX_CHUNK_CHARS:
+            str_chunk = str_chunk[:MAX_CHUNK_CHARS]
+            logger.warning(f"文本过长，已截断到{MAX_CHUNK_CHARS}字符")
+        validated_texts.append(str_chunk)
+    return validated_texts
+
+
+def _recursive_split(texts: List[str]) -> List[str]:
+    """
+    旧的按字符数切分
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    chunks = []
+    for text in texts:
+        chunks.extend(text_splitter.split_text(text))
+    return chunks
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter(name: str = settings.TEXT_SPLITTER) -> Callable[[List[str]], List[str]]:
+    """
+    获取文本切分函数（每个进程只创建一次）
+    :param name: token / recursive
+    :return: 输入文档文本列表，返回文本块列表
+    """
+    if name == "recursive":
+        return _recursive_split
+    splitter = ChineseTokenTextSplitter(
+        chunk_tokens=settings.CHUNK_TOKENS,
+        overlap_tokens=settings.CHUNK_OVERLAP_TOKENS,
+        token_counter=get_token_counter(settings.TEXT_SPLITTER_TOKENIZER),
+    )
+    return splitter.split_texts
+
+
+def split_documents(docs: List[Document]) -> List[str]:
+    """
+    切分文档并返回清洗后的文本块
+    :param docs:
+    :return:
+    """
+    if not docs:
+        logger.warning("文档加载器未返回任何内容")
+        return []
+    chunks = get_text_splitter()([doc.page_content for doc in docs])
+    logger.debug(f"切分后的文本块数量: {len(chunks)}")
+    return clean_chunks(chunks)
+
+
+def iter_split_chunks(file_path: str, mime_type: str) -> Iterator[str]:
+    """
+    JSON/CSV按记录流式加载，每批记录切分后逐块生成，内存占用与文件大小无关
+    :param file_path:
+    :param mime_type:
+    :return: 清洗后的文本块
+    """
+    for docs in iter_document_batches(iter_structured_documents(file_path, mime_type)):
+        yield from split_documents(docs)
@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+"""
+批量embedding客户端
+
+- 批大小：不超过服务商对单次请求的条数限制；遇到限流/服务端错误时减半，连续成功后逐步恢复（AIMD）
+- 限流：所有线程共享一个令牌桶，控制每秒请求数
+- 失败隔离：参数错误（400）对当前批次二分，只有真正有问题的文本块会失败，
+  其余文本块仍然批量请求，不会退化为逐条串行调用
+- 鉴权失败（401）和重试耗尽的可重试错误与具体文本块无关，直接抛出，由调用方整体重试，不做二分
+"""
+logger = logging.getLogger(__name__)
+
+# 各模型单次请求允许的最大文本条数
+PROVIDER_BATCH_LIMITS = {
+    "text-embedding-v1": 25,
+    "text-embedding-v2": 25,
+    "text-embedding-v3": 10,
+    "text-embedding-v4": 10,
+}
+
+
+class RateLimiter:
+    """
+    线程安全的令牌桶限流器
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        :param rate: 每秒允许的请求数，0表示不限制
+        :param burst: 桶容量，默认与rate相同
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _is_auth_error(error: Exception) -> bool:
+    """
+    鉴权失败（API Key错误或过期）：DashScope对400和401都抛出ValueError，只能按消息中的状态码区分
+    """
+    return isinstance(error, PermissionError) or (isinstance(error, ValueError) and "status_code: 401" in str(error))
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    限流、超时、服务端错误可以重试；参数错误（DashScope返回400时抛出ValueError）重试无意义，需要二分定位
+    """
+    return not isinstance(error, (ValueError, TypeError))
+
+
+def _is_input_error(error: Exception) -> bool:
+    """
+    是否为单个输入导致的参数错误，只有这类错误需要二分定位
+    """
+    return not _is_retryable(error) and not _is_auth_error(error)
+
+
+class BatchEmbeddingClient:
+    """
+    自适应批大小、带限流和失败隔离的批量embedding客户端
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            model: str = settings.TEXT_EMBEDDING_MODEL,
+            max_batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+            max_concurrency: int = settings.EMBEDDING_MAX_INFLIGHT,
+            requests_per_second: float = settings.EMBEDDING_REQUESTS_PER_SECOND,
+            max_retries: int = settings.EMBEDDING_MAX_RETRIES,
+    ):
+        """
+        :param embeddings: 底层Embeddings
+        :param model: 模型名称，用于确定服务商的批大小限制
+        :param max_batch_size: 配置的最大批大小
+        :param max_concurrency: embed() 同时在途的批次数
+        :param requests_per_second: 每秒请求数上限，0表示不限制
+        :param max_retries: 可重试错误的最大重试次数
+        """
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, min(max_batch_size, PROVIDER_BATCH_LIMITS.get(model, max_batch_size)))
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self._batch_size = self.max_batch_size
+        self._successes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embedding-client")
+
+    @property
+    def batch_size(self) -> int:
+        """
+        当前的自适应批大小
+        """
+        return self._batch_size
+
+    def _on_success(self):
+        with self._lock:
+            self._successes += 1
+            # 连续成功一定次数后批大小加1
+            if self._batch_size < self.max_batch_size and self._successes >= 10:
+                self._batch_size += 1
+                self._successes = 0
+
+    def _on_throttled(self):
+        with self._lock:
+            self._successes = 0
+            if self._batch_size > 1:
+                self._batch_size = max(1, self._batch_size // 2)
+                logger.warning(f"embedding请求受限，批大小降为 {self._batch_size}")
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        """
+        发送一次请求，可重试错误按指数退避重试
+        """
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                self._on_success()
+                return vectors
+            except Exception as e:
+                if not _is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._on_throttled()
+                backoff = min(2 ** attempt, 30)
+                logger.warning(f"embedding请求失败，{backoff}秒后第{attempt}次重试: {e}")
+                time.sleep(backoff)
+
+    def embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        向量化一批文本，参数错误时二分定位有问题的文本块
+        鉴权失败、重试耗尽的限流/服务端错误直接抛出
+        :param texts:
+        :return: 与texts一一对应，失败的文本块为None
+        """
+        if not texts:
+            return []
+        try:
+            return self._request(texts)
+        except Exception as e:
+            if not _is_input_error(e):
+                raise
+            if len(texts) == 1:
+                logger.error(f"文本块向量化失败（长度{len(texts[0])}）: {e}")
+                return [None]
+            logger.warning(f"批量向量化失败，二分定位失败的文本块({len(texts)}条): {e}")
+        middle = len(texts) // 2
+        return self.embed_batch(texts[:middle]) + self.embed_batch(texts[middle:])
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        按当前批大小切分后并发向量化
+        :param texts:
+        :return: 与texts一一对应，失败的文本块为None
+        """
+        started = time.monotonic()
+        batch_size = self.batch_size
+        futures = [
+            self._executor.submit(self.embed_batch, texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ]
+        vectors = [vector for future in futures for vector in future.result()]
+        elapsed = max(time.monotonic() - started, 1e-6)
+        failed = sum(1 for vector in vectors if vector is None)
+        logger.info(f"向量化 {len(texts)} 个文本块，失败: {failed}，耗时: {elapsed:.2f}s，"
+                    f"速度: {len(texts) / elapsed:.1f} 块/秒")
+        return vectors
+
+
+def create_embedding_client(embeddings: Embeddings,
+                            max_concurrency: int = settings.EMBEDDING_MAX_INFLIGHT,
+                            provider: str = settings.EMBEDDING_PROVIDER) -> BatchEmbeddingClient:
+    """
+    按embedding provider创建客户端：DashScope按接口的批大小和限流配置，
+    本地模型（hashing/onnx）不限流，按 LOCAL_EMBEDDING_BATCH_SIZE 分批
+    :param embeddings:
+    :param max_concurrency: 同时在途的批次数
+    :param provider: embeddings对应的provider，默认为 EMBEDDING_PROVIDER
+    :return:
+    """
+    if provider == "dashscope":
+        return BatchEmbeddingClient(embeddings, max_concurrency=max_concurrency)
+    return BatchEmbeddingClient(embeddings, model=provider,
+                                max_batch_size=settings.LOCAL_EMBEDDING_BATCH_SIZE,
+                                max_concurrency=max_concurrency, requests_per_second=0)
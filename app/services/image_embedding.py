@@ -0,0 +1,223 @@
+import asyncio
+import io
+import logging
+import threading
+import time
+from typing import List, Optional
+
+import httpx
+from PIL import Image
+
+from app.core.config import settings
+from app.services.minio_service import minio_service
+
+"""
+图片向量化
+
+- ImageEmbeddingClient: 基于httpx的异步多模态embedding客户端，在独立的事件循环线程中运行，
+  连接池在所有任务间复用；模型允许时一次请求携带多张图片，并发请求数有上限
+- prepare_image_url: 过大的图片先缩放并重新编码为JPEG，上传缩略图后再生成预签名地址
+日志中只记录模型、数量、耗时等信息，不记录请求头（含API Key）和请求体。
+"""
+logger = logging.getLogger(__name__)
+
+# Pillow可以解码并缩放的图片类型
+_RESIZABLE_MIME_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+# 可重试的HTTP状态码
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class ImageEmbeddingClient:
+    """
+    异步、连接池化的图片embedding客户端
+    """
+
+    def __init__(
+            self,
+            api_url: str = settings.EMBEDDING_MODEL_URL,
+            api_key: str = settings.MODEL_KEY,
+            model: str = settings.EMBEDDING_MODEL,
+            batch_size: int = settings.IMAGE_EMBEDDING_BATCH_SIZE,
+            max_concurrency: int = settings.IMAGE_EMBEDDING_MAX_CONCURRENCY,
+            timeout_seconds: float = settings.IMAGE_EMBEDDING_TIMEOUT_SECONDS,
+            max_retries: int = settings.EMBEDDING_MAX_RETRIES,
+    ):
+        self.api_url = api_url
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        self._timeout = timeout_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        懒加载后台事件循环线程和httpx客户端
+        :return:
+        """
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="image-embedding-loop", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _open(self):
+        self._client = httpx.AsyncClient(
+            headers=self._headers,
+            timeout=self._timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _post(self, image_urls: List[str]) -> List[Optional[List[float]]]:
+        """
+        一次请求向量化一批图片，可重试错误按指数退避重试
+        :param image_urls:
+        :return: 与image_urls一一对应
+        """
+        payload = {"model": self.model, "input": {"contents": [{"image": url} for url in image_urls]}}
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                started = time.monotonic()
+                try:
+                    response = await self._client.post(self.api_url, json=payload)
+                except httpx.TransportError as e:
+                    error = f"网络错误: {e}"
+                else:
+                    if response.status_code == 200:
+                        break
+                    error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    if response.status_code not in _RETRYABLE_STATUS:
+                        raise ValueError(f"图片向量化失败，{error}")
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"图片向量化失败，已重试{self.max_retries}次，{error}")
+                logger.warning(f"图片向量化请求失败，第{attempt + 1}次重试: {error}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+        logger.info(f"图片向量化请求完成，模型: {self.model}，图片数: {len(image_urls)}，"
+                    f"耗时: {time.monotonic() - started:.2f}s")
+        output = response.json().get("output") or {}
+        vectors: List[Optional[List[float]]] = [None] * len(image_urls)
+        for item in output.get("embeddings") or []:
+            vectors[item.get("index", 0)] = item["embedding"]
+        if any(vector is None for vector in vectors):
+            raise ValueError("阿里云API响应格式不正确，未找到全部图片的embeddings")
+        return vectors
+
+    async def _embed_batch(self, image_urls: List[str]) -> List[Optional[List[float]]]:
+        """
+        向量化一批图片，失败时逐张重试，失败的图片返回None
+        """
+        try:
+            return await self._post(image_urls)
+        except Exception as e:
+            if len(image_urls) == 1:
+                logger.error(f"图片向量化失败: {e}")
+                return [None]
+            logger.warning(f"批量图片向量化失败，逐张重试({len(image_urls)}张): {e}")
+        results = await asyncio.gather(*(self._embed_batch([url]) for url in image_urls))
+        return [vector for result in results for vector in result]
+
+    async def aembed_urls(self, image_urls: List[str]) -> List[Optional[List[float]]]:
+        """
+        并发向量化多张图片，必须在客户端的事件循环中调用
+        :param image_urls: 模型可访问的图片地址
+        :return: 与image_urls一一对应，失败的图片为None
+        """
+        batches = [image_urls[i:i + self.batch_size] for i in range(0, len(image_urls), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batches))
+        return [vector for result in results for vector in result]
+
+    def embed_urls(self, image_urls: List[str]) -> List[Optional[List[float]]]:
+        """
+        同步接口，供worker线程调用
+        :param image_urls:
+        :return:
+        """
+        if not image_urls:
+            return []
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.aembed_urls(image_urls), loop).result()
+
+    def close(self):
+        """
+        关闭连接池和事件循环
+        :return:
+        """
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._client = None
+
+
+def downscale_image(data: bytes) -> Optional[bytes]:
+    """
+    图片超过尺寸或大小限制时缩放并重新编码为JPEG
+    :param data: 原始图片
+    :return: 缩放后的JPEG，无需缩放时返回None
+    """
+    max_side = settings.IMAGE_EMBEDDING_MAX_SIDE
+    with Image.open(io.BytesIO(data)) as image:
+        if max(image.size) <= max_side and len(data) <= settings.IMAGE_EMBEDDING_MAX_BYTES:
+            return None
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=settings.IMAGE_EMBEDDING_JPEG_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+def prepare_image_url(object_name: str, mime_type: str, data: Optional[bytes] = None, expires_in_minutes: int = 10) -> str:
+    """
+    生成供embedding模型下载的图片地址，过大的图片先缩放并上传缩略图
+    :param object_name: 原图在MinIO中的对象名
+    :param mime_type:
+    :param data: 原图内容，调用方已持有时传入以免重复下载
+    :param expires_in_minutes:
+    :return:
+    """
+    target = object_name
+    if mime_type in _RESIZABLE_MIME_TYPES:
+        if data is None:
+            data = minio_service.download_file(settings.MINIO_DEFAULT_BUCKET, object_name)
+        if data is None:
+            raise ValueError(f"无法下载图片: {object_name}")
+        resized = downscale_image(data)
+        if resized is not None:
+            target = f"{object_name}.embedding.jpg"
+            if not minio_service.upload_file(settings.MINIO_DEFAULT_BUCKET, target, resized, "image/jpeg"):
+                raise ValueError(f"无法上传缩放后的图片: {target}")
+            logger.info(f"图片已缩放: {object_name}，{len(data)} -> {len(resized)} 字节")
+    image_url = minio_service.generate_presigned_download_url(
+        bucket_name=settings.MINIO_DEFAULT_BUCKET,
+        object_name=target,
+        expires_in_minutes=expires_in_minutes
+    )
+    if not image_url:
+        raise ValueError("无法生成图片下载地址")
+    return image_url
+
+
+def to_storage_vector(image_vector: List[float]) -> List[float]:
+    """
+    校验图片向量维度。EMBEDDING_PROJECTION_PATH的投影是在文本模型的向量上拟合的，
+    不能用于多模态模型的向量空间（维度相同也只是巧合），因此图片向量不做投影，
+    要求多模态模型的输出维度与 VECTOR_DIMENSION 一致
+    :param image_vector:
+    :return:
+    """
+    if len(image_vector) != settings.VECTOR_DIMENSION:
+        raise ValueError(f"图片向量维度 {len(image_vector)} 与 VECTOR_DIMENSION={settings.VECTOR_DIMENSION} 不一致，"
+                         f"图片向量不使用文本embedding的投影，知识库包含图片时 VECTOR_DIMENSION 须等于多模态模型的输出维度")
+    return image_vector
+
+
+# 创建一个全局的图片embedding客户端实例
+image_embedding_client = ImageEmbeddingClient()
@@ -0,0 +1,237 @@
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.document_loading import (
+    load_documents,
+    count_pages,
+    load_pages,
+    split_documents,
+    is_streaming_mime_type,
+    iter_split_chunks,
+)
+from app.services.embedding_client import BatchEmbeddingClient
+from app.services.milvus_insert_buffer import MilvusInsertBuffer
+
+"""
+分阶段的向量化流水线
+
+1. 加载/切分：CPU密集，在进程池中执行。PDF按页分片，多个分片并行提取（扫描件的OCR可以用满所有核心），
+   结果按页码顺序重新拼接；JSON/CSV按记录流式读取，边切分边向量化；其他类型整文件作为一个任务
+2. 向量化：文本块按批（批大小由embedding客户端自适应调整）提交到线程池并发请求embedding接口，
+   每个文件同时在途的批次数有上限，失败的批次由客户端二分隔离出问题文本块
+3. 写入：每批向量化完成后立即送入共享的Milvus写入缓冲区，向量化线程不等待写入完成，
+   文件的全部批次提交后才统一等待各批的写入结果
+
+在途批次数和写入缓冲区的背压共同保证峰值内存有界。
+"""
+logger = logging.getLogger(__name__)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _limit_worker_memory(limit_mb: int):
+    """
+    进程池子进程的初始化函数：限制数据段内存，超限时任务抛出MemoryError而不是让整个节点OOM
+    使用RLIMIT_DATA而不是RLIMIT_AS，共享库和模型文件的只读映射不计入限制
+    :param limit_mb: 为0时不限制
+    :return:
+    """
+    if limit_mb > 0:
+        limit = limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    获取全局的文档解析进程池（懒加载）
+    使用spawn启动子进程，避免fork继承gRPC/数据库连接等状态；
+    子进程执行一定数量的任务后重建，释放OCR模型等长期累积的内存
+    :return:
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            workers = settings.INGESTION_PROCESS_WORKERS or os.cpu_count() or 1
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_limit_worker_memory,
+                initargs=(settings.INGESTION_WORKER_MEMORY_MB,),
+                max_tasks_per_child=settings.INGESTION_MAX_TASKS_PER_CHILD or None,
+            )
+            logger.info(f"文档解析进程池已启动，进程数: {workers}，"
+                        f"单进程内存上限: {settings.INGESTION_WORKER_MEMORY_MB or '不限'}MB")
+        return _process_pool
+
+
+def _reset_broken_pool(pool: ProcessPoolExecutor):
+    """
+    子进程被杀死后进程池不可再用，丢弃后由下一次调用重建
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def load_documents_in_pool(file_path: str, mime_type: str) -> List[Document]:
+    """
+    在进程池中加载文档，PDF按页分片并行加载，结果按页码顺序返回
+    :param file_path:
+    :param mime_type:
+    :return:
+    """
+    pool = get_process_pool()
+    started = time.monotonic()
+    try:
+        page_count = count_pages(file_path, mime_type)
+        pages_per_task = settings.INGESTION_PAGES_PER_TASK
+        if page_count is None or page_count <= pages_per_task:
+            return pool.submit(load_documents, file_path, mime_type).result()
+        futures = [
+            pool.submit(load_pages, file_path, mime_type, start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)
+        ]
+        try:
+            docs = [doc for future in futures for doc in future.result()]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(f"文档分片加载完成: {file_path}，页数: {page_count}，分片数: {len(futures)}，"
+                    f"耗时: {elapsed:.2f}s，速度: {page_count / elapsed:.1f} 页/秒")
+        return docs
+    except BrokenProcessPool:
+        logger.error("文档解析子进程异常退出（可能超出内存上限），重建进程池")
+        _reset_broken_pool(pool)
+        raise
+
+
+def load_and_split_in_pool(file_path: str, mime_type: str) -> List[str]:
+    """
+    在进程池中加载文档并切分
+    :param file_path:
+    :param mime_type:
+    :return: 文本块列表
+    """
+    return split_documents(load_documents_in_pool(file_path, mime_type))
+
+
+def iter_file_chunks(file_path: str, mime_type: str) -> Iterator[str]:
+    """
+    获取文件的文本块，JSON/CSV流式生成（必须在文件被删除前消费完），其他类型在进程池中加载切分
+    :param file_path:
+    :param mime_type:
+    :return:
+    """
+    if is_streaming_mime_type(mime_type):
+        return iter_split_chunks(file_path, mime_type)
+    return iter(load_and_split_in_pool(file_path, mime_type))
+
+
+def shutdown_process_pool():
+    """
+    关闭进程池
+    :return:
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True, cancel_futures=True)
+            _process_pool = None
+
+
+class IngestionPipeline:
+    """
+    文本块 -> 向量 -> Milvus 的流式流水线
+    """
+
+    def __init__(
+            self,
+            embedding_client: BatchEmbeddingClient,
+            insert_buffer: MilvusInsertBuffer,
+            max_inflight: int = settings.EMBEDDING_MAX_INFLIGHT,
+    ):
+        """
+        :param embedding_client: 批量embedding客户端
+        :param insert_buffer: Milvus写入缓冲区
+        :param max_inflight: 单个文件同时在途的向量化批次上限
+        """
+        self.embedding_client = embedding_client
+        self.insert_buffer = insert_buffer
+        self.max_inflight = max_inflight
+        # 所有文件共享的向量化线程池
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight * 2, thread_name_prefix="embedding")
+
+    def run(self, file_id: int, knowledge_base_id: Optional[int], chunks: Iterable[str]) -> int:
+        """
+        对一个文件的文本块执行向量化并写入Milvus，chunks可以是惰性生成器
+        :param file_id: 文件ID
+        :param knowledge_base_id: 知识库ID
+        :param chunks: 清洗后的文本块
+        :return: 成功写入的向量数量
+        """
+        started = time.monotonic()
+        inflight = threading.BoundedSemaphore(self.max_inflight)
+        pending: List[Future] = []
+        chunk_count = 0
+        iterator = iter(chunks)
+        try:
+            while True:
+                batch = list(islice(iterator, self.embedding_client.batch_size))
+                if not batch:
+                    break
+                chunk_count += len(batch)
+                # 在途批次达到上限时阻塞，控制内存和对embedding接口的并发
+                inflight.acquire()
+                future = self._executor.submit(self._embed_and_insert, file_id, knowledge_base_id, batch)
+                future.add_done_callback(lambda _: inflight.release())
+                pending.append(future)
+            # 先等待全部批次向量化完成（拿到各批的写入Future），再统一等待写入，向量化线程不被写入阻塞
+            insert_futures = [future.result() for future in pending]
+            inserted = sum(len(future.result()) for future in insert_futures)
+        except Exception:
+            for future in pending:
+                future.cancel()
+            raise
+        if chunk_count > 0 and inserted == 0:
+            # 个别文本块失败时跳过即可，全部失败说明不是个别文本块的问题，让任务失败并重试，而不是写入0条向量后标记为成功
+            raise RuntimeError(f"文件 {file_id} 的 {chunk_count} 个文本块全部向量化失败")
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(f"文件 {file_id} 向量化完成，文本块: {chunk_count}，写入: {inserted}，"
+                    f"耗时: {elapsed:.2f}s，速度: {chunk_count / elapsed:.1f} 块/秒")
+        return inserted
+
+    def _embed_and_insert(self, file_id: int, knowledge_base_id: Optional[int], texts: List[str]) -> Future:
+        """
+        向量化一批文本并送入写入缓冲区，不等待写入完成
+        :return: 写入缓冲区返回的Future，结果为该批的主键列表
+        """
+        vectors = self.embedding_client.embed_batch(texts)
+        entities = [
+            {
+                "file_id": file_id,
+                "knowledge_base_id": knowledge_base_id,
+                "chunk_text": text,
+                "vector": vector,
+            }
+            for text, vector in zip(texts, vectors)
+            # 只有当向量非空时才插入
+            if vector
+        ]
+        # 整批为空时缓冲区返回已完成的空结果；鉴权、限流和服务端错误已由embed_batch抛出
+        return self.insert_buffer.add(entities)
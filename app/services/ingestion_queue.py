@@ -0,0 +1,333 @@
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List
+
+from app.core.config import settings
+from app.db.redis_config import redis_service
+
+"""
+基于Redis的持久化向量化任务队列
+
+任务以文件ID为唯一标识，同一文件同一时间只会存在一个任务（入队幂等）。
+数据结构：
+- ingestion:ready    ZSET  待执行任务，score = -优先级 * 1e13 + 入队毫秒时间戳（优先级高者先出，同优先级先进先出）
+- ingestion:delayed  ZSET  等待重试的任务，score = 可执行的毫秒时间戳
+- ingestion:leases   ZSET  执行中的任务，score = 租约到期的毫秒时间戳
+- ingestion:job:{id} HASH  任务详情（知识库、优先级、尝试次数、持有者、最后一次错误等）
+
+worker领取任务时获得租约，执行期间定期续约；worker崩溃后租约过期，任务由回收器重新放回队列。
+所有状态变更都通过Lua脚本原子执行，任意节点上的worker进程都可以消费同一个队列。
+"""
+logger = logging.getLogger(__name__)
+
+READY_KEY = "ingestion:ready"
+DELAYED_KEY = "ingestion:delayed"
+LEASES_KEY = "ingestion:leases"
+JOB_KEY_PREFIX = "ingestion:job:"
+REAPER_LOCK_KEY = "ingestion:reaper:lock"
+WEB_REFRESH_LOCK_KEY = "ingestion:web_refresh:lock"
+COMPACTION_LOCK_KEY = "ingestion:compaction:lock"
+
+_ENQUEUE_SCRIPT = """
+local job_id = ARGV[1]
+if redis.call('ZSCORE', KEYS[1], job_id) or redis.call('ZSCORE', KEYS[2], job_id) or redis.call('ZSCORE', KEYS[3], job_id) then
+    return 0
+end
+local job_key = ARGV[2] .. job_id
+redis.call('DEL', job_key)
+redis.call('HSET', job_key, 'score', ARGV[3], 'priority', ARGV[4], 'payload', ARGV[5], 'attempts', 0)
+redis.call('ZADD', KEYS[1], ARGV[3], job_id)
+return 1
+"""
+
+_PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, job_id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job_id)
+    local score = redis.call('HGET', ARGV[2] .. job_id, 'score')
+    redis.call('ZADD', KEYS[2], score or ARGV[1], job_id)
+end
+return #due
+"""
+
+_CLAIM_SCRIPT = """
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then
+    return false
+end
+local job_id = popped[1]
+local job_key = ARGV[4] .. job_id
+redis.call('ZADD', KEYS[2], tonumber(ARGV[1]) + tonumber(ARGV[2]), job_id)
+redis.call('HSET', job_key, 'worker', ARGV[3])
+local attempts = redis.call('HINCRBY', job_key, 'attempts', 1)
+return {job_id, attempts, redis.call('HGET', job_key, 'priority'), redis.call('HGET', job_key, 'payload')}
+"""
+
+_RENEW_SCRIPT = """
+if redis.call('HGET', ARGV[4] .. ARGV[1], 'worker') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+return 1
+"""
+
+_COMPLETE_SCRIPT = """
+local job_key = ARGV[3] .. ARGV[1]
+if redis.call('HGET', job_key, 'worker') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('DEL', job_key)
+return 1
+"""
+
+_RETRY_SCRIPT = """
+local job_key = ARGV[5] .. ARGV[1]
+if redis.call('HGET', job_key, 'worker') ~= ARGV[2] then
+    return -1
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+local attempts = tonumber(redis.call('HGET', job_key, 'attempts'))
+if attempts >= tonumber(ARGV[4]) then
+    redis.call('DEL', job_key)
+    return 0
+end
+redis.call('HDEL', job_key, 'worker')
+redis.call('HSET', job_key, 'last_error', ARGV[6])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return 1
+"""
+
+_REAP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+local requeued = {}
+local dead = {}
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], job_id)
+    local job_key = ARGV[3] .. job_id
+    local attempts = tonumber(redis.call('HGET', job_key, 'attempts') or '0')
+    if attempts >= tonumber(ARGV[2]) then
+        redis.call('DEL', job_key)
+        table.insert(dead, job_id)
+    else
+        redis.call('HDEL', job_key, 'worker')
+        redis.call('HSET', job_key, 'last_error', 'lease expired')
+        redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+        table.insert(requeued, job_id)
+    end
+end
+return {requeued, dead}
+"""
+
+
+@dataclass
+class IngestionJob:
+    """
+    一个已被领取的向量化任务
+    """
+    file_id: int
+    attempts: int
+    priority: int
+    worker_id: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class IngestionQueue:
+    """
+    向量化任务队列
+    """
+
+    def __init__(self):
+        self._client = None
+        self._scripts = {}
+
+    @property
+    def client(self):
+        """
+        懒加载同步Redis客户端并注册Lua脚本
+        :return:
+        """
+        if self._client is None:
+            self._client = redis_service.get_sync_client()
+            for name, script in {
+                "enqueue": _ENQUEUE_SCRIPT,
+                "promote": _PROMOTE_SCRIPT,
+                "claim": _CLAIM_SCRIPT,
+                "renew": _RENEW_SCRIPT,
+                "complete": _COMPLETE_SCRIPT,
+                "retry": _RETRY_SCRIPT,
+                "reap": _REAP_SCRIPT,
+            }.items():
+                self._scripts[name] = self._client.register_script(script)
+        return self._client
+
+    def _script(self, name: str):
+        _ = self.client
+        return self._scripts[name]
+
+    @staticmethod
+    def priority_for(knowledge_base_id: Optional[int]) -> int:
+        """
+        根据知识库获取任务优先级，未配置的知识库优先级为0
+        :param knowledge_base_id:
+        :return:
+        """
+        if knowledge_base_id is None:
+            return 0
+        return settings.INGESTION_KB_PRIORITIES.get(knowledge_base_id, 0)
+
+    def enqueue(self, file_id: int, knowledge_base_id: Optional[int] = None, priority: Optional[int] = None, **payload) -> bool:
+        """
+        向量化任务入队，同一文件已在队列中/执行中时不会重复入队
+        :param file_id: 文件ID
+        :param knowledge_base_id: 知识库ID，用于确定优先级
+        :param priority: 显式指定优先级，覆盖知识库配置
+        :param payload: 任务附加参数
+        :return: 是否新入队
+        """
+        if priority is None:
+            priority = self.priority_for(knowledge_base_id)
+        score = -priority * 10 ** 13 + _now_ms()
+        created = self._script("enqueue")(
+            keys=[READY_KEY, LEASES_KEY, DELAYED_KEY],
+            args=[file_id, JOB_KEY_PREFIX, score, priority, json.dumps(payload)],
+        )
+        if created:
+            logger.info(f"向量化任务入队，文件ID: {file_id}，优先级: {priority}")
+        else:
+            logger.info(f"向量化任务已存在，跳过入队，文件ID: {file_id}")
+        return bool(created)
+
+    def claim(self, worker_id: str) -> Optional[IngestionJob]:
+        """
+        领取一个任务并获得租约，先把到期的重试任务放回待执行队列
+        :param worker_id: worker标识
+        :return: 没有任务时返回None
+        """
+        now = _now_ms()
+        self._script("promote")(keys=[DELAYED_KEY, READY_KEY], args=[now, JOB_KEY_PREFIX])
+        result = self._script("claim")(
+            keys=[READY_KEY, LEASES_KEY],
+            args=[now, settings.INGESTION_LEASE_SECONDS * 1000, worker_id, JOB_KEY_PREFIX],
+        )
+        if not result:
+            return None
+        job_id, attempts, priority, payload = result
+        return IngestionJob(
+            file_id=int(job_id),
+            attempts=int(attempts),
+            priority=int(priority or 0),
+            worker_id=worker_id,
+            payload=json.loads(payload) if payload else {},
+        )
+
+    def renew(self, job: IngestionJob) -> bool:
+        """
+        续约，返回False表示租约已丢失（已被回收给其他worker）
+        :param job:
+        :return:
+        """
+        expires_at = _now_ms() + settings.INGESTION_LEASE_SECONDS * 1000
+        return bool(self._script("renew")(keys=[LEASES_KEY], args=[job.file_id, job.worker_id, expires_at, JOB_KEY_PREFIX]))
+
+    def complete(self, job: IngestionJob) -> bool:
+        """
+        标记任务完成并删除
+        :param job:
+        :return:
+        """
+        return bool(self._script("complete")(keys=[LEASES_KEY], args=[job.file_id, job.worker_id, JOB_KEY_PREFIX]))
+
+    def retry(self, job: IngestionJob, error: str) -> bool:
+        """
+        任务失败，按指数退避重新调度；达到最大尝试次数后丢弃
+        :param job:
+        :param error: 错误信息
+        :return: 是否还会重试
+        """
+        backoff = min(settings.INGESTION_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1), settings.INGESTION_RETRY_BACKOFF_MAX_SECONDS)
+        # 加入随机抖动，避免大量任务同时重试
+        available_at = _now_ms() + int(backoff * 1000 * random.uniform(0.8, 1.2))
+        result = self._script("retry")(
+            keys=[LEASES_KEY, DELAYED_KEY],
+            args=[job.file_id, job.worker_id, available_at, settings.INGESTION_MAX_ATTEMPTS, JOB_KEY_PREFIX, error[:1000]],
+        )
+        if result == 1:
+            logger.warning(f"向量化任务失败，{backoff:.0f}秒后进行第{job.attempts + 1}次尝试，文件ID: {job.file_id}")
+            return True
+        if result == 0:
+            logger.error(f"向量化任务已达到最大尝试次数{settings.INGESTION_MAX_ATTEMPTS}，放弃，文件ID: {job.file_id}")
+        return False
+
+    def reap_expired_leases(self) -> List[int]:
+        """
+        回收租约过期的任务（worker崩溃或卡死），重新放回队列
+        :return: 已达到最大尝试次数而被丢弃的文件ID列表
+        """
+        requeued, dead = self._script("reap")(
+            keys=[LEASES_KEY, DELAYED_KEY],
+            args=[_now_ms(), settings.INGESTION_MAX_ATTEMPTS, JOB_KEY_PREFIX],
+        )
+        if requeued:
+            logger.warning(f"回收了{len(requeued)}个租约过期的任务: {requeued}")
+        return [int(job_id) for job_id in dead]
+
+    def contains(self, file_id: int) -> bool:
+        """
+        文件是否已在队列中（待执行/等待重试/执行中）
+        :param file_id:
+        :return:
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for key in (READY_KEY, DELAYED_KEY, LEASES_KEY):
+            pipe.zscore(key, file_id)
+        return any(score is not None for score in pipe.execute())
+
+    def acquire_reaper_lock(self, worker_id: str, ttl_seconds: int) -> bool:
+        """
+        获取回收器锁，保证同一时间只有一个节点执行数据库回收
+        :param worker_id:
+        :param ttl_seconds:
+        :return:
+        """
+        return bool(self.client.set(REAPER_LOCK_KEY, worker_id, nx=True, ex=ttl_seconds))
+
+    def acquire_web_refresh_lock(self, worker_id: str, ttl_seconds: int) -> bool:
+        """
+        获取网页刷新锁，保证同一时间只有一个节点刷新网页
+        :param worker_id:
+        :param ttl_seconds:
+        :return:
+        """
+        return bool(self.client.set(WEB_REFRESH_LOCK_KEY, worker_id, nx=True, ex=ttl_seconds))
+
+    def acquire_compaction_lock(self, worker_id: str, ttl_seconds: int) -> bool:
+        """
+        获取compaction检查锁，保证同一时间只有一个节点检查和触发compaction
+        :param worker_id:
+        :param ttl_seconds:
+        :return:
+        """
+        return bool(self.client.set(COMPACTION_LOCK_KEY, worker_id, nx=True, ex=ttl_seconds))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        队列统计
+        :return:
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for key in (READY_KEY, DELAYED_KEY, LEASES_KEY):
+            pipe.zcard(key)
+        ready, delayed, running = pipe.execute()
+        return {"ready": ready, "delayed": delayed, "running": running}
+
+
+# 创建一个全局的任务队列实例
+ingestion_queue = IngestionQueue()
@@ -1,14 +1,18 @@
 import logging
 from typing import Optional, List, Dict, Any
+from sqlalchemy import update
 from sqlmodel import Session, select
 import threading
 
 from app.core.constants import FileStatus
+from app.models.base import get_utc_now
 from app.models.knowledge import KnowledgeFile
-from app.services.minio_service import minio_service
+from app.services.minio_service import minio_service, MAX_MULTIPART_PARTS
 from app.core.config import settings
 from app.core.exceptions import ApiException
-from app.services.vectorization_service import vectorize_file
+from app.services.ingestion_queue import ingestion_queue
+from app.services.vector_store import get_vector_store
+from app.services.vectorization_service import vectorize_file, clone_file
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +35,18 @@ class KnowledgeService:
         处理文件上传请求，根据是否分片返回不同的凭证，并存储完整文件信息。
         如果检测到相同的文件哈希值，则直接复用现有文件，不进行上传。
         """
+        # 在创建数据库记录和MinIO分片上传任务之前校验分片数量，避免被拒绝的请求留下孤立的上传任务
+        if multipart and not 1 <= part_count <= MAX_MULTIPART_PARTS:
+            raise ApiException(f"分片数量必须在1到{MAX_MULTIPART_PARTS}之间")
         # 1. 如果提供了文件哈希值，则检查是否存在重复文件
         if file_hash:
-            existing_file = session.exec(select(KnowledgeFile).where(KnowledgeFile.file_hash == file_hash)).first()
+            # 只复用已经向量化完成且未删除的文件：其他状态的文件可能只有部分向量，或对象从未上传完成。
+            # 没有可复用的文件时走正常上传，未变化的文本块仍可命中向量缓存
+            existing_file = session.exec(select(KnowledgeFile).where(
+                KnowledgeFile.file_hash == file_hash,
+                KnowledgeFile.status == FileStatus.VECTORIZED,
+                KnowledgeFile.is_deleted == False
+            )).first()
             if existing_file:
                 logger.info(f"Duplicate file hash detected: {file_hash}. Reusing existing file.")
                 # 创建一个新的数据库记录，但复用已有的物理文件路径
@@ -50,11 +63,13 @@ class KnowledgeService:
                     upload_id=None  # 没有上传过程
                 )
                 session.add(db_file)
-                session.flush()
+                session.commit()
+                session.refresh(db_file)
 
                 logger.info(f"New record {db_file.id} created for existing file. Path: {db_file.file_path}")
-                # TODO: 在这里触发向量化后台任务
-                
+                # 在Milvus服务端复制已有文件的向量，无需重新向量化
+                self._schedule_vectorization(db_file, source_file_id=existing_file.id)
+
                 return {
                     "file_id": db_file.id,
                     "duplicate": True,
@@ -91,26 +106,27 @@ class KnowledgeService:
                 raise ApiException("无法在MinIO中创建分片上传任务")
 
             db_file.upload_id = upload_id  # 存储upload_id
+            db_file.part_count = part_count  # 分页获取上传URL时以此为上限
             db_file.status = "uploading"  # 更新状态为待上传
             session.add(db_file)
 
-            presigned_urls = []
-            for i in range(1, part_count + 1):
-                url = minio_service.generate_presigned_upload_url(
-                    bucket_name=settings.MINIO_DEFAULT_BUCKET,
-                    object_name=object_name
-                )
-                if url:
-                    presigned_urls.append({"part_number": i, "url": url})
-
-            if len(presigned_urls) != part_count:
-                raise ApiException("生成部分分片的上传URL失败")
+            # 只返回第一页分片的上传URL，其余分片由客户端通过 get_part_upload_urls 按需获取
+            presigned_urls = minio_service.generate_presigned_part_urls(
+                bucket_name=settings.MINIO_DEFAULT_BUCKET,
+                object_name=object_name,
+                upload_id=upload_id,
+                start_part_number=1,
+                count=min(part_count, settings.MINIO_PART_URL_PAGE_SIZE)
+            )
+            next_part_number = len(presigned_urls) + 1
 
             return {
                 "file_id": file_id,
                 "multipart": True,
                 "upload_id": upload_id,
-                "presigned_urls": presigned_urls
+                "part_count": part_count,
+                "presigned_urls": presigned_urls,
+                "next_part_number": next_part_number if next_part_number <= part_count else None
             }
         else:
             # --- 普通单文件上传逻辑 ---
@@ -131,6 +147,43 @@ class KnowledgeService:
                 "presigned_url": presigned_url
             }
 
+    def get_part_upload_urls(
+        self,
+        session: Session,
+        file_id: int,
+        start_part_number: int,
+        count: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        分页获取分片上传的预签名URL，客户端可以一边上传一边获取下一页
+        """
+        db_file = session.get(KnowledgeFile, file_id)
+        if not db_file:
+            raise ApiException(f"文件记录不存在: {file_id}")
+        if not db_file.upload_id or db_file.status != FileStatus.UPLOADING:
+            raise ApiException(f"文件 {file_id} 不是进行中的分片上传任务")
+        # 旧记录没有保存分片数时退化为分片数上限
+        part_count = db_file.part_count or MAX_MULTIPART_PARTS
+        if start_part_number < 1 or start_part_number > part_count:
+            raise ApiException(f"分片序号必须在1到{part_count}之间")
+
+        count = min(count or settings.MINIO_PART_URL_PAGE_SIZE, settings.MINIO_PART_URL_PAGE_SIZE,
+                    part_count - start_part_number + 1)
+        presigned_urls = minio_service.generate_presigned_part_urls(
+            bucket_name=settings.MINIO_DEFAULT_BUCKET,
+            object_name=db_file.file_path,
+            upload_id=db_file.upload_id,
+            start_part_number=start_part_number,
+            count=count
+        )
+        next_part_number = start_part_number + len(presigned_urls)
+        return {
+            "file_id": file_id,
+            "upload_id": db_file.upload_id,
+            "presigned_urls": presigned_urls,
+            "next_part_number": next_part_number if next_part_number <= part_count else None
+        }
+
     def finalize_upload(self, session: Session, file_id: int) -> KnowledgeFile:
         """
         验证并确认文件上传完成（支持分片和非分片），成功后更新数据库状态。
@@ -189,18 +242,76 @@ class KnowledgeService:
         # 3. 统一更新数据库状态为'completed'，并准备触发后续任务
         db_file.status = FileStatus.COMPLETED
         session.add(db_file)
+        # 先提交状态，避免worker更新的状态被本次请求结束时的提交覆盖
+        session.commit()
+        session.refresh(db_file)
 
         #  在这里触发向量化后台任务
-        vectorization_thread = threading.Thread(
-            target=vectorize_file,
-            args=(file_id,)
-        )
-        # 启动线程
-        vectorization_thread.start()
-        # vectorize_file(file_id)
+        self._schedule_vectorization(db_file)
         logger.info(f"文件 {file_id} 已成功上传并确认，状态更新为completed。")
 
         return db_file
 
+    def delete_files(
+        self,
+        session: Session,
+        file_ids: Optional[List[int]] = None,
+        knowledge_base_id: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        批量删除知识库文件：先批量删除向量（按批的in表达式，只flush一次），再批量逻辑删除文件记录。
+        只指定知识库ID时删除整个知识库；同时指定时只删除该知识库中的指定文件。
+        向量删除失败时不修改文件记录，可以重试。
+        """
+        if not file_ids and knowledge_base_id is None:
+            raise ApiException("请指定要删除的文件ID或知识库ID")
+        statement = select(KnowledgeFile.id).where(KnowledgeFile.is_deleted == False)
+        if knowledge_base_id is not None:
+            statement = statement.where(KnowledgeFile.knowledge_base_id == knowledge_base_id)
+        if file_ids:
+            statement = statement.where(KnowledgeFile.id.in_(file_ids))
+        ids = list(session.exec(statement).all())
+
+        try:
+            if file_ids:
+                deleted_vectors = get_vector_store().delete_files(ids)
+            else:
+                # 整个知识库按knowledge_base_id删除，同时清理没有文件记录的数据
+                deleted_vectors = get_vector_store().delete_knowledge_base(knowledge_base_id)
+        except Exception as e:
+            logger.error(f"批量删除向量失败，知识库ID: {knowledge_base_id}，文件数: {len(ids)}，错误信息: {e}")
+            raise ApiException("删除向量数据失败")
+
+        now = get_utc_now()
+        batch_size = settings.MILVUS_DELETE_BATCH_SIZE
+        for start in range(0, len(ids), batch_size):
+            session.execute(
+                update(KnowledgeFile)
+                .where(KnowledgeFile.id.in_(ids[start:start + batch_size]))
+                .values(is_deleted=True, updated_at=now)
+            )
+        session.commit()
+        logger.info(f"批量删除完成，知识库ID: {knowledge_base_id}，文件数: {len(ids)}，向量数: {deleted_vectors}")
+        return {"deleted_files": len(ids), "deleted_vectors": deleted_vectors}
+
+    @staticmethod
+    def _schedule_vectorization(db_file: KnowledgeFile, source_file_id: Optional[int] = None):
+        """
+        把文件加入向量化任务队列，由worker进程执行
+        队列不可用时退化为在当前进程中启动线程执行
+        :param db_file:
+        :param source_file_id: 内容相同的已有文件ID，指定时复制其向量而不是重新向量化
+        :return:
+        """
+        payload = {"source_file_id": source_file_id} if source_file_id else {}
+        try:
+            ingestion_queue.enqueue(db_file.id, db_file.knowledge_base_id, **payload)
+        except Exception as e:
+            logger.error(f"向量化任务入队失败，改为在当前进程中执行，文件ID: {db_file.id}，错误信息: {e}")
+            if source_file_id:
+                threading.Thread(target=clone_file, args=(db_file.id, source_file_id)).start()
+            else:
+                threading.Thread(target=vectorize_file, args=(db_file.id,)).start()
+
 # 创建一个全局KnowledgeService实例
 knowledge_service = KnowledgeService()
@@ -0,0 +1,520 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.vector_codec import VectorStorageType
+from app.services.vector_store import VectorStore
+
+"""
+本地向量库（VECTOR_STORE_BACKEND=local）
+
+进程内的NumPy向量库，不依赖外部服务，适合小规模部署和离线测试：
+- 数据按segment保存在 LOCAL_VECTOR_STORE_PATH 下，每个segment一个目录，各列一个.npy文件，
+  文本为UTF-8拼接的texts.bin加偏移量；segment写入后只读，读取时全部以mmap方式映射，启动只需读取state.json
+- 每次写入生成一个新segment（写入临时目录后改名，state.json原子替换），segment数量超过上限时按行数分层，
+  合并最低的、有多个segment的层，大segment不会为了容纳新写入的小segment而被重写
+- 删除只记录被删除的ID（deleted.npy），compaction时重写包含已删除记录的segment
+- 检索按L2距离精确计算；LOCAL_VECTOR_INDEX=ivf 时，行数足够的segment在写入时用k-means聚类并按簇排序，
+  检索只扫描距离查询向量最近的 LOCAL_VECTOR_IVF_NPROBE 个簇
+- 多进程共享（API进程和独立的向量化worker）：写入、删除、合并、compaction持有目录下 .lock 文件的排他锁，
+  开始前先重新加载最新状态；读取前检查state.json/deleted.npy是否被其他进程修改，有变化时在共享锁下重新加载，
+  已映射的segment直接复用。目录需位于本机文件系统（flock在NFS等网络文件系统上不可靠）
+"""
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "state.json"
+DELETED_FILE = "deleted.npy"
+LOCK_FILE = ".lock"
+# 每个簇至少需要的训练样本数，行数不足 nlist * 该值 的segment不建立IVF
+_MIN_POINTS_PER_CENTROID = 39
+# segment合并的分层倍数：行数小于merge_rows的为第0层，之后每层的行数上限是上一层的该倍数
+_MERGE_FANOUT = 4
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_rows: int = 8192) -> np.ndarray:
+    """
+    把向量分配到最近的聚类中心
+    :return: 每个向量的簇序号
+    """
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_rows):
+        block = np.asarray(vectors[start:start + chunk_rows], dtype=np.float32)
+        assignments[start:start + len(block)] = (centroid_norms - 2 * block @ centroids.T).argmin(axis=1)
+    return assignments
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, sample_size: int = 20000, seed: int = 0) -> np.ndarray:
+    """
+    在抽样数据上训练k-means聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=k)
+        # 空簇保留原来的中心
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class _Segment:
+    """
+    磁盘上的一个只读segment，各列以mmap方式读取
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.ids = self._load("ids")
+        self.file_ids = self._load("file_ids")
+        self.knowledge_base_ids = self._load("knowledge_base_ids")
+        self.vectors = self._load("vectors")
+        self.norms = self._load("norms")
+        self.text_offsets = self._load("text_offsets")
+        texts_path = os.path.join(path, "texts.bin")
+        self.texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else np.zeros(0, np.uint8)
+        self.centroids = self._load("centroids") if os.path.exists(os.path.join(path, "centroids.npy")) else None
+        self.list_offsets = self._load("list_offsets") if self.centroids is not None else None
+
+    def _load(self, column: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{column}.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text(self, row: int) -> str:
+        return bytes(self.texts[self.text_offsets[row]:self.text_offsets[row + 1]]).decode("utf-8")
+
+    def candidate_rows(self, query: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        """
+        IVF：距离查询向量最近的nprobe个簇中的行
+        :return: 行号，没有IVF时返回None表示全部行
+        """
+        if self.centroids is None:
+            return None
+        probes = np.argsort((self.centroids * self.centroids).sum(axis=1) - 2 * self.centroids @ query)[:nprobe]
+        return np.concatenate([np.arange(self.list_offsets[probe], self.list_offsets[probe + 1]) for probe in probes])
+
+
+class LocalVectorStore(VectorStore):
+    """
+    基于NumPy和mmap的本地向量库
+    """
+    storage_type = VectorStorageType.FLOAT
+    external_text = False
+    text_field = "chunk_text"
+
+    def __init__(
+            self,
+            path: str,
+            index_type: str = settings.LOCAL_VECTOR_INDEX,
+            nlist: int = settings.LOCAL_VECTOR_IVF_NLIST,
+            nprobe: int = settings.LOCAL_VECTOR_IVF_NPROBE,
+            max_segments: int = settings.LOCAL_VECTOR_MAX_SEGMENTS,
+            merge_rows: int = settings.LOCAL_VECTOR_MERGE_ROWS,
+    ):
+        """
+        :param path: 数据目录
+        :param index_type: flat（精确检索）/ ivf
+        :param nlist: IVF的簇数量
+        :param nprobe: IVF检索时扫描的簇数量
+        :param max_segments: segment数量上限，超过后合并小segment
+        :param merge_rows: 行数小于该值的segment为最低层（小segment），也是分层合并的基准
+        """
+        if index_type not in ("flat", "ivf"):
+            raise ValueError(f"不支持的本地向量索引类型: {index_type}")
+        self.path = path
+        self.collection_name = path
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.max_segments = max_segments
+        self.merge_rows = merge_rows
+        self._lock = threading.RLock()
+        # 当前线程持有文件锁的嵌套深度，持有锁期间再次加锁直接放行
+        self._lock_depth = 0
+        self._loaded_signature = None
+        self._segments: List[_Segment] = []
+        os.makedirs(path, exist_ok=True)
+        started = time.monotonic()
+        with self._write():
+            # 排他锁下没有其他进程在写入，不在状态中的目录都是写入或合并中断时的残留
+            live = {segment.name for segment in self._segments}
+            for name in os.listdir(self.path):
+                full_path = os.path.join(self.path, name)
+                if os.path.isdir(full_path) and name not in live:
+                    shutil.rmtree(full_path, ignore_errors=True)
+        logger.info(f"本地向量库已加载: {self.path}，segment: {len(self._segments)}，"
+                    f"记录: {sum(len(segment) for segment in self._segments)}，耗时: {(time.monotonic() - started) * 1000:.1f}ms")
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """
+        进程间的文件锁（flock），同一实例内可重入
+        :param exclusive: 排他锁（写入）或共享锁（重新加载状态）
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(os.path.join(self.path, LOCK_FILE), "a+") as file:
+                fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write(self):
+        """
+        写操作：持有排他锁，并在修改前加载其他进程写入的最新状态
+        """
+        with self._file_lock(exclusive=True):
+            self._refresh()
+            yield
+
+    def _signature(self) -> tuple:
+        """
+        state.json和deleted.npy的(inode, 修改时间, 大小)，两者都以原子替换的方式写入，任一变化都会改变签名
+        """
+        signature = []
+        for name in (STATE_FILE, DELETED_FILE):
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _refresh(self):
+        """
+        其他进程修改了状态时重新加载
+        """
+        if self._signature() == self._loaded_signature:
+            return
+        with self._file_lock(exclusive=False):
+            self._load()
+
+    def _load(self):
+        """
+        读取state.json和deleted.npy，调用方需持有文件锁；未变化的segment复用已有的映射
+        """
+        signature = self._signature()
+        state_path = os.path.join(self.path, STATE_FILE)
+        state = {"dim": None, "next_id": 1, "segments": []}
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        loaded = {segment.name: segment for segment in self._segments}
+        self.dim: Optional[int] = state["dim"]
+        self._next_id: int = state["next_id"]
+        self._segments = [loaded.get(name) or _Segment(os.path.join(self.path, name)) for name in state["segments"]]
+        deleted_path = os.path.join(self.path, DELETED_FILE)
+        self._deleted_ids = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(0, dtype=np.int64)
+        self._loaded_signature = signature
+
+    def _save_state(self):
+        temp_path = os.path.join(self.path, f".{STATE_FILE}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({
+                "dim": self.dim,
+                "next_id": self._next_id,
+                "segments": [segment.name for segment in self._segments],
+            }, file)
+        os.replace(temp_path, os.path.join(self.path, STATE_FILE))
+
+    def _save_deleted(self):
+        temp_path = os.path.join(self.path, ".deleted.tmp.npy")
+        np.save(temp_path, self._deleted_ids)
+        os.replace(temp_path, os.path.join(self.path, DELETED_FILE))
+
+    def _write_segment(self, ids: np.ndarray, file_ids: np.ndarray, knowledge_base_ids: np.ndarray,
+                       texts: List[str], vectors: np.ndarray) -> _Segment:
+        """
+        写入一个新segment：先写临时目录，完成后改名
+        """
+        name = f"seg_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        temp_dir = os.path.join(self.path, f".{name}.tmp")
+        os.makedirs(temp_dir)
+        columns = {}
+        if self.index_type == "ivf" and len(vectors) >= self.nlist * _MIN_POINTS_PER_CENTROID:
+            centroids = _kmeans(vectors, self.nlist)
+            assignments = _assign(vectors, centroids)
+            order = np.argsort(assignments, kind="stable")
+            ids, file_ids, knowledge_base_ids, vectors = ids[order], file_ids[order], knowledge_base_ids[order], vectors[order]
+            texts = [texts[i] for i in order]
+            columns["centroids"] = centroids
+            columns["list_offsets"] = np.searchsorted(assignments[order], np.arange(self.nlist + 1)).astype(np.int64)
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+        columns.update({
+            "ids": ids,
+            "file_ids": file_ids,
+            "knowledge_base_ids": knowledge_base_ids,
+            "vectors": vectors,
+            "norms": (vectors * vectors).sum(axis=1),
+            "text_offsets": offsets,
+        })
+        for column, values in columns.items():
+            np.save(os.path.join(temp_dir, f"{column}.npy"), values, allow_pickle=False)
+        with open(os.path.join(temp_dir, "texts.bin"), "wb") as file:
+            file.write(b"".join(encoded))
+        final_dir = os.path.join(self.path, name)
+        os.rename(temp_dir, final_dir)
+        return _Segment(final_dir)
+
+    async def insert(self, entities: List[Dict[str, Any]]) -> List[int]:
+        if not entities:
+            return []
+        return self.insert_columns([
+            [entity["file_id"] for entity in entities],
+            [entity["knowledge_base_id"] for entity in entities],
+            [entity["chunk_text"] for entity in entities],
+            [entity["vector"] for entity in entities],
+        ])
+
+    def insert_columns(self, columns: List[List[Any]]) -> List[int]:
+        """
+        每次写入生成一个segment，写入即持久化
+        """
+        if not columns or not columns[0]:
+            return []
+        vectors = np.asarray(columns[3], dtype=np.float32)
+        rows = len(vectors)
+        with self._write():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与本地向量库的维度 {self.dim} 不一致")
+            ids = np.arange(self._next_id, self._next_id + rows, dtype=np.int64)
+            segment = self._write_segment(
+                ids,
+                np.asarray(columns[0], dtype=np.int64),
+                np.asarray(columns[1], dtype=np.int64),
+                list(columns[2]),
+                vectors,
+            )
+            self._next_id += rows
+            self._segments.append(segment)
+            self._save_state()
+            if len(self._segments) > self.max_segments:
+                self._merge_segments()
+            self._loaded_signature = self._signature()
+        logger.info(f"成功向本地向量库插入{rows}条数据")
+        return ids.tolist()
+
+    def flush(self):
+        """
+        写入和删除都已即时持久化，无需操作
+        """
+
+    async def search(self, query_vector: List[float], top_k: int = 5,
+                     knowledge_base_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        query_norm = float(query @ query)
+        self._refresh()
+        with self._lock:
+            segments = list(self._segments)
+            deleted_ids = self._deleted_ids
+        candidates = []
+        for segment in segments:
+            rows = segment.candidate_rows(query, self.nprobe)
+            if rows is None:
+                vectors, norms, ids = segment.vectors, segment.norms, segment.ids
+                knowledge_base_ids = segment.knowledge_base_ids
+            else:
+                vectors, norms, ids = segment.vectors[rows], segment.norms[rows], segment.ids[rows]
+                knowledge_base_ids = segment.knowledge_base_ids[rows]
+            if len(ids) == 0:
+                continue
+            # 与Milvus的L2一致，返回距离的平方
+            distances = norms - 2 * (vectors @ query) + query_norm
+            excluded = np.isin(ids, deleted_ids)
+            if knowledge_base_id:
+                excluded |= knowledge_base_ids != knowledge_base_id
+            distances = np.where(excluded, np.inf, distances)
+            k = min(top_k, len(distances))
+            for index in np.argpartition(distances, k - 1)[:k]:
+                if np.isfinite(distances[index]):
+                    row = int(index if rows is None else rows[index])
+                    candidates.append((float(distances[index]), segment, row))
+        candidates.sort(key=lambda candidate: candidate[0])
+        return [
+            {
+                "id": int(segment.ids[row]),
+                "distance": distance,
+                "file_id": int(segment.file_ids[row]),
+                "knowledge_base_id": int(segment.knowledge_base_ids[row]),
+                "chunk_text": segment.text(row),
+            }
+            for distance, segment, row in candidates[:top_k]
+        ]
+
+    def _live_rows(self, segment: _Segment, mask: np.ndarray) -> np.ndarray:
+        """
+        满足条件且未被删除的行号
+        """
+        rows = np.flatnonzero(mask)
+        return rows[~np.isin(segment.ids[rows], self._deleted_ids)]
+
+    def clone_file_vectors(self, source_file_id: int, target_file_id: int, target_knowledge_base_id: Optional[int],
+                           batch_size: int = 1000) -> int:
+        with self._write():
+            texts, vectors = [], []
+            for segment in self._segments:
+                rows = self._live_rows(segment, segment.file_ids == source_file_id)
+                texts.extend(segment.text(row) for row in rows)
+                vectors.append(np.asarray(segment.vectors[rows]))
+            if not texts:
+                return 0
+            self.insert_columns([
+                [target_file_id] * len(texts),
+                [target_knowledge_base_id] * len(texts),
+                texts,
+                np.vstack(vectors),
+            ])
+        logger.info(f"从File ID {source_file_id} 复制了 {len(texts)} 条向量到File ID {target_file_id}")
+        return len(texts)
+
+    def _mark_deleted(self, predicate: Callable[[_Segment], np.ndarray]) -> int:
+        """
+        把满足条件的记录标记为已删除并持久化
+        :param predicate: segment -> 行的布尔掩码
+        :return: 新删除的记录数量
+        """
+        with self._write():
+            matched = [segment.ids[self._live_rows(segment, predicate(segment))] for segment in self._segments]
+            new_ids = np.concatenate(matched) if matched else np.zeros(0, dtype=np.int64)
+            if len(new_ids):
+                self._deleted_ids = np.union1d(self._deleted_ids, new_ids)
+                self._save_deleted()
+                self._loaded_signature = self._signature()
+        return len(new_ids)
+
+    def delete_file_vectors(self, file_id: int) -> int:
+        deleted = self._mark_deleted(lambda segment: segment.file_ids == file_id)
+        if deleted:
+            logger.info(f"重新向量化前删除了File ID {file_id} 的 {deleted} 条旧记录")
+        return deleted
+
+    def delete_files(self, file_ids: List[int], batch_size: int = settings.MILVUS_DELETE_BATCH_SIZE) -> int:
+        file_ids = np.asarray(sorted(set(file_ids)), dtype=np.int64)
+        if not len(file_ids):
+            return 0
+        deleted = self._mark_deleted(lambda segment: np.isin(segment.file_ids, file_ids))
+        logger.info(f"从本地向量库中批量删除了 {len(file_ids)} 个文件的 {deleted} 条记录")
+        return deleted
+
+    def delete_knowledge_base(self, knowledge_base_id: int) -> int:
+        deleted = self._mark_deleted(lambda segment: segment.knowledge_base_ids == knowledge_base_id)
+        logger.info(f"从本地向量库中删除了知识库 {knowledge_base_id} 的 {deleted} 条记录")
+        return deleted
+
+    def deletion_stats(self) -> Dict[str, Any]:
+        self._refresh()
+        with self._lock:
+            total = sum(len(segment) for segment in self._segments)
+            deleted = len(self._deleted_ids)
+        return {
+            "collection": self.collection_name,
+            "total": total,
+            "live": total - deleted,
+            "deleted": deleted,
+            "deleted_ratio": deleted / total if total else 0.0,
+        }
+
+    def _rewrite(self, segments: List[_Segment]):
+        """
+        把若干segment中未删除的记录合并写入一个新segment，替换原segment
+        """
+        ids, file_ids, knowledge_base_ids, texts, vectors = [], [], [], [], []
+        for segment in segments:
+            rows = self._live_rows(segment, np.ones(len(segment), dtype=bool))
+            ids.append(segment.ids[rows])
+            file_ids.append(segment.file_ids[rows])
+            knowledge_base_ids.append(segment.knowledge_base_ids[rows])
+            texts.extend(segment.text(row) for row in rows)
+            vectors.append(np.asarray(segment.vectors[rows]))
+        merged = []
+        if texts:
+            merged.append(self._write_segment(np.concatenate(ids), np.concatenate(file_ids),
+                                              np.concatenate(knowledge_base_ids), texts, np.vstack(vectors)))
+        replaced = {segment.name for segment in segments}
+        self._segments = [segment for segment in self._segments if segment.name not in replaced] + merged
+        self._save_state()
+        # 被合并的segment中的删除记录已清理，不再需要保留其ID
+        removed_ids = np.concatenate([segment.ids for segment in segments])
+        self._deleted_ids = np.setdiff1d(self._deleted_ids, removed_ids)
+        self._save_deleted()
+        for segment in segments:
+            shutil.rmtree(segment.path, ignore_errors=True)
+
+    def _tier(self, rows: int) -> int:
+        """
+        segment所在的层：行数小于merge_rows为第0层，[merge_rows * F^(t-1), merge_rows * F^t) 为第t层
+        """
+        tier, limit = 0, self.merge_rows
+        while rows >= limit:
+            tier += 1
+            limit *= _MERGE_FANOUT
+        return tier
+
+    def _merge_segments(self):
+        """
+        segment数量超过上限时，每次合并最低的、至少有两个segment的层，直到数量回到上限以内
+        每条记录只在所在segment升层时被重写（约log_F(总行数/merge_rows)次），写入成本不随数据量线性增长
+        """
+        started = time.monotonic()
+        merged = 0
+        while len(self._segments) > self.max_segments:
+            tiers: Dict[int, List[_Segment]] = {}
+            for segment in self._segments:
+                tiers.setdefault(self._tier(len(segment)), []).append(segment)
+            group = next((tiers[tier] for tier in sorted(tiers) if len(tiers[tier]) >= 2), None)
+            if group is None:
+                # 每层都只有一个segment（只在上限极小时出现），合并最小的两个
+                group = sorted(self._segments, key=len)[:2]
+            self._rewrite(group)
+            merged += len(group)
+        logger.info(f"本地向量库合并了 {merged} 个segment，耗时 {time.monotonic() - started:.2f}s")
+
+    def compact(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        重写包含已删除记录的segment，同步执行
+        """
+        with self._write():
+            started = time.monotonic()
+            before = len(self._segments)
+            removed = len(self._deleted_ids)
+            dirty = [segment for segment in self._segments if np.isin(segment.ids, self._deleted_ids).any()]
+            if dirty:
+                self._rewrite(dirty)
+                self._loaded_signature = self._signature()
+            return {
+                "segments_before": before,
+                "segments_after": len(self._segments),
+                "removed": removed,
+                "elapsed_seconds": round(time.monotonic() - started, 2),
+            }
@@ -0,0 +1,193 @@
+import logging
+import os
+import tempfile
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from pymilvus import utility, BulkInsertState
+
+from app.core.config import settings
+from app.services.chunk_text_store import chunk_text_store
+from app.services.milvus_service import INSERT_FIELDS, BINARY_VECTOR_FIELD, TEXT_REF_FIELD
+from app.services.minio_service import minio_service
+from app.services.vector_codec import VectorStorageType, to_bfloat16, to_binary
+
+"""
+Milvus BulkInsert 离线导入
+
+大批量数据不再逐批通过gRPC insert，而是：
+1. NumpyBulkWriter 把向量化结果按Collection的schema写成每个字段一个.npy文件（列式），
+   每 MILVUS_BULK_INSERT_ROWS_PER_FILE 行为一组
+2. 上传到Milvus读取数据的MinIO桶（MILVUS_BULK_INSERT_BUCKET）
+3. 每组文件提交一个 do_bulk_insert 任务，由Milvus直接生成大segment
+4. BulkInsertTracker 轮询任务进度，全部完成后再建索引、加载
+"""
+logger = logging.getLogger(__name__)
+
+
+def vector_field_arrays(vectors: Any, storage_type: VectorStorageType) -> List[tuple]:
+    """
+    把float向量转换为BulkInsert的numpy格式
+    float向量为(N, dim)的float32；半精度向量为(N, dim*2)的uint8；二值向量为(N, dim/8)的uint8
+    :param vectors:
+    :param storage_type:
+    :return: [(字段名, 数组)]
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    rows = len(matrix)
+    if storage_type == VectorStorageType.FLOAT:
+        arrays = [("vector", matrix)]
+    elif storage_type == VectorStorageType.BFLOAT16:
+        arrays = [("vector", np.frombuffer(b"".join(to_bfloat16(matrix)), dtype=np.uint8).reshape(rows, -1))]
+    else:
+        # float16，以及binary模式下的float16精排副本
+        arrays = [("vector", matrix.astype(np.float16).view(np.uint8))]
+    if storage_type == VectorStorageType.BINARY:
+        arrays.append((BINARY_VECTOR_FIELD, np.frombuffer(b"".join(to_binary(matrix)), dtype=np.uint8).reshape(rows, -1)))
+    return arrays
+
+
+class NumpyBulkWriter:
+    """
+    按列累积数据，每达到rows_per_file行写出一组.npy文件并上传
+    """
+
+    def __init__(self, storage_type: VectorStorageType, prefix: str,
+                 bucket_name: str = settings.MILVUS_BULK_INSERT_BUCKET,
+                 rows_per_file: int = settings.MILVUS_BULK_INSERT_ROWS_PER_FILE,
+                 external_text: bool = False, collection_name: Optional[str] = None):
+        """
+        :param storage_type: 目标Collection的向量存储类型
+        :param external_text: 目标Collection的文本是否保存在外部文本存储中，是则写入时保存文本并只导入引用
+        :param collection_name: 目标Collection的实际名称，外部文本存储按此名称归属文本块
+        :param prefix: 对象前缀，每组文件位于 {prefix}/{序号}/ 下
+        :param bucket_name: Milvus读取数据的桶
+        :param rows_per_file: 每组文件的行数
+        """
+        self.storage_type = storage_type
+        self.prefix = prefix.strip("/")
+        self.bucket_name = bucket_name
+        self.rows_per_file = rows_per_file
+        self.external_text = external_text
+        self.collection_name = collection_name
+        if external_text and not collection_name:
+            raise ValueError("外部文本存储模式需要指定目标Collection的名称")
+        self.uploaded_objects: List[str] = []
+        self._columns: List[List[Any]] = [[] for _ in INSERT_FIELDS]
+        self._sequence = 0
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self._columns[0])
+
+    def append(self, columns: List[List[Any]]) -> List[List[str]]:
+        """
+        追加按INSERT_FIELDS组织的列数据
+        :param columns:
+        :return: 本次写出的文件组（可能为空），每组用于一个BulkInsert任务
+        """
+        for target, values in zip(self._columns, columns):
+            target.extend(values)
+        written = []
+        while self.pending_rows >= self.rows_per_file:
+            written.append(self._write(self.rows_per_file))
+        return written
+
+    def close(self) -> Optional[List[str]]:
+        """
+        写出剩余数据
+        :return: 最后一组文件，没有剩余数据时返回None
+        """
+        return self._write(self.pending_rows) if self.pending_rows else None
+
+    def _write(self, rows: int) -> List[str]:
+        """
+        把前rows行写成.npy文件并上传
+        :return: 对象名列表
+        """
+        file_ids, knowledge_base_ids, texts, vectors = (column[:rows] for column in self._columns)
+        self._columns = [column[rows:] for column in self._columns]
+        if self.external_text:
+            text_array = (TEXT_REF_FIELD, np.asarray(chunk_text_store.put(self.collection_name, file_ids, texts), dtype=np.int64))
+        else:
+            text_array = ("chunk_text", np.asarray(texts, dtype=np.str_))
+        arrays = [
+            ("file_id", np.asarray(file_ids, dtype=np.int64)),
+            ("knowledge_base_id", np.asarray(knowledge_base_ids, dtype=np.int64)),
+            text_array,
+        ] + vector_field_arrays(vectors, self.storage_type)
+        group = f"{self.prefix}/{self._sequence:05d}"
+        self._sequence += 1
+        objects = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for field, array in arrays:
+                path = os.path.join(temp_dir, f"{field}.npy")
+                np.save(path, array, allow_pickle=False)
+                object_name = f"{group}/{field}.npy"
+                with open(path, "rb") as file:
+                    if not minio_service.upload_file(self.bucket_name, object_name, file.read()):
+                        raise ValueError(f"上传BulkInsert文件失败: {object_name}")
+                objects.append(object_name)
+        self.uploaded_objects.extend(objects)
+        logger.info(f"已写出BulkInsert文件组 {group}，行数: {rows}")
+        return objects
+
+    def cleanup(self):
+        """
+        删除已上传的文件
+        :return:
+        """
+        for object_name in self.uploaded_objects:
+            minio_service.delete_file(self.bucket_name, object_name)
+        self.uploaded_objects = []
+
+
+class BulkInsertTracker:
+    """
+    提交BulkInsert任务并跟踪进度
+    """
+
+    _FAILED_STATES = {BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned}
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self.task_ids: List[int] = []
+
+    def submit(self, files: List[str]) -> int:
+        """
+        提交一个BulkInsert任务
+        :param files: 同一组的字段文件
+        :return: 任务ID
+        """
+        task_id = utility.do_bulk_insert(collection_name=self.collection_name, files=files)
+        self.task_ids.append(task_id)
+        logger.info(f"已提交BulkInsert任务 {task_id}，文件: {files[0].rsplit('/', 1)[0]}")
+        return task_id
+
+    def wait(self, poll_interval: float = 5.0) -> int:
+        """
+        等待全部任务完成，定期输出进度
+        :param poll_interval: 轮询间隔（秒）
+        :return: 导入的总行数
+        """
+        pending = set(self.task_ids)
+        imported = 0
+        started = time.monotonic()
+        while pending:
+            progress = []
+            for task_id in sorted(pending):
+                state = utility.get_bulk_insert_state(task_id=task_id)
+                if state.state in self._FAILED_STATES:
+                    raise RuntimeError(f"BulkInsert任务 {task_id} 失败: {state.failed_reason}")
+                if state.state == BulkInsertState.ImportCompleted:
+                    pending.discard(task_id)
+                    imported += state.row_count
+                else:
+                    progress.append(f"{task_id}:{state.state_name}({getattr(state, 'progress', 0)}%)")
+            elapsed = max(time.monotonic() - started, 1e-6)
+            logger.info(f"BulkInsert进度: 已完成 {len(self.task_ids) - len(pending)}/{len(self.task_ids)} 个任务，"
+                        f"已导入 {imported} 行，{imported / elapsed:.0f} 行/秒 {' '.join(progress)}")
+            if pending:
+                time.sleep(poll_interval)
+        return imported
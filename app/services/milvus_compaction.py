@@ -0,0 +1,40 @@
+import logging
+import time
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.services.vector_store import get_vector_store
+
+"""
+Milvus compaction调度
+
+删除只写入删除记录（tombstone），被删除的行在compaction之前仍占用查询节点内存，并参与检索时的过滤
+（本地向量库同样以删除标记实现删除）。worker定期检查当前向量库中已删除记录的占比，
+超过 MILVUS_COMPACTION_DELETED_RATIO 时触发compaction并等待完成，记录耗时和清理前后的统计
+"""
+logger = logging.getLogger(__name__)
+
+
+def check_and_compact(threshold: float = settings.MILVUS_COMPACTION_DELETED_RATIO,
+                      timeout: float = settings.MILVUS_COMPACTION_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    已删除记录占比超过阈值时触发compaction
+    :param threshold: 触发compaction的已删除记录占比
+    :param timeout: 等待compaction完成的秒数
+    :return: 检查时的统计，触发时包含compaction结果和完成后的统计
+    """
+    vector_store = get_vector_store()
+    stats = vector_store.deletion_stats()
+    if stats["deleted_ratio"] < threshold:
+        logger.info(f"Collection '{stats['collection']}' 已删除记录 {stats['deleted']}/{stats['total']}"
+                    f"（{stats['deleted_ratio']:.1%}），未达到compaction阈值 {threshold:.0%}")
+        return stats
+    logger.info(f"Collection '{stats['collection']}' 已删除记录 {stats['deleted']}/{stats['total']}"
+                f"（{stats['deleted_ratio']:.1%}），触发compaction")
+    started = time.monotonic()
+    stats["compaction"] = vector_store.compact(timeout=timeout)
+    stats["compaction"]["elapsed_seconds"] = round(time.monotonic() - started, 1)
+    stats["after"] = vector_store.deletion_stats()
+    logger.info(f"compaction结束: {stats['compaction']}，已删除记录占比 "
+                f"{stats['deleted_ratio']:.1%} -> {stats['after']['deleted_ratio']:.1%}")
+    return stats
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core.config import settings
+from app.services.milvus_service import INSERT_FIELDS
+from app.services.vector_store import VectorStore, get_vector_store
+
+"""
+Milvus写入缓冲区
+
+多个向量化任务并发产生的实体先写入这个共享缓冲区，按列组织，
+当满足以下任一条件时才真正写入Milvus：
+1. 缓冲行数达到 MILVUS_INSERT_BATCH_ROWS
+2. 估算字节数达到 MILVUS_INSERT_BATCH_BYTES
+3. 最早一条数据的等待时间超过 MILVUS_INSERT_MAX_AGE_SECONDS
+
+写入时不再逐批flush，避免大量小文件产生成千上万个小segment，
+只在关闭（drain）时统一flush一次。
+"""
+logger = logging.getLogger(__name__)
+
+# 单个实体除文本和向量以外的固定开销估算（两个INT64字段及其他元数据）
+_ENTITY_OVERHEAD_BYTES = 32
+
+
+class MilvusInsertBuffer:
+    """
+    线程安全的Milvus批量写入缓冲区
+    """
+
+    def __init__(
+            self,
+            service: VectorStore,
+            max_rows: int = settings.MILVUS_INSERT_BATCH_ROWS,
+            max_bytes: int = settings.MILVUS_INSERT_BATCH_BYTES,
+            max_age_seconds: float = settings.MILVUS_INSERT_MAX_AGE_SECONDS,
+            max_pending_rows: int = settings.MILVUS_INSERT_MAX_PENDING_ROWS,
+    ):
+        """
+        :param service: 实际执行写入的向量存储
+        :param max_rows: 单批最大行数
+        :param max_bytes: 单批最大字节数（估算值）
+        :param max_age_seconds: 数据在缓冲区中的最长等待时间
+        :param max_pending_rows: 缓冲区+写入中的最大行数，超过后add会阻塞
+        """
+        self.service = service
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_pending_rows = max(max_pending_rows, max_rows)
+
+        self._cond = threading.Condition()
+        self._columns: List[List[Any]] = [[] for _ in INSERT_FIELDS]
+        # 每次add对应的(future, 起始行, 结束行)，用于在写入后回传主键
+        self._tickets: List[Tuple[Future, int, int]] = []
+        self._rows = 0
+        self._bytes = 0
+        self._oldest_at: Optional[float] = None
+        # 已从缓冲区取出但尚未写入完成的行数
+        self._inflight_rows = 0
+        self._closed = False
+        self._worker: Optional[threading.Thread] = None
+
+    def add(self, entities: List[Dict[str, Any]], timeout: Optional[float] = None) -> Future:
+        """
+        把实体加入缓冲区，返回一个Future，写入Milvus后结果为这些实体的主键列表
+        缓冲区积压过多时会阻塞调用方（背压）
+        :param entities: 字典列表，每个字典包含 'file_id', 'knowledge_base_id', 'chunk_text', 'vector'
+        :param timeout: 背压等待的最长时间，None表示一直等待
+        :return:
+        """
+        future = Future()
+        if not entities:
+            future.set_result([])
+            return future
+        size = sum(self._estimate_bytes(entity) for entity in entities)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Milvus写入缓冲区已关闭")
+            self._ensure_worker()
+            # 背压：积压超过上限时等待后台线程写入，单次add超过上限时只要缓冲区为空就放行
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while (self._rows + self._inflight_rows > 0
+                   and self._rows + self._inflight_rows + len(entities) > self.max_pending_rows):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Milvus写入缓冲区已满，等待超时")
+                self._cond.wait(remaining)
+                if self._closed:
+                    raise RuntimeError("Milvus写入缓冲区已关闭")
+            start = self._rows
+            for entity in entities:
+                for column, field in zip(self._columns, INSERT_FIELDS):
+                    column.append(entity[field])
+            self._rows += len(entities)
+            self._bytes += size
+            self._tickets.append((future, start, self._rows))
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            self._cond.notify_all()
+        return future
+
+    def flush(self):
+        """
+        立即把缓冲区中的数据写入Milvus（同步），不会触发Milvus flush
+        :return:
+        """
+        with self._cond:
+            batch = self._take_batch()
+        if batch:
+            self._write(*batch)
+
+    def close(self, timeout: Optional[float] = 30.0):
+        """
+        优雅关闭：停止接收新数据，写完缓冲区内剩余数据，最后统一flush一次
+        :param timeout: 等待后台线程结束的最长时间
+        :return:
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            worker = self._worker
+        if worker:
+            worker.join(timeout)
+        # 后台线程未启动或未能及时退出时，由当前线程写完剩余数据
+        self.flush()
+        self.service.flush()
+        logger.info("Milvus写入缓冲区已关闭，剩余数据已写入")
+
+    def _ensure_worker(self):
+        """
+        按需启动后台写入线程，调用方需持有锁
+        :return:
+        """
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="milvus-insert-buffer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        """
+        后台线程：等待任一阈值被触发后写入一批数据
+        :return:
+        """
+        while True:
+            with self._cond:
+                while not self._closed and not self._should_flush():
+                    wait_for = None
+                    if self._oldest_at is not None:
+                        wait_for = max(self._oldest_at + self.max_age_seconds - time.monotonic(), 0)
+                    self._cond.wait(wait_for)
+                if self._closed and self._rows == 0:
+                    return
+                batch = self._take_batch()
+            if batch:
+                self._write(*batch)
+
+    def _should_flush(self) -> bool:
+        if self._rows == 0:
+            return False
+        if self._rows >= self.max_rows or self._bytes >= self.max_bytes:
+            return True
+        return time.monotonic() - self._oldest_at >= self.max_age_seconds
+
+    def _take_batch(self) -> Optional[Tuple[List[List[Any]], List[Tuple[Future, int, int]], int]]:
+        """
+        取出当前缓冲区中的全部数据，调用方需持有锁
+        :return: (列数据, 票据列表, 行数)
+        """
+        if self._rows == 0:
+            return None
+        batch = (self._columns, self._tickets, self._rows)
+        self._inflight_rows += self._rows
+        self._columns = [[] for _ in INSERT_FIELDS]
+        self._tickets = []
+        self._rows = 0
+        self._bytes = 0
+        self._oldest_at = None
+        return batch
+
+    def _write(self, columns: List[List[Any]], tickets: List[Tuple[Future, int, int]], rows: int):
+        """
+        执行一次批量写入，并把结果回传给各个Future
+        :return:
+        """
+        try:
+            started = time.monotonic()
+            primary_keys = self.service.insert_columns(columns)
+            logger.info(f"写入缓冲区批量写入{rows}行，耗时{time.monotonic() - started:.3f}s")
+            for future, start, end in tickets:
+                future.set_result(list(primary_keys[start:end]))
+        except Exception as e:
+            logger.error(f"写入缓冲区批量写入失败，行数: {rows}，错误信息: {e}")
+            for future, _, _ in tickets:
+                future.set_exception(e)
+        finally:
+            with self._cond:
+                self._inflight_rows -= rows
+                self._cond.notify_all()
+
+    @staticmethod
+    def _estimate_bytes(entity: Dict[str, Any]) -> int:
+        """
+        估算单个实体在gRPC请求中的大小
+        :param entity:
+        :return:
+        """
+        return (_ENTITY_OVERHEAD_BYTES
+                + len(entity["chunk_text"].encode("utf-8"))
+                + len(entity["vector"]) * 4)
+
+
+# 创建一个全局共享的写入缓冲区实例
+milvus_insert_buffer = MilvusInsertBuffer(get_vector_store())
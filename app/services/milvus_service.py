@@ -1,4 +1,7 @@
 import logging
+import re
+import threading
+import time
 from pymilvus import (
     connections,
     utility,
@@ -10,17 +13,261 @@ from pymilvus import (
 from typing import List, Dict, Any, Optional
 from app.core.config import settings
 
+from app.services.chunk_text_store import chunk_text_store
+from app.services.vector_store import VectorStore
+from app.services.vector_codec import VectorStorageType, encode_for_storage, to_binary, decode_from_storage, l2_rerank
+
 logger = logging.getLogger(__name__)
-#向量集合名称
+# 向量集合的别名，始终指向当前使用的版本（health_documents_v1、health_documents_v2...）
 DEFAULT_COLLECTION_NAME = "health_documents"
+# 版本化Collection的名称前缀
+VERSION_PREFIX = f"{DEFAULT_COLLECTION_NAME}_v"
 # 向量维度
-VECTOR_DIMENSION = 1024
+VECTOR_DIMENSION = settings.VECTOR_DIMENSION
+# 插入时的字段顺序（主键id为auto_id，不需要传入）
+INSERT_FIELDS = ["file_id", "knowledge_base_id", "chunk_text", "vector"]
+# binary存储模式下用于粗排的二值向量字段
+BINARY_VECTOR_FIELD = "binary_vector"
+# 外部文本存储模式下代替chunk_text的引用字段
+TEXT_REF_FIELD = "text_ref"
+# inline模式下chunk_text字段（VARCHAR）的最大字节数
+INLINE_TEXT_MAX_BYTES = 4000
+# 用于过滤/按文件删除的标量字段，建立标量索引
+SCALAR_INDEX_FIELDS = ["file_id", "knowledge_base_id"]
+# 连接Milvus后才存在的属性，首次访问时建立连接
+_CONNECTED_ATTRIBUTES = {"collection", "collection_name", "storage_type", "external_text", "_alias_checked_at"}
+
+# 不同存储类型对应的Milvus向量字段类型
+_VECTOR_DATA_TYPES = {
+    VectorStorageType.FLOAT: DataType.FLOAT_VECTOR,
+    VectorStorageType.FLOAT16: DataType.FLOAT16_VECTOR,
+    VectorStorageType.BFLOAT16: DataType.BFLOAT16_VECTOR,
+    # binary模式下vector字段保存float16精排副本
+    VectorStorageType.BINARY: DataType.FLOAT16_VECTOR,
+}
+
+
+def build_collection_schema(storage_type: VectorStorageType, dim: int = VECTOR_DIMENSION,
+                            external_text: bool = False, mmap_enabled: bool = False) -> CollectionSchema:
+    """
+    根据存储类型构建Collection的schema
+    :param storage_type: 向量存储类型
+    :param dim: 向量维度
+    :param external_text: 文本是否保存在外部文本存储中，是则Milvus只保存引用
+    :param mmap_enabled: 是否为向量和文本字段开启mmap
+    :return:
+    """
+    # 只在开启时传入，避免旧版本Milvus不识别该属性
+    mmap = {"mmap_enabled": True} if mmap_enabled else {}
+    if external_text:
+        text_field = FieldSchema(name=TEXT_REF_FIELD, dtype=DataType.INT64, description="外部文本存储中的引用")
+    else:
+        text_field = FieldSchema(name="chunk_text", dtype=DataType.VARCHAR, max_length=INLINE_TEXT_MAX_BYTES, description="分块的文本内容", **mmap)
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="file_id", dtype=DataType.INT64, description="关联的源文件id"),
+        FieldSchema(name="knowledge_base_id", dtype=DataType.INT64, description="关联的知识库id"),
+        text_field,
+        FieldSchema(name="vector", dtype=_VECTOR_DATA_TYPES[storage_type], dim=dim, description="向量表示", **mmap)
+    ]
+    if storage_type == VectorStorageType.BINARY:
+        if dim % 8 != 0:
+            raise ValueError("binary存储模式要求向量维度为8的倍数")
+        fields.append(FieldSchema(name=BINARY_VECTOR_FIELD, dtype=DataType.BINARY_VECTOR, dim=dim, description="符号量化的二值向量，用于粗排", **mmap))
+    return CollectionSchema(fields=fields, description="医疗健康文档合集", enable_dynamic_field=False)
+
+
+def create_collection(name: str, storage_type: VectorStorageType, dim: int = VECTOR_DIMENSION,
+                      with_index: bool = True, external_text: bool = False) -> Collection:
+    """
+    创建Collection并建立向量索引
+    :param name: Collection名称
+    :param storage_type: 向量存储类型
+    :param dim: 向量维度
+    :param with_index: 是否立即建立索引，批量导入时可以在数据导入完成后再调用create_vector_indexes/create_scalar_indexes
+    :param external_text: 文本是否保存在外部文本存储中
+    :return:
+    """
+    schema = build_collection_schema(storage_type, dim, external_text, settings.MILVUS_MMAP_ENABLED)
+    collection = Collection(name=name, schema=schema)
+    if with_index:
+        create_vector_indexes(collection, storage_type)
+        create_scalar_indexes(collection)
+    logger.info(f"成功创建Milvus Collection: '{name}'，向量存储类型: {storage_type.value}，"
+                f"文本存储: {'mysql' if external_text else 'inline'}，mmap: {settings.MILVUS_MMAP_ENABLED}")
+    return collection
+
+
+def create_vector_indexes(collection: Collection, storage_type: VectorStorageType):
+    """
+    为Collection的向量字段建立索引
+    :param collection:
+    :param storage_type: 向量存储类型
+    :return:
+    """
+    if storage_type == VectorStorageType.BINARY:
+        # 二值向量用于粗排，精排副本只需FLAT索引即可满足加载要求
+        collection.create_index(field_name=BINARY_VECTOR_FIELD, index_params={
+            "metric_type": "HAMMING",
+            "index_type": "BIN_IVF_FLAT",
+            "params": {"nlist": 1024},
+        })
+        collection.create_index(field_name="vector", index_params={
+            "metric_type": "L2",
+            "index_type": "FLAT",
+            "params": {},
+        })
+    else:
+        collection.create_index(field_name="vector", index_params={
+            "metric_type": "L2",
+            "index_type": "IVF_FLAT",
+            "params": {"nlist": 1024},
+        })
+
+
+def missing_scalar_indexes(collection: Collection) -> List[str]:
+    """
+    尚未建立标量索引的过滤字段
+    :param collection:
+    :return:
+    """
+    indexed = {index.field_name for index in collection.indexes}
+    return [field_name for field_name in SCALAR_INDEX_FIELDS if field_name not in indexed]
+
+
+def create_scalar_indexes(collection: Collection, index_type: str = settings.MILVUS_SCALAR_INDEX_TYPE) -> List[str]:
+    """
+    为过滤字段建立标量索引，已有索引的字段跳过
+    :param collection:
+    :param index_type: INVERTED / STL_SORT，为空时不建立
+    :return: 本次建立索引的字段
+    """
+    if not index_type:
+        return []
+    created = missing_scalar_indexes(collection)
+    for field_name in created:
+        collection.create_index(field_name=field_name, index_params={"index_type": index_type},
+                                index_name=f"{field_name}_idx")
+    return created
+
+
+def detect_storage_type(collection: Collection) -> VectorStorageType:
+    """
+    根据已有Collection的schema推断其向量存储类型
+    :param collection:
+    :return:
+    """
+    field_types = {field.name: field.dtype for field in collection.schema.fields}
+    if BINARY_VECTOR_FIELD in field_types:
+        return VectorStorageType.BINARY
+    for storage_type, data_type in _VECTOR_DATA_TYPES.items():
+        if field_types.get("vector") == data_type:
+            return storage_type
+    return VectorStorageType.FLOAT
+
+
+def has_external_text(collection: Collection) -> bool:
+    """
+    已有Collection的文本是否保存在外部文本存储中
+    :param collection:
+    :return:
+    """
+    return any(field.name == TEXT_REF_FIELD for field in collection.schema.fields)
+
+
+def versioned_collection_name(version: int) -> str:
+    return f"{VERSION_PREFIX}{version}"
+
+
+def collection_version(name: Optional[str]) -> Optional[int]:
+    """
+    :param name: Collection名称
+    :return: 版本号，不是版本化的Collection时返回None
+    """
+    match = re.fullmatch(rf"{re.escape(VERSION_PREFIX)}(\d+)", name or "")
+    return int(match.group(1)) if match else None
+
+
+def list_versions() -> List[int]:
+    """
+    已存在的版本化Collection的版本号，升序
+    :return:
+    """
+    versions = (collection_version(name) for name in utility.list_collections())
+    return sorted(version for version in versions if version is not None)
+
+
+def resolve_alias(alias: str = DEFAULT_COLLECTION_NAME) -> Optional[str]:
+    """
+    查询别名当前指向的Collection
+    :param alias:
+    :return: 实际的Collection名称，别名不存在时返回None
+    """
+    for name in utility.list_collections():
+        if alias in utility.list_aliases(name):
+            return name
+    return None
+
+
+def truncate_inline_text(text: str, max_bytes: int = INLINE_TEXT_MAX_BYTES) -> str:
+    """
+    按UTF-8字节截断文本，使其能写入inline模式的chunk_text字段，不截断半个字符
+    """
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore")
 
-class MilvusService:
-    def __init__(self):
+
+def encode_columns(columns: List[List[Any]], storage_type: VectorStorageType) -> List[List[Any]]:
+    """
+    把按INSERT_FIELDS组织的列数据中的float向量编码为存储格式
+    :param columns:
+    :param storage_type:
+    :return:
+    """
+    vectors = columns[3]
+    encoded = [columns[0], columns[1], columns[2], encode_for_storage(vectors, storage_type)]
+    if storage_type == VectorStorageType.BINARY:
+        encoded.append(to_binary(vectors))
+    return encoded
+
+
+class MilvusService(VectorStore):
+    def __init__(self, collection_name: Optional[str] = None):
         """
-        初始化milvus连接，并确保collection存在
+        创建服务实例，首次使用时才连接Milvus并确保collection存在，Milvus不可用时应用仍可启动
+        :param collection_name: 为空时通过别名 DEFAULT_COLLECTION_NAME 访问当前版本，并跟随别名的切换；
+            指定时直接绑定到一个已存在的Collection（如重建中的新版本）
         """
+        self.alias = None if collection_name else DEFAULT_COLLECTION_NAME
+        self._requested_name = collection_name
+        self._bind_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._connected = False
+
+    def __getattr__(self, name: str):
+        # 只在常规属性查找失败时调用：连接后才存在的属性触发连接
+        if name in _CONNECTED_ATTRIBUTES:
+            self.connect()
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def connect(self):
+        """
+        连接Milvus并确保collection存在，已连接时直接返回
+        :return:
+        """
+        if self._connected:
+            return
+        with self._connect_lock:
+            if self._connected:
+                return
+            self._connect()
+            self._connected = True
+
+    def _connect(self):
+        collection_name = self._requested_name
         try:
             logger.info(f"尝试连接到 Milvus: host={settings.MILVUS_HOST}, port={settings.MILVUS_PORT}")
             connections.connect(
@@ -29,43 +276,95 @@ class MilvusService:
                 port=settings.MILVUS_PORT
             )
             logger.info(f"成功连接到Milvus")
-            self._ensure_collection_exists()
+            if collection_name:
+                self._bind(collection_name, collection_name)
+            else:
+                self._ensure_collection_exists()
         except Exception as e:
             logger.error(f"初始化Milvus失败: {e}")
             raise ConnectionError("无法连接到Milvus服务") from e
 
+    def _bind(self, name: str, collection_name: str):
+        """
+        绑定到一个Collection，并以其实际schema为准确定存储方式
+        :param name: 访问时使用的名称（别名或实际名称）
+        :param collection_name: 实际的Collection名称，外部文本存储按此名称归属文本块
+        :return:
+        """
+        collection = Collection(name=name)
+        storage_type = detect_storage_type(collection)
+        external_text = has_external_text(collection)
+        with self._bind_lock:
+            self.collection = collection
+            self.collection_name = collection_name
+            self.storage_type = storage_type
+            self.external_text = external_text
+            self._alias_checked_at = time.monotonic()
+
     def _ensure_collection_exists(self):
         """
         内部方法，用来检测并创建所需的Collection和索引
+        全新部署时创建第一个版本并建立别名；未版本化的旧Collection直接使用，可通过 scripts/rebuild_collection.py bootstrap 转换
         :return:
         """
         try:
-            if not utility.has_collection(DEFAULT_COLLECTION_NAME):
-                fields = [
-                    FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-                    FieldSchema(name="file_id", dtype=DataType.INT64, description="关联的源文件id"),
-                    FieldSchema(name="knowledge_base_id", dtype=DataType.INT64, description="关联的知识库id"),
-                    FieldSchema(name="chunk_text", dtype=DataType.VARCHAR, max_length=4000, description="分块的文本内容"),
-                    FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=VECTOR_DIMENSION, description="向量表示")
-                ]
-                schema = CollectionSchema(fields=fields, description="医疗健康文档合集", enable_dynamic_field=False)
-                self.collection = Collection(name=DEFAULT_COLLECTION_NAME, schema=schema)
-                index_params = {
-                    "metric_type": "L2",
-                    "index_type": "IVF_FLAT",
-                    "params": {"nlist": 1024},
-                }
-                self.collection.create_index(field_name="vector", index_params=index_params)
-                logger.info(f"成功创建Milvus Collection: '{DEFAULT_COLLECTION_NAME}'")
-            else:
-                self.collection = Collection(name=DEFAULT_COLLECTION_NAME)
-                logger.info(f"已找到Milvus Collection: '{DEFAULT_COLLECTION_NAME}'")
+            configured_type = VectorStorageType(settings.MILVUS_VECTOR_TYPE)
+            configured_external = settings.MILVUS_TEXT_STORE == "mysql"
+            target = resolve_alias(DEFAULT_COLLECTION_NAME)
+            if target is None and not utility.has_collection(DEFAULT_COLLECTION_NAME):
+                target = versioned_collection_name(1)
+                create_collection(target, configured_type, external_text=configured_external)
+                utility.create_alias(target, DEFAULT_COLLECTION_NAME)
+                logger.info(f"已创建别名 '{DEFAULT_COLLECTION_NAME}' -> '{target}'")
+            elif target is None:
+                target = DEFAULT_COLLECTION_NAME
+                logger.info(f"Milvus Collection '{DEFAULT_COLLECTION_NAME}' 尚未版本化，"
+                            f"可使用 scripts/rebuild_collection.py bootstrap 转换为别名访问")
+            self._bind(DEFAULT_COLLECTION_NAME, target)
+            # 以已有Collection的实际schema为准，避免配置与数据不一致
+            if self.external_text != configured_external:
+                logger.warning(f"Collection '{target}' 的文本存储为 "
+                               f"{'mysql' if self.external_text else 'inline'}，与配置的 MILVUS_TEXT_STORE="
+                               f"{settings.MILVUS_TEXT_STORE} 不一致，请重建新版本后切换")
+            existing_dim = next((field.params.get("dim") for field in self.collection.schema.fields if field.name == "vector"), None)
+            if existing_dim and int(existing_dim) != VECTOR_DIMENSION:
+                logger.warning(f"Collection '{target}' 的向量维度为 {existing_dim}，"
+                               f"与配置的 VECTOR_DIMENSION={VECTOR_DIMENSION} 不一致")
+            missing = missing_scalar_indexes(self.collection)
+            if missing and settings.MILVUS_SCALAR_INDEX_TYPE:
+                logger.warning(f"Collection '{target}' 的字段 {missing} 没有标量索引，"
+                               f"过滤和按文件删除需要全表扫描，请使用 scripts/migrate_milvus_indexes.py 补建")
+            if self.storage_type != configured_type:
+                logger.warning(f"Collection '{target}' 的向量存储类型为 {self.storage_type.value}，"
+                               f"与配置的 {configured_type.value} 不一致，请重建新版本后切换")
+            logger.info(f"使用Milvus Collection: '{target}'")
             # 加载collection到内存
             self.collection.load()
         except Exception as e:
             logger.error(f"创建Milvus Collection失败: {e}")
             raise ConnectionError("无法创建Milvus Collection") from e
 
+    def refresh_alias(self, force: bool = False):
+        """
+        检查别名是否已切换到新版本，切换后重新绑定，使新版本的schema（存储类型、文本存储）生效
+        检查间隔为 MILVUS_ALIAS_REFRESH_SECONDS；切换前后两个版本都处于加载状态，检索不中断
+        :param force: 忽略检查间隔
+        :return:
+        """
+        if self.alias is None:
+            return
+        if not force and time.monotonic() - self._alias_checked_at < settings.MILVUS_ALIAS_REFRESH_SECONDS:
+            return
+        self._alias_checked_at = time.monotonic()
+        try:
+            target = resolve_alias(self.alias)
+            if target and target != self.collection_name:
+                self._bind(self.alias, target)
+                logger.info(f"别名 '{self.alias}' 已切换到 '{target}'，向量存储类型: {self.storage_type.value}，"
+                            f"文本存储: {'mysql' if self.external_text else 'inline'}")
+        except Exception as e:
+            logger.warning(f"检查Milvus别名失败: {e}")
+
     async def insert(self, entities: List[Dict[str, Any]]) -> List[int]:
         """
         批量插入实体
@@ -74,6 +373,7 @@ class MilvusService:
         """
         if not entities:
             return []
+        self.refresh_alias()
         try:
             # 组织数据
             data_to_insert = [
@@ -83,7 +383,7 @@ class MilvusService:
                 [entity["vector"] for entity in entities],
             ]
             # 插入
-            mutation_result = self.collection.insert(data_to_insert)
+            mutation_result = self.collection.insert(self._encode(data_to_insert))
             # 确保数据被写入
             self.collection.flush()
             logger.info(f"成功向milvus插入{mutation_result.insert_count}条数据")
@@ -92,6 +392,57 @@ class MilvusService:
             logger.error(f"插入数据失败: {e}")
             raise ValueError("插入数据失败") from e
 
+    def insert_columns(self, columns: List[List[Any]]) -> List[int]:
+        """
+        以列式数据同步插入，不主动flush，由Milvus按自身策略封存segment
+        供写入缓冲区等批量写入方使用
+        :param columns: 按INSERT_FIELDS顺序组织的列数据
+        :return: 插入记录的主键ID列表
+        """
+        if not columns or not columns[0]:
+            return []
+        self.refresh_alias()
+        try:
+            mutation_result = self.collection.insert(self._encode(columns))
+            logger.info(f"成功向milvus批量插入{mutation_result.insert_count}条数据")
+            return mutation_result.primary_keys
+        except Exception as e:
+            logger.error(f"批量插入数据失败: {e}")
+            raise ValueError("批量插入数据失败") from e
+
+    @property
+    def text_field(self) -> str:
+        return TEXT_REF_FIELD if self.external_text else "chunk_text"
+
+    def _encode(self, columns: List[List[Any]]) -> List[List[Any]]:
+        """
+        外部文本存储模式下先保存文本并替换为引用，再编码向量
+        :param columns: 按INSERT_FIELDS顺序组织的列数据
+        :return:
+        """
+        if self.external_text:
+            columns = [columns[0], columns[1], chunk_text_store.put(self.collection_name, columns[0], columns[2]), columns[3]]
+        return encode_columns(columns, self.storage_type)
+
+    def fetch_texts(self, rows: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        从查询/搜索结果中取出文本，外部文本存储模式下按引用批量读取
+        :param rows: 包含text_field字段的行
+        :return:
+        """
+        values = [row.get(self.text_field) for row in rows]
+        return chunk_text_store.get_many(values) if self.external_text else values
+
+    def flush(self):
+        """
+        将已插入的数据持久化，只应在批量写入结束时调用，频繁调用会产生大量小segment
+        :return:
+        """
+        try:
+            self.collection.flush()
+        except Exception as e:
+            logger.error(f"Milvus flush失败: {e}")
+
     async def search(self, query_vector: List[float], top_k: int = 5, knowledge_base_id: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         执行向量搜索
@@ -100,49 +451,214 @@ class MilvusService:
         :param knowledge_base_id: （可选）用于过滤的知识库id
         :return: 一个结果表，每个结果包含距离、ID和所有输出字段
         """
-        search_params = {"metric_type": "L2",
-                         "params": {"nprobe": 16}# nprobe是查询时要搜索的聚类数量
-                         }
+        self.refresh_alias()
         expr = f"knowledge_base_id == {knowledge_base_id}" if knowledge_base_id else ""
+        output_fields = ["file_id", self.text_field, "knowledge_base_id"]
         try:
+            if self.storage_type == VectorStorageType.BINARY:
+                # 先用二值向量按汉明距离粗排，再取回精排副本按L2精确重排序
+                results = self.collection.search(
+                    data=to_binary([query_vector]),
+                    anns_field=BINARY_VECTOR_FIELD,
+                    param={"metric_type": "HAMMING", "params": {"nprobe": 16}},
+                    limit=min(top_k * settings.MILVUS_BINARY_RERANK_FACTOR, 16384),
+                    expr=expr,
+                    output_fields=output_fields + ["vector"],
+                )
+                hits = list(results[0])
+                if not hits:
+                    return []
+                candidates = decode_from_storage([hit.entity.get("vector") for hit in hits], self.storage_type)
+                distances = l2_rerank(query_vector, candidates)
+                order = distances.argsort()[:top_k]
+                return self._format_hits([hits[i] for i in order], [float(distances[i]) for i in order])
+
+            search_params = {"metric_type": "L2",
+                             "params": {"nprobe": 16}# nprobe是查询时要搜索的聚类数量
+                             }
             results = self.collection.search(
-                data=[query_vector],
+                data=encode_for_storage([query_vector], self.storage_type),
                 anns_field="vector",
                 param=search_params,
                 limit=top_k,
                 expr=expr,
-                output_fields=["file_id", "chunk_text", "knowledge_base_id"],
+                output_fields=output_fields,
             )
-            # 解析并且格式化结果
-            formatted_results = []
-            for hit in results[0]: # results[0] 对应第一个查询向量的结果
-                entity = hit.entity
-                formatted_results.append({
-                    "id": hit.id,
-                    "distance": hit.distance,
-                    "file_id": entity.get("file_id"),
-                    "knowledge_base_id": entity.get("knowledge_base_id"),
-                    "chunk_text": entity.get("chunk_text"),
-                })
-            return formatted_results
+            # 解析并且格式化结果，results[0] 对应第一个查询向量的结果
+            hits = list(results[0])
+            return self._format_hits(hits, [hit.distance for hit in hits])
         except Exception as e:
             logger.error(f"向量搜索失败: {e}")
             return []
 
-    async def delete_by_file_id(self, file_id: int) -> int:
+    def _format_hits(self, hits: list, distances: List[float]) -> List[Dict[str, Any]]:
         """
-        根据文件ID删除相关的向量记录
+        把最终的搜索命中格式化为字典，外部文本存储模式下只为这些命中读取文本
+        :param hits:
+        :param distances:
+        :return:
+        """
+        entities = [hit.entity for hit in hits]
+        texts = self.fetch_texts([{self.text_field: entity.get(self.text_field)} for entity in entities])
+        return [
+            {
+                "id": hit.id,
+                "distance": distance,
+                "file_id": entity.get("file_id"),
+                "knowledge_base_id": entity.get("knowledge_base_id"),
+                "chunk_text": text,
+            }
+            for hit, entity, distance, text in zip(hits, entities, distances, texts)
+            # 文件删除时文本块立即删除、Milvus中的删除稍后才对搜索可见，跳过这些命中
+            if text is not None
+        ]
+
+    def clone_file_vectors(self, source_file_id: int, target_file_id: int, target_knowledge_base_id: Optional[int],
+                           batch_size: int = 1000) -> int:
+        """
+        在服务端复制一个文件的全部向量到新的文件ID/知识库ID下，不需要重新向量化
+        按页读取源文件的向量，每页整批写入
+        :param source_file_id: 源文件ID
+        :param target_file_id: 目标文件ID
+        :param target_knowledge_base_id: 目标知识库ID
+        :param batch_size: 每页读取的行数
+        :return: 复制的向量数量
+        """
+        self.refresh_alias()
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size,
+            expr=f"file_id == {source_file_id}",
+            output_fields=[self.text_field, "vector"],
+        )
+        cloned = 0
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                columns = [
+                    [target_file_id] * len(rows),
+                    [target_knowledge_base_id] * len(rows),
+                    self.fetch_texts(rows),
+                    # 半精度的编解码是无损的，这里统一解码后按当前存储类型重新编码
+                    decode_from_storage([row["vector"] for row in rows], self.storage_type),
+                ]
+                self.insert_columns(columns)
+                cloned += len(rows)
+        finally:
+            iterator.close()
+        logger.info(f"从File ID {source_file_id} 复制了 {cloned} 条向量到File ID {target_file_id}")
+        return cloned
+
+    def delete_file_vectors(self, file_id: int) -> int:
+        """
+        同步删除某个文件的全部向量（不flush），用于重新向量化前清理旧数据，保证重试幂等
         :param file_id: 文件ID
         :return: 被删除的记录数量
         """
-        expr = f"file_id == {file_id}"
-        try:
-            delete_result = self.collection.delete(expr)
-            self.collection.flush()
-            logger.info(f"从Milvus中删除了 {delete_result.delete_count} 条与File ID {file_id} 相关的记录。")
-            return delete_result.delete_count
-        except Exception as e:
-            logger.error(f"删除数据失败: {e}")
+        self.refresh_alias()
+        delete_result = self.collection.delete(f"file_id == {file_id}")
+        if self.external_text:
+            chunk_text_store.delete_file(self.collection_name, file_id)
+        if delete_result.delete_count:
+            logger.info(f"重新向量化前删除了File ID {file_id} 的 {delete_result.delete_count} 条旧记录")
+        return delete_result.delete_count
+
+    def delete_files(self, file_ids: List[int], batch_size: int = settings.MILVUS_DELETE_BATCH_SIZE) -> int:
+        """
+        批量删除多个文件的向量：按批使用 file_id in [...] 表达式删除，全部删除后只flush一次
+        :param file_ids: 文件ID列表
+        :param batch_size: 每个删除表达式中的文件数量
+        :return: 被删除的记录数量
+        """
+        file_ids = sorted(set(file_ids))
+        if not file_ids:
             return 0
+        self.refresh_alias()
+        deleted = 0
+        for start in range(0, len(file_ids), batch_size):
+            batch = file_ids[start:start + batch_size]
+            deleted += self.collection.delete(f"file_id in {batch}").delete_count
+        self.collection.flush()
+        if self.external_text:
+            chunk_text_store.delete_files(self.collection_name, file_ids)
+        logger.info(f"从Milvus中批量删除了 {len(file_ids)} 个文件的 {deleted} 条记录")
+        return deleted
+
+    def delete_knowledge_base(self, knowledge_base_id: int) -> int:
+        """
+        删除一个知识库的全部向量，只执行一次删除和flush
+        :param knowledge_base_id: 知识库ID
+        :return: 被删除的记录数量
+        """
+        self.refresh_alias()
+        expr = f"knowledge_base_id == {knowledge_base_id}"
+        # 外部文本存储按文件归属文本块，删除前先查出涉及的文件（包括没有文件记录的批量导入数据）
+        file_ids = self._file_ids_matching(expr) if self.external_text else []
+        deleted = self.collection.delete(expr).delete_count
+        self.collection.flush()
+        if file_ids:
+            chunk_text_store.delete_files(self.collection_name, file_ids)
+        logger.info(f"从Milvus中删除了知识库 {knowledge_base_id} 的 {deleted} 条记录")
+        return deleted
+
+    def _file_ids_matching(self, expr: str, batch_size: int = 5000) -> List[int]:
+        """
+        查询满足条件的记录涉及的文件ID
+        :param expr:
+        :param batch_size:
+        :return:
+        """
+        file_ids = set()
+        iterator = self.collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=["file_id"])
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                file_ids.update(row["file_id"] for row in rows)
+        finally:
+            iterator.close()
+        return sorted(file_ids)
+
+    def deletion_stats(self) -> Dict[str, Any]:
+        """
+        已删除但尚未被compaction清理的记录统计
+        num_entities按已持久化的segment统计，包含已删除的记录；count(*)只统计可见的记录。
+        尚未flush的新数据只计入count(*)，此时估算值偏低
+        :return: 总记录数、可见记录数、已删除记录数及其占比
+        """
+        self.refresh_alias()
+        total = self.collection.num_entities
+        live = self.collection.query(expr="id >= 0", output_fields=["count(*)"])[0]["count(*)"]
+        deleted = max(total - live, 0)
+        return {
+            "collection": self.collection_name,
+            "total": total,
+            "live": live,
+            "deleted": deleted,
+            "deleted_ratio": deleted / total if total else 0.0,
+        }
+
+    def compact(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        触发compaction，清理已删除的记录、合并小segment
+        :param timeout: 等待完成的秒数，为None时不等待
+        :return: compaction ID、状态、计划数量
+        """
+        self.refresh_alias()
+        self.collection.compact()
+        result = {"compaction_id": self.collection.compaction_id}
+        if timeout is not None:
+            try:
+                self.collection.wait_for_compaction_completed(timeout=timeout)
+            except Exception as e:
+                logger.warning(f"等待compaction完成超时或失败，compaction ID: {result['compaction_id']}，错误信息: {e}")
+        state = self.collection.get_compaction_state()
+        result["state"] = str(state.state)
+        result["executing_plans"] = state.in_executing
+        result["completed_plans"] = state.completed
+        result["timeout_plans"] = state.in_timeout
+        return result
 
 milvus_service = MilvusService()
@@ -1,12 +1,102 @@
+import hashlib
+import hmac
+import io
 import logging
-from typing import Optional
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Iterator, List, Tuple, Dict
+from urllib.parse import quote
 
+import certifi
+import urllib3
 from minio import Minio
 from minio.error import S3Error
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# S3分片上传允许的最大分片数
+MAX_MULTIPART_PARTS = 10000
+
+
+def _uri_encode(value: str, safe: str = "") -> str:
+    """
+    按SigV4规则进行URI编码（只保留RFC3986非保留字符）
+    """
+    return quote(value, safe="-_.~" + safe)
+
+
+class MultipartUploadSigner:
+    """
+    在本地批量计算分片上传的预签名URL（AWS SigV4 query string签名）
+
+    每个URL都带有uploadId和partNumber，只能用于上传对应分片。
+    签名密钥、规范请求的公共部分在构造时只计算一次，每个分片只需一次SHA256和一次HMAC。
+    """
+
+    def __init__(self, endpoint: str, secure: bool, access_key: str, secret_key: str, region: str,
+                 bucket_name: str, object_name: str, upload_id: str, expires_in_seconds: int,
+                 now: Optional[datetime] = None):
+        now = now or datetime.now(timezone.utc)
+        scheme = "https" if secure else "http"
+        host = endpoint
+        # 默认端口不参与签名
+        if (secure and host.endswith(":443")) or (not secure and host.endswith(":80")):
+            host = host.rsplit(":", 1)[0]
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        self._scope = f"{date_stamp}/{region}/s3/aws4_request"
+        self._amz_date = amz_date
+        self._signing_key = self._derive_signing_key(secret_key, date_stamp, region)
+        canonical_uri = _uri_encode(f"/{bucket_name}/{object_name}", safe="/")
+        # 规范查询串按参数名的ASCII顺序排列：X-Amz-* < partNumber < uploadId
+        self._query_prefix = "&".join([
+            "X-Amz-Algorithm=AWS4-HMAC-SHA256",
+            f"X-Amz-Credential={_uri_encode(f'{access_key}/{self._scope}')}",
+            f"X-Amz-Date={amz_date}",
+            f"X-Amz-Expires={expires_in_seconds}",
+            "X-Amz-SignedHeaders=host",
+        ]) + "&partNumber="
+        self._query_suffix = f"&uploadId={_uri_encode(upload_id)}"
+        self._request_prefix = f"PUT\n{canonical_uri}\n"
+        self._request_suffix = f"\nhost:{host}\n\nhost\nUNSIGNED-PAYLOAD"
+        self._sts_prefix = f"AWS4-HMAC-SHA256\n{amz_date}\n{self._scope}\n"
+        self._url_prefix = f"{scheme}://{host}{canonical_uri}?"
+
+    @staticmethod
+    def _derive_signing_key(secret_key: str, date_stamp: str, region: str) -> bytes:
+        key = f"AWS4{secret_key}".encode("utf-8")
+        for value in (date_stamp, region, "s3", "aws4_request"):
+            key = hmac.new(key, value.encode("utf-8"), hashlib.sha256).digest()
+        return key
+
+    def sign(self, part_number: int) -> str:
+        """
+        生成单个分片的预签名URL
+        :param part_number: 分片序号，从1开始
+        :return:
+        """
+        query = f"{self._query_prefix}{part_number}{self._query_suffix}"
+        canonical_request = f"{self._request_prefix}{query}{self._request_suffix}"
+        string_to_sign = self._sts_prefix + hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        signature = hmac.new(self._signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"{self._url_prefix}{query}&X-Amz-Signature={signature}"
+
+    def sign_range(self, start_part_number: int, count: int) -> List[Dict[str, object]]:
+        """
+        批量生成一段连续分片的预签名URL
+        :param start_part_number: 起始分片序号
+        :param count: 数量
+        :return: [{"part_number": int, "url": str}]
+        """
+        end = min(start_part_number + count, MAX_MULTIPART_PARTS + 1)
+        return [{"part_number": n, "url": self.sign(n)} for n in range(start_part_number, end)]
+
+
 class MinioService:
     """
     用于于minio交互的service层
@@ -16,11 +106,22 @@ class MinioService:
         初始化minio
         """
         try:
+            # 连接池大小需要覆盖并行分段下载的并发数
+            http_client = urllib3.PoolManager(
+                num_pools=4,
+                maxsize=max(settings.MINIO_DOWNLOAD_WORKERS * 2, 10),
+                timeout=urllib3.Timeout(connect=10, read=120),
+                cert_reqs="CERT_REQUIRED",
+                ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+                retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+            )
             self.client = Minio(
                 endpoint= settings.MINIO_ENDPOINT,
                 access_key= settings.MINIO_ACCESS_KEY,
                 secret_key= settings.MINIO_SECRET_KEY,
-                secure=settings.MINIO_SECURE
+                secure=settings.MINIO_SECURE,
+                region=settings.MINIO_REGION,
+                http_client=http_client
             )
             logger.info("初始化minio成功!")
         except Exception as e:
@@ -73,6 +174,37 @@ class MinioService:
             logger.error(f"为对象 '{object_name}' 生成预签名URL失败: {e}")
             return None
 
+    def generate_presigned_part_urls(self, bucket_name: str, object_name: str, upload_id: str,
+                                     start_part_number: int, count: int,
+                                     expires_in_minutes: int = 60) -> List[Dict[str, object]]:
+        """
+        批量生成分片上传的预签名URL，每个URL携带uploadId和partNumber，在本地一次性计算完成
+
+        :param bucket_name: 存储桶名称。
+        :param object_name: 对象名称。
+        :param upload_id: 分片上传任务ID。
+        :param start_part_number: 起始分片序号（从1开始）。
+        :param count: 需要生成的数量。
+        :param expires_in_minutes: URL的有效时间（分钟）。
+        :return: [{"part_number": int, "url": str}]
+        """
+        if start_part_number < 1 or start_part_number > MAX_MULTIPART_PARTS:
+            raise ValueError(f"分片序号必须在1到{MAX_MULTIPART_PARTS}之间")
+        signer = MultipartUploadSigner(
+            endpoint=settings.MINIO_ENDPOINT,
+            secure=settings.MINIO_SECURE,
+            access_key=settings.MINIO_ACCESS_KEY,
+            secret_key=settings.MINIO_SECRET_KEY,
+            region=settings.MINIO_REGION,
+            bucket_name=bucket_name,
+            object_name=object_name,
+            upload_id=upload_id,
+            expires_in_seconds=expires_in_minutes * 60,
+        )
+        urls = signer.sign_range(start_part_number, count)
+        logger.info(f"为对象 '{object_name}' 批量生成了{len(urls)}个分片上传URL（起始分片{start_part_number}）")
+        return urls
+
     def create_multipart_upload(self, bucket_name: str, object_name: str) -> Optional[str]:
         """
         初始化一个分片上传任务，并返回upload_id。
@@ -143,6 +275,45 @@ class MinioService:
             raise ConnectionError("MinIO client not initialized")
         return self.client.stat_object(bucket_name, object_name)
 
+    def upload_file(self, bucket_name: str, object_name: str, data: bytes, content_type: str = "application/octet-stream") -> bool:
+        """
+        上传一段二进制内容到MinIO。
+
+        :param bucket_name: 存储桶名称。
+        :param object_name: 对象名称。
+        :param data: 文件内容。
+        :param content_type: MIME类型。
+        :return: 是否上传成功。
+        """
+        if not self.client:
+            logger.error("MinIO客户端未初始化，无法上传文件。")
+            return False
+        try:
+            self.client.put_object(bucket_name, object_name, io.BytesIO(data), len(data), content_type=content_type)
+            logger.info(f"成功上传文件到MinIO: {object_name}")
+            return True
+        except S3Error as e:
+            logger.error(f"上传文件 {object_name} 到MinIO失败: {e}")
+            return False
+
+    def delete_file(self, bucket_name: str, object_name: str) -> bool:
+        """
+        删除MinIO中的一个对象。
+
+        :param bucket_name: 存储桶名称。
+        :param object_name: 对象名称。
+        :return: 是否删除成功。
+        """
+        if not self.client:
+            logger.error("MinIO客户端未初始化，无法删除文件。")
+            return False
+        try:
+            self.client.remove_object(bucket_name, object_name)
+            return True
+        except S3Error as e:
+            logger.error(f"删除MinIO文件 {object_name} 失败: {e}")
+            return False
+
     def download_file(self, bucket_name: str, object_name: str) -> Optional[bytes]:
         """
         从MinIO下载一个文件。
@@ -167,6 +338,149 @@ class MinioService:
                 response.close()
                 response.release_conn()
 
+    def download_to_file(self, bucket_name: str, object_name: str, file_path: str, chunk_size: int = 1024 * 1024) -> int:
+        """
+        把对象下载到本地文件，内存占用只与chunk_size有关，与文件大小无关
+        大于 MINIO_PARALLEL_DOWNLOAD_THRESHOLD 的对象按字节范围并行下载
+
+        :param bucket_name: 存储桶名称。
+        :param object_name: 对象名称。
+        :param file_path: 本地文件路径。
+        :param chunk_size: 每次读取的字节数。
+        :return: 写入的字节数。
+        """
+        if not self.client:
+            logger.error("MinIO客户端未初始化，无法下载文件。")
+            raise ConnectionError("MinIO client not initialized")
+        if settings.MINIO_DOWNLOAD_WORKERS > 1 and hasattr(os, "pwrite"):
+            stat = self.client.stat_object(bucket_name, object_name)
+            if stat.size >= settings.MINIO_PARALLEL_DOWNLOAD_THRESHOLD:
+                return self._parallel_download(bucket_name, object_name, file_path, stat.size, stat.etag, chunk_size)
+        response = self.client.get_object(bucket_name, object_name)
+        written = 0
+        try:
+            with open(file_path, "wb") as file:
+                for data in response.stream(chunk_size):
+                    file.write(data)
+                    written += len(data)
+        finally:
+            response.close()
+            response.release_conn()
+        logger.info(f"成功从MinIO流式下载文件: {object_name}，大小: {written} 字节")
+        return written
+
+    def _parallel_download(self, bucket_name: str, object_name: str, file_path: str, size: int, etag: str,
+                           chunk_size: int) -> int:
+        """
+        把对象切分为多个字节范围并发下载，用os.pwrite写入预分配的文件，最后校验ETag
+
+        :return: 写入的字节数。
+        """
+        part_size = settings.MINIO_DOWNLOAD_PART_SIZE
+        ranges = [(offset, min(part_size, size - offset)) for offset in range(0, size, part_size)]
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            # 预分配文件空间，各分段直接写入各自的偏移位置
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+
+            def fetch(byte_range: Tuple[int, int]) -> int:
+                offset, length = byte_range
+                # If-Match保证下载过程中对象没有被覆盖
+                response = self.client.get_object(bucket_name, object_name, offset=offset, length=length,
+                                                  request_headers={"If-Match": etag})
+                position = offset
+                try:
+                    for data in response.stream(chunk_size):
+                        view = memoryview(data)
+                        while view:
+                            written_bytes = os.pwrite(fd, view, position)
+                            position += written_bytes
+                            view = view[written_bytes:]
+                finally:
+                    response.close()
+                    response.release_conn()
+                if position - offset != length:
+                    raise IOError(f"分段下载不完整: offset={offset}, 期望{length}字节, 实际{position - offset}字节")
+                return length
+
+            with ThreadPoolExecutor(max_workers=settings.MINIO_DOWNLOAD_WORKERS) as executor:
+                written = sum(executor.map(fetch, ranges))
+        finally:
+            os.close(fd)
+        self._verify_etag(bucket_name, object_name, file_path, size, etag)
+        logger.info(f"成功从MinIO并行下载文件: {object_name}，大小: {written} 字节，分段数: {len(ranges)}")
+        return written
+
+    def _verify_etag(self, bucket_name: str, object_name: str, file_path: str, size: int, etag: str):
+        """
+        校验下载文件与对象ETag一致
+        普通对象的ETag为内容的MD5；分片上传对象的ETag为各分片MD5拼接后的MD5加"-分片数"，
+        分片大小通过查询第1个分片的大小获得
+
+        :return:
+        """
+        etag = etag.strip('"')
+        if not re.fullmatch(r"[0-9a-f]{32}(-\d+)?", etag):
+            # 服务端加密等场景下ETag不是MD5，只能校验大小
+            if os.path.getsize(file_path) != size:
+                raise IOError(f"下载文件校验失败: {object_name}，大小不一致")
+            logger.warning(f"对象 '{object_name}' 的ETag不是MD5格式，仅校验了文件大小")
+            return
+        if "-" in etag:
+            part_count = int(etag.split("-")[1])
+            first_part = self.client.stat_object(bucket_name, object_name, extra_query_params={"partNumber": "1"})
+            part_sizes = self._split_sizes(size, first_part.size, part_count)
+        else:
+            part_sizes = [size]
+        digests: List[bytes] = []
+        with open(file_path, "rb") as file:
+            for part_size in part_sizes:
+                md5 = hashlib.md5()
+                remaining = part_size
+                while remaining:
+                    data = file.read(min(remaining, 8 * 1024 * 1024))
+                    if not data:
+                        break
+                    md5.update(data)
+                    remaining -= len(data)
+                digests.append(md5.digest())
+        if "-" in etag:
+            actual = f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+        else:
+            actual = digests[0].hex()
+        if actual != etag:
+            raise IOError(f"下载文件校验失败: {object_name}，ETag期望{etag}，实际{actual}")
+
+    @staticmethod
+    def _split_sizes(size: int, part_size: int, part_count: int) -> List[int]:
+        """
+        按分片大小计算每个分片的字节数（最后一个分片可能更小）
+        """
+        sizes = [part_size] * (part_count - 1)
+        sizes.append(size - part_size * (part_count - 1))
+        return sizes
+
+    @contextmanager
+    def download_to_temp_file(self, bucket_name: str, object_name: str, suffix: Optional[str] = None) -> Iterator[str]:
+        """
+        上下文管理器：把对象流式下载到临时文件并返回路径，退出时自动删除临时文件
+
+        :param bucket_name: 存储桶名称。
+        :param object_name: 对象名称。
+        :param suffix: 临时文件后缀，部分加载器依赖扩展名识别文件类型。
+        :return: 临时文件路径。
+        """
+        fd, temp_path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            self.download_to_file(bucket_name, object_name, temp_path)
+            yield temp_path
+        finally:
+            os.unlink(temp_path)
+
     def generate_presigned_download_url(self, bucket_name: str, object_name: str, expires_in_minutes: int = 60) -> Optional[str]:
         """
         生成一个用于GET请求的预签名下载URL。
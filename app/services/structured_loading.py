@@ -0,0 +1,97 @@
+import csv
+import logging
+from collections import defaultdict
+from itertools import islice
+from typing import Any, Dict, Iterator, List
+
+import ijson
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.core.constants import SupportedMimeTypes
+
+"""
+JSON/CSV 流式加载
+
+JSONLoader/CSVLoader会一次性把整个文件读成Document列表，几个GB的对话数据会耗尽内存。
+这里用ijson和csv模块逐条读取记录，按模板拼接成文本后惰性生成Document，内存占用与文件大小无关。
+"""
+logger = logging.getLogger(__name__)
+
+STREAMING_MIME_TYPES = {SupportedMimeTypes.JSON.value, SupportedMimeTypes.CSV.value}
+
+
+def render_template(template: str, record: Dict[str, Any]) -> str:
+    """
+    按模板把一条记录拼接为文本
+    :param template: 字段名用{}引用，缺失的字段为空；为空时按 "字段: 值" 逐行拼接全部字段
+    :param record:
+    :return:
+    """
+    if not template:
+        return "\n".join(f"{key}: {value}" for key, value in record.items() if value not in (None, ""))
+    return template.format_map(defaultdict(str, record))
+
+
+def iter_json_records(file_path: str, item_path: str = settings.STRUCTURED_JSON_ITEM_PATH) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取JSON中的条目
+    :param file_path:
+    :param item_path: ijson条目路径
+    :return:
+    """
+    with open(file_path, "rb") as file:
+        for item in ijson.items(file, item_path, use_float=True):
+            yield item if isinstance(item, dict) else {"value": item}
+
+
+def iter_csv_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取CSV的行，首行为表头
+    :param file_path:
+    :return:
+    """
+    with open(file_path, newline="", encoding="utf-8-sig") as file:
+        yield from csv.DictReader(file)
+
+
+def iter_structured_documents(
+        file_path: str,
+        mime_type: str,
+        template: str = settings.STRUCTURED_TEXT_TEMPLATE,
+        item_path: str = settings.STRUCTURED_JSON_ITEM_PATH,
+) -> Iterator[Document]:
+    """
+    逐条生成Document，元数据中带有记录序号
+    :param file_path:
+    :param mime_type: JSON / CSV
+    :param template: 记录拼接模板
+    :param item_path: JSON条目路径
+    :return:
+    """
+    if mime_type == SupportedMimeTypes.JSON.value:
+        records = iter_json_records(file_path, item_path)
+    elif mime_type == SupportedMimeTypes.CSV.value:
+        records = iter_csv_records(file_path)
+    else:
+        raise ValueError(f"MIME Type {mime_type} 不支持流式加载")
+    count = 0
+    for count, record in enumerate(records, start=1):
+        text = render_template(template, record)
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": file_path, "row": count - 1})
+    logger.info(f"流式加载完成: {file_path}，记录数: {count}")
+
+
+def iter_document_batches(docs: Iterator[Document], batch_items: int = settings.STRUCTURED_BATCH_ITEMS) -> Iterator[List[Document]]:
+    """
+    把Document按批分组，供切分使用
+    :param docs:
+    :param batch_items:
+    :return:
+    """
+    while True:
+        batch = list(islice(docs, batch_items))
+        if not batch:
+            return
+        yield batch
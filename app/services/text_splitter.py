@@ -0,0 +1,177 @@
+import logging
+import re
+from typing import Callable, Iterator, List, Optional, Tuple
+
+"""
+面向中文的按token切分器
+
+- 以句子为最小单位（。！？!?；; 和换行），段落（空行）处优先断开
+- 按embedding模型的token数控制文本块大小，而不是字符数
+- 每个文档只扫描一次：先用正则一次性得到所有句子的起止位置并计算token数，
+  再按位置贪心打包，输出时每个文本块只做一次切片，整体为线性时间
+- 超长句子依次按逗号等次级标点、再按固定长度窗口切开
+
+本模块只依赖标准库（可选依赖dashscope分词器），可以在进程池的子进程中使用。
+"""
+logger = logging.getLogger(__name__)
+
+# 句子：到句末标点（连同紧随的引号/括号）为止，或到换行为止
+_SENTENCE = re.compile(r"[^。！？!?；;…\n]*(?:[。！？!?；;…]+[”’」』)）\]]*|\n+|$)")
+# 超长句子的次级断点
+_CLAUSE = re.compile(r"[^，,、：:\s]*(?:[，,、：:]|\s+|$)")
+# 统计token数时的中日韩字符
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]")
+_WORD = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_぀-ヿ㐀-䶿一-鿿豈-﫿가-힯]")
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    不依赖分词器的token数估算：每个中日韩字符约1个token，英文单词按每4个字符1个token，其他符号各1个
+    对通义系列的BPE分词器略微高估，保证文本块不会超过接口限制
+    :param text:
+    :return:
+    """
+    tokens = len(_CJK.findall(text))
+    for match in _WORD.finditer(text):
+        length = match.end() - match.start()
+        tokens += (length + 3) // 4
+    return tokens
+
+
+def get_token_counter(name: str = "estimate") -> TokenCounter:
+    """
+    获取token计数函数
+    :param name: estimate（估算）或 dashscope（通义千问分词器，需要安装tiktoken）
+    :return:
+    """
+    if name == "dashscope":
+        try:
+            from dashscope import get_tokenizer
+            tokenizer = get_tokenizer("qwen-turbo")
+            return lambda text: len(tokenizer.encode(text))
+        except Exception as e:
+            logger.warning(f"加载dashscope分词器失败，使用估算方式计算token数: {e}")
+    return estimate_tokens
+
+
+class ChineseTokenTextSplitter:
+    """
+    按句子边界和token数切分文本
+    """
+
+    def __init__(
+            self,
+            chunk_tokens: int = 512,
+            overlap_tokens: int = 64,
+            token_counter: Optional[TokenCounter] = None,
+    ):
+        """
+        :param chunk_tokens: 每个文本块的最大token数
+        :param overlap_tokens: 相邻文本块之间重叠的最大token数（以整句为单位）
+        :param token_counter: token计数函数，默认使用估算
+        """
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens必须小于chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = token_counter or estimate_tokens
+
+    def _segments(self, text: str) -> Iterator[Tuple[int, int, int, bool]]:
+        """
+        扫描句子，超长句子切成不超过chunk_tokens的片段
+        :return: (起始位置, 结束位置, token数, 之后是否为段落边界)
+        """
+        for match in _SENTENCE.finditer(text):
+            start, end = match.span()
+            if start == end:
+                continue
+            sentence = match.group()
+            if not sentence.strip():
+                # 纯空行：标记前一句之后为段落边界
+                yield start, end, 0, sentence.count("\n") > 1
+                continue
+            paragraph_end = sentence.endswith("\n\n")
+            tokens = self.count_tokens(sentence)
+            if tokens <= self.chunk_tokens:
+                yield start, end, tokens, paragraph_end
+            else:
+                yield from self._split_long(text, start, end, paragraph_end)
+
+    def _split_long(self, text: str, start: int, end: int, paragraph_end: bool) -> Iterator[Tuple[int, int, int, bool]]:
+        """
+        超长句子先按次级标点打包，单个分句仍然超长时按字符窗口切开
+        """
+        pieces = []
+        for match in _CLAUSE.finditer(text, start, end):
+            piece_start, piece_end = match.span()
+            if piece_start == piece_end:
+                continue
+            tokens = self.count_tokens(match.group())
+            if tokens <= self.chunk_tokens:
+                pieces.append((piece_start, piece_end, tokens))
+                continue
+            # 按平均每token字符数估算窗口大小
+            window = max(1, (piece_end - piece_start) * self.chunk_tokens // tokens)
+            for window_start in range(piece_start, piece_end, window):
+                window_end = min(window_start + window, piece_end)
+                pieces.append((window_start, window_end, self.count_tokens(text[window_start:window_end])))
+        # 相邻分句合并到不超过chunk_tokens
+        current_start, current_end, current_tokens = pieces[0]
+        for piece_start, piece_end, tokens in pieces[1:]:
+            if current_tokens + tokens <= self.chunk_tokens:
+                current_end = piece_end
+                current_tokens += tokens
+            else:
+                yield current_start, current_end, current_tokens, False
+                current_start, current_end, current_tokens = piece_start, piece_end, tokens
+        yield current_start, current_end, current_tokens, paragraph_end
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        切分文本
+        :param text:
+        :return: 文本块列表
+        """
+        segments = list(self._segments(text))
+        chunks = []
+        # 当前文本块覆盖 segments[first:last]
+        first = 0
+        tokens = 0
+        # 最近一个位于文本块后半部分的段落边界，到达上限时优先在此断开
+        paragraph_break = None
+        last = 0
+        while last < len(segments):
+            segment_tokens = segments[last][2]
+            if tokens + segment_tokens > self.chunk_tokens and tokens > 0:
+                cut = paragraph_break if paragraph_break is not None else last
+                chunks.append(text[segments[first][0]:segments[cut - 1][1]])
+                # 从断点往回取整句作为重叠部分
+                overlap = 0
+                next_first = cut
+                while next_first - 1 > first and overlap + segments[next_first - 1][2] <= self.overlap_tokens:
+                    next_first -= 1
+                    overlap += segments[next_first][2]
+                first = next_first
+                tokens = overlap
+                # 重叠部分加上下一句仍然超长时，缩减重叠，避免产生只有重叠内容的文本块
+                while first < cut and tokens + segments[cut][2] > self.chunk_tokens:
+                    tokens -= segments[first][2]
+                    first += 1
+                last = cut
+                paragraph_break = None
+                continue
+            tokens += segment_tokens
+            last += 1
+            if segments[last - 1][3] and tokens * 2 >= self.chunk_tokens:
+                paragraph_break = last
+        if first < len(segments) and tokens > 0:
+            chunks.append(text[segments[first][0]:segments[-1][1]])
+        return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+    def split_texts(self, texts: List[str]) -> List[str]:
+        chunks = []
+        for text in texts:
+            chunks.extend(self.split_text(text))
+        return chunks
@@ -0,0 +1,147 @@
+from enum import Enum
+from typing import List, Sequence, Any
+
+import numpy as np
+
+"""
+向量存储编码
+
+负责把embedding模型输出的float32向量编码为Milvus中实际存储的格式，
+以及在重排序时把存储格式解码回float32：
+- float: 原始float32，每维4字节
+- float16 / bfloat16: 半精度，每维2字节
+- binary: 按符号量化的二值向量（每维1bit）用于粗排，另存一份float16用于精排
+"""
+
+
+class VectorStorageType(str, Enum):
+    """
+    向量存储类型枚举
+    """
+    FLOAT = "float"
+    FLOAT16 = "float16"
+    BFLOAT16 = "bfloat16"
+    BINARY = "binary"
+
+
+def bytes_per_vector(storage_type: VectorStorageType, dim: int, mmap_enabled: bool = False) -> int:
+    """
+    计算单条向量在查询节点内存中占用的字节数（不含索引结构开销）
+    binary模式的float16精排副本建有FLAT索引并随Collection加载到内存，只有开启mmap时才不计入
+    :param storage_type: 存储类型
+    :param dim: 向量维度
+    :param mmap_enabled: 是否开启了mmap（精排副本从磁盘映射）
+    :return:
+    """
+    if storage_type == VectorStorageType.FLOAT:
+        return dim * 4
+    if storage_type in (VectorStorageType.FLOAT16, VectorStorageType.BFLOAT16):
+        return dim * 2
+    return dim // 8 + (0 if mmap_enabled else dim * 2)
+
+
+def to_float16(vectors: Sequence[Sequence[float]]) -> List[np.ndarray]:
+    """
+    转换为float16，pymilvus接受float16类型的numpy数组
+    :param vectors:
+    :return:
+    """
+    matrix = np.asarray(vectors, dtype=np.float32).astype(np.float16)
+    return list(matrix)
+
+
+def to_bfloat16(vectors: Sequence[Sequence[float]]) -> List[bytes]:
+    """
+    转换为bfloat16字节串（取float32的高16位，按最近偶数舍入）
+    numpy没有原生bfloat16类型，pymilvus接受按行的bytes
+    :param vectors:
+    :return:
+    """
+    bits = np.ascontiguousarray(vectors, dtype=np.float32).view(np.uint32)
+    rounded = (bits + np.uint32(0x7FFF) + ((bits >> 16) & np.uint32(1))) >> 16
+    matrix = rounded.astype(np.uint16)
+    return [row.tobytes() for row in matrix]
+
+
+def to_binary(vectors: Sequence[Sequence[float]]) -> List[bytes]:
+    """
+    按符号量化为二值向量：大于0的维度为1，其余为0，每8维打包成1字节
+    :param vectors:
+    :return:
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    packed = np.packbits(matrix > 0, axis=1)
+    return [row.tobytes() for row in packed]
+
+
+def encode_for_storage(vectors: Sequence[Sequence[float]], storage_type: VectorStorageType) -> List[Any]:
+    """
+    把float向量编码为`vector`字段的存储格式
+    binary模式下`vector`字段保存float16精排副本，二值向量由to_binary单独生成
+    :param vectors:
+    :param storage_type:
+    :return:
+    """
+    if storage_type == VectorStorageType.FLOAT:
+        return [list(map(float, vector)) for vector in vectors]
+    if storage_type == VectorStorageType.BFLOAT16:
+        return to_bfloat16(vectors)
+    return to_float16(vectors)
+
+
+def decode_from_storage(raw_vectors: Sequence[Any], storage_type: VectorStorageType) -> np.ndarray:
+    """
+    把从Milvus查询出的`vector`字段解码为float32矩阵
+    半精度向量可能以bytes、numpy数组或[bytes]的形式返回，这里统一处理
+    :param raw_vectors:
+    :param storage_type:
+    :return:
+    """
+    rows = []
+    for raw in raw_vectors:
+        if isinstance(raw, list) and len(raw) == 1 and isinstance(raw[0], (bytes, bytearray)):
+            raw = raw[0]
+        if isinstance(raw, (bytes, bytearray)):
+            if storage_type == VectorStorageType.BFLOAT16:
+                halves = np.frombuffer(raw, dtype=np.uint16).astype(np.uint32) << 16
+                rows.append(halves.view(np.float32))
+            else:
+                rows.append(np.frombuffer(raw, dtype=np.float16).astype(np.float32))
+        else:
+            rows.append(np.asarray(raw, dtype=np.float32))
+    return np.vstack(rows) if rows else np.empty((0, 0), dtype=np.float32)
+
+
+def roundtrip(vectors: np.ndarray, storage_type: VectorStorageType) -> np.ndarray:
+    """
+    模拟一次编码再解码，用于离线评估精度损失
+    :param vectors:
+    :param storage_type:
+    :return:
+    """
+    if storage_type == VectorStorageType.FLOAT:
+        return np.asarray(vectors, dtype=np.float32)
+    return decode_from_storage(encode_for_storage(vectors, storage_type), storage_type)
+
+
+def hamming_distances(query_bits: np.ndarray, candidate_bits: np.ndarray) -> np.ndarray:
+    """
+    计算一条打包二值向量与一组候选之间的汉明距离
+    :param query_bits: (dim/8,) uint8
+    :param candidate_bits: (n, dim/8) uint8
+    :return: (n,) 距离数组
+    """
+    xor = np.bitwise_xor(candidate_bits, query_bits)
+    return np.unpackbits(xor, axis=1).sum(axis=1)
+
+
+def l2_rerank(query_vector: Sequence[float], candidates: np.ndarray) -> np.ndarray:
+    """
+    对候选向量按与查询向量的L2距离（平方）精确重排序
+    :param query_vector:
+    :param candidates: (n, dim) float32
+    :return: 与candidates对应的距离数组
+    """
+    query = np.asarray(query_vector, dtype=np.float32)
+    diff = candidates - query
+    return np.einsum("ij,ij->i", diff, diff)
@@ -0,0 +1,136 @@
+import logging
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+"""
+向量存储接口
+
+VECTOR_STORE_BACKEND 选择实现：
+- milvus: MilvusService，首次使用时才连接Milvus
+- local: LocalVectorStore，进程内的NumPy向量库，数据以mmap方式从 LOCAL_VECTOR_STORE_PATH 读取，
+  适合小规模部署和没有Milvus的离线环境
+向量化、检索、删除等业务代码只依赖本接口；Collection版本管理、BulkInsert等运维脚本仍直接使用Milvus
+"""
+logger = logging.getLogger(__name__)
+
+
+class VectorStore(ABC):
+    """
+    文本块向量的存储与检索，列数据按 file_id, knowledge_base_id, chunk_text, vector 的顺序组织
+    实现需提供 storage_type（VectorStorageType）和 external_text（文本是否保存在外部文本存储中）属性，
+    检索侧据此选择检索路径
+    """
+
+    def refresh_alias(self, force: bool = False):
+        """
+        存储的当前版本可能在运行时切换时（Milvus别名），检查并重新绑定；默认无操作
+        :param force:
+        :return:
+        """
+
+    @abstractmethod
+    async def insert(self, entities: List[Dict[str, Any]]) -> List[int]:
+        """
+        批量插入实体并持久化
+        :param entities: 字典列表，每个字典包含 'file_id', 'knowledge_base_id', 'chunk_text', 'vector'
+        :return: 插入记录的ID列表
+        """
+
+    @abstractmethod
+    def insert_columns(self, columns: List[List[Any]]) -> List[int]:
+        """
+        以列式数据同步插入
+        :param columns: 按 file_id, knowledge_base_id, chunk_text, vector 顺序组织的列数据
+        :return: 插入记录的ID列表
+        """
+
+    @abstractmethod
+    def flush(self):
+        """
+        持久化已插入的数据，只应在批量写入结束时调用
+        :return:
+        """
+
+    @abstractmethod
+    async def search(self, query_vector: List[float], top_k: int = 5,
+                     knowledge_base_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按L2距离检索
+        :param query_vector: 查询向量
+        :param top_k: 返回的结果数量
+        :param knowledge_base_id: （可选）用于过滤的知识库id
+        :return: 每个结果包含 id, distance, file_id, knowledge_base_id, chunk_text
+        """
+
+    @abstractmethod
+    def clone_file_vectors(self, source_file_id: int, target_file_id: int, target_knowledge_base_id: Optional[int],
+                           batch_size: int = 1000) -> int:
+        """
+        复制一个文件的全部向量到新的文件ID/知识库ID下
+        :return: 复制的向量数量
+        """
+
+    @abstractmethod
+    def delete_file_vectors(self, file_id: int) -> int:
+        """
+        同步删除某个文件的全部向量（不持久化），用于重新向量化前清理旧数据
+        :return: 被删除的记录数量
+        """
+
+    async def delete_by_file_id(self, file_id: int) -> int:
+        """
+        根据文件ID删除相关的向量记录
+        :return: 被删除的记录数量
+        """
+        try:
+            return self.delete_files([file_id])
+        except Exception as e:
+            logger.error(f"删除数据失败: {e}")
+            return 0
+
+    @abstractmethod
+    def delete_files(self, file_ids: List[int], batch_size: int = settings.MILVUS_DELETE_BATCH_SIZE) -> int:
+        """
+        批量删除多个文件的向量，全部删除后只持久化一次
+        :return: 被删除的记录数量
+        """
+
+    @abstractmethod
+    def delete_knowledge_base(self, knowledge_base_id: int) -> int:
+        """
+        删除一个知识库的全部向量
+        :return: 被删除的记录数量
+        """
+
+    @abstractmethod
+    def deletion_stats(self) -> Dict[str, Any]:
+        """
+        已删除但尚未被compaction清理的记录统计
+        :return: 包含 collection, total, live, deleted, deleted_ratio
+        """
+
+    @abstractmethod
+    def compact(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        清理已删除的记录
+        :param timeout: 等待完成的秒数
+        :return: compaction结果
+        """
+
+
+@lru_cache(maxsize=None)
+def get_vector_store() -> VectorStore:
+    """
+    按 VECTOR_STORE_BACKEND 获取全局的向量存储实例
+    :return:
+    """
+    if settings.VECTOR_STORE_BACKEND == "local":
+        from app.services.local_vector_store import LocalVectorStore
+        return LocalVectorStore(settings.LOCAL_VECTOR_STORE_PATH)
+    if settings.VECTOR_STORE_BACKEND != "milvus":
+        raise ValueError(f"不支持的向量存储: {settings.VECTOR_STORE_BACKEND}")
+    from app.services.milvus_service import milvus_service
+    return milvus_service
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from bs4 import BeautifulSoup
+
+from app.core.config import settings
+
+"""
+网页抓取
+
+WebCrawler 基于httpx的异步客户端，在独立的事件循环线程中运行：
+- 连接池在所有请求间复用，大小有上限
+- 同一网站同时在途的请求数有上限，且相邻两次请求之间至少间隔 WEB_CRAWLER_PER_HOST_DELAY_SECONDS
+- 传入上次的ETag/Last-Modified时发送条件请求，未变化的网页返回304，不下载正文
+- 正文提取为纯文本并规范空白后计算哈希，页面中脚本、样式等无关变化不会被视为内容变化
+"""
+logger = logging.getLogger(__name__)
+
+# 正文提取时丢弃的标签
+_IGNORED_TAGS = ["script", "style", "noscript", "template", "svg"]
+
+
+@dataclass
+class FetchResult:
+    url: str
+    # HTTP状态码，网络错误时为0
+    status: int
+    text: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+def extract_text(data: bytes, content_type: str, charset: Optional[str] = None) -> str:
+    """
+    提取网页正文文本，去掉空行和首尾空白
+    :param data: 响应体
+    :param content_type: 响应的Content-Type
+    :param charset: 响应头中声明的编码，HTML未声明时由BeautifulSoup根据meta标签判断
+    :return:
+    """
+    if "html" in content_type or not content_type:
+        soup = BeautifulSoup(data, "html.parser", from_encoding=charset)
+        for tag in soup(_IGNORED_TAGS):
+            tag.decompose()
+        text = soup.get_text(separator="\n")
+    else:
+        text = data.decode(charset or "utf-8", errors="replace")
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class WebCrawler:
+    """
+    连接池化、对每个网站限速的异步网页抓取客户端
+    """
+
+    def __init__(
+            self,
+            max_connections: int = settings.WEB_CRAWLER_MAX_CONNECTIONS,
+            per_host_concurrency: int = settings.WEB_CRAWLER_PER_HOST_CONCURRENCY,
+            per_host_delay_seconds: float = settings.WEB_CRAWLER_PER_HOST_DELAY_SECONDS,
+            timeout_seconds: float = settings.WEB_CRAWLER_TIMEOUT_SECONDS,
+            max_bytes: int = settings.WEB_CRAWLER_MAX_BYTES,
+            user_agent: str = settings.WEB_CRAWLER_USER_AGENT,
+            transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        :param transport: 自定义的httpx传输层（如测试用的httpx.MockTransport），默认使用网络
+        """
+        self.max_connections = max_connections
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_delay_seconds = per_host_delay_seconds
+        self.max_bytes = max_bytes
+        self._timeout = timeout_seconds
+        self._headers = {"User-Agent": user_agent}
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        # 以下状态只在事件循环线程中访问
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_next_request_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        懒加载后台事件循环线程和httpx客户端
+        :return:
+        """
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="web-crawler-loop", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _open(self):
+        self._client = httpx.AsyncClient(
+            headers=self._headers,
+            timeout=self._timeout,
+            follow_redirects=True,
+            transport=self._transport,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+
+    @asynccontextmanager
+    async def _polite(self, host: str):
+        """
+        获取对某个网站发起请求的许可：限制并发数，并保证相邻请求的最小间隔
+        :param host:
+        :return:
+        """
+        semaphore = self._host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+        async with semaphore:
+            now = time.monotonic()
+            # 先预约下一次请求的时间再等待，多个协程依次排开
+            scheduled = max(now, self._host_next_request_at.get(host, 0.0))
+            self._host_next_request_at[host] = scheduled + self.per_host_delay_seconds
+            if scheduled > now:
+                await asyncio.sleep(scheduled - now)
+            yield
+
+    async def afetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        """
+        抓取一个网页，必须在客户端的事件循环中调用
+        :param url:
+        :param etag: 上次的ETag，传入时发送If-None-Match
+        :param last_modified: 上次的Last-Modified，传入时发送If-Modified-Since
+        :return: 失败时error不为空，不抛出异常
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        started = time.monotonic()
+        async with self._polite(urlsplit(url).netloc):
+            try:
+                async with self._client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304:
+                        return FetchResult(url, 304, etag=response.headers.get("etag", etag),
+                                           last_modified=response.headers.get("last-modified", last_modified))
+                    if response.status_code != 200:
+                        return FetchResult(url, response.status_code, error=f"HTTP {response.status_code}")
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) > self.max_bytes:
+                            return FetchResult(url, response.status_code, error=f"网页超过大小上限 {self.max_bytes} 字节")
+            except httpx.HTTPError as e:
+                return FetchResult(url, 0, error=f"网络错误: {e}")
+        text = extract_text(bytes(body), response.headers.get("content-type", ""), response.charset_encoding)
+        logger.info(f"网页抓取完成: {url}，大小: {len(body)} 字节，耗时: {time.monotonic() - started:.2f}s")
+        return FetchResult(
+            url,
+            200,
+            text=text,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            content_hash=text_hash(text),
+        )
+
+    def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        """
+        同步接口，供worker线程调用
+        """
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.afetch(url, etag, last_modified), loop).result()
+
+    def fetch_many(self, requests: List[Tuple[str, Optional[str], Optional[str]]]) -> List[FetchResult]:
+        """
+        并发抓取多个网页，整体并发受连接池限制，同一网站的请求按限速依次发出
+        :param requests: [(url, etag, last_modified)]
+        :return: 与requests一一对应
+        """
+        if not requests:
+            return []
+
+        async def fetch_all():
+            return await asyncio.gather(*(self.afetch(*request) for request in requests))
+
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(fetch_all(), loop).result()
+
+    def close(self):
+        """
+        关闭连接池和事件循环
+        :return:
+        """
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._client = None
+            self._host_semaphores.clear()
+            self._host_next_request_at.clear()
+
+
+# 创建一个全局的网页抓取客户端实例
+web_crawler = WebCrawler()
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlmodel import Session, select, or_
+
+from app.core.config import settings
+from app.core.constants import SupportedMimeTypes, FileStatus
+from app.db.db import engine
+from app.models.knowledge import KnowledgeFile, WebPage
+from app.services.ingestion_queue import ingestion_queue
+from app.services.web_crawler import web_crawler, FetchResult
+
+"""
+网页类型知识库文件的抓取状态与定期刷新
+
+- fetch_web_page: 向量化时抓取网页正文，并记录ETag/Last-Modified/正文哈希
+- refresh_web_pages: 对到期的网页发送条件请求，只有正文哈希变化的网页才重新入队向量化；
+  未变化（304或哈希相同）的网页只更新抓取时间。向量化失败的网页同样参与刷新，抓取成功即重新入队，
+  不会因一次失败永久停止更新
+- 刷新时抓取到的正文暂存在进程内，重新向量化在同一进程执行时直接使用，不再重复请求
+"""
+logger = logging.getLogger(__name__)
+
+# 刷新时抓取到的正文 {文件ID: (抓取结果, 抓取时的monotonic时间)}，超过一个检查周期未被使用的丢弃
+_prefetched: Dict[int, Tuple[FetchResult, float]] = {}
+_prefetched_lock = threading.Lock()
+
+
+def _remember_prefetched(file_id: int, result: FetchResult):
+    now = time.monotonic()
+    with _prefetched_lock:
+        for expired in [key for key, (_, at) in _prefetched.items()
+                        if now - at > settings.WEB_REFRESH_CHECK_INTERVAL_SECONDS]:
+            del _prefetched[expired]
+        _prefetched[file_id] = (result, now)
+
+
+def _take_prefetched(db_file: KnowledgeFile) -> Optional[FetchResult]:
+    """
+    取出刷新时为该文件暂存的抓取结果，过期或URL已变化时返回None
+    """
+    with _prefetched_lock:
+        entry = _prefetched.pop(db_file.id, None)
+    if entry is None:
+        return None
+    result, at = entry
+    if result.url != db_file.file_path or time.monotonic() - at > settings.WEB_REFRESH_CHECK_INTERVAL_SECONDS:
+        return None
+    return result
+
+
+def _get_page(session: Session, db_file: KnowledgeFile) -> WebPage:
+    page = session.exec(select(WebPage).where(WebPage.knowledge_file_id == db_file.id)).first()
+    if page is None:
+        page = WebPage(knowledge_file_id=db_file.id, url=db_file.file_path)
+    return page
+
+
+def _record(page: WebPage, result: FetchResult, now: datetime):
+    """
+    记录一次成功抓取（200或304）的结果
+    """
+    page.http_status = result.status
+    page.fetched_at = now
+    page.etag = result.etag
+    page.last_modified = result.last_modified
+    if result.content_hash and result.content_hash != page.content_hash:
+        page.content_hash = result.content_hash
+        page.changed_at = now
+
+
+def fetch_web_page(session: Session, db_file: KnowledgeFile, record: bool = True) -> str:
+    """
+    抓取网页正文并保存抓取状态
+    :param session:
+    :param db_file: 网页类型的文件，file_path为URL
+    :param record: 是否保存抓取状态
+    :return: 正文文本
+    """
+    result = _take_prefetched(db_file) or web_crawler.fetch(db_file.file_path)
+    if result.error:
+        raise ValueError(f"抓取网页失败: {db_file.file_path}，{result.error}")
+    if not record:
+        return result.text
+    page = _get_page(session, db_file)
+    page.url = db_file.file_path
+    _record(page, result, datetime.now(timezone.utc))
+    session.add(page)
+    session.commit()
+    return result.text
+
+
+def refresh_web_pages(limit: int = settings.WEB_REFRESH_BATCH_SIZE,
+                      interval_seconds: Optional[int] = None) -> Dict[str, int]:
+    """
+    检查到期的网页，内容变化的重新入队向量化
+    :param limit: 本次最多检查的网页数，最久未抓取的优先
+    :param interval_seconds: 刷新周期，默认 WEB_REFRESH_INTERVAL_SECONDS
+    :return: 统计信息
+    """
+    interval_seconds = settings.WEB_REFRESH_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=interval_seconds)
+    stats = {"checked": 0, "unchanged": 0, "changed": 0, "retried": 0, "failed": 0}
+    with Session(engine) as session:
+        rows = session.exec(
+            select(KnowledgeFile, WebPage)
+            .join(WebPage, WebPage.knowledge_file_id == KnowledgeFile.id, isouter=True)
+            .where(
+                KnowledgeFile.mime_type == SupportedMimeTypes.WEB_URL.value,
+                KnowledgeFile.status.in_([FileStatus.VECTORIZED, FileStatus.FAILED]),
+                KnowledgeFile.is_deleted == False,
+                or_(WebPage.fetched_at == None, WebPage.fetched_at < cutoff),
+            )
+            .order_by(WebPage.fetched_at)
+            .limit(limit)
+        ).all()
+        if not rows:
+            return stats
+        # 向量化失败的网页需要正文重新入库，不发送条件请求
+        results = web_crawler.fetch_many([
+            (db_file.file_path, None, None) if db_file.status == FileStatus.FAILED or page is None
+            else (db_file.file_path, page.etag, page.last_modified)
+            for db_file, page in rows
+        ])
+        changed_files = []
+        for (db_file, page), result in zip(rows, results):
+            stats["checked"] += 1
+            page = page or WebPage(knowledge_file_id=db_file.id, url=db_file.file_path)
+            if result.error:
+                # 失败的网页同样推迟到下一个周期，不在每次检查时重复请求
+                logger.warning(f"刷新网页失败: {db_file.file_path}，{result.error}")
+                page.http_status = result.status
+                page.fetched_at = now
+                stats["failed"] += 1
+            elif db_file.status != FileStatus.FAILED and (
+                    result.not_modified or page.content_hash in (None, result.content_hash)):
+                # 没有记录过正文哈希（本功能上线前向量化的网页）时以本次结果为基准
+                _record(page, result, now)
+                stats["unchanged"] += 1
+            else:
+                # 正文哈希和校验头由重新向量化时的抓取写入，避免向量化失败后误判为未变化；
+                # 失败的文件的抓取状态可能已由失败前的抓取写入，哈希相同也需要重新向量化
+                stats["retried" if db_file.status == FileStatus.FAILED else "changed"] += 1
+                page.fetched_at = now
+                db_file.status = FileStatus.COMPLETED
+                session.add(db_file)
+                changed_files.append(db_file)
+                # 入队前暂存正文，本进程执行向量化时不再重复抓取
+                _remember_prefetched(db_file.id, result)
+            session.add(page)
+        session.commit()
+        for db_file in changed_files:
+            # 入队失败时文件停留在completed状态，由回收器重新入队
+            try:
+                ingestion_queue.enqueue(db_file.id, db_file.knowledge_base_id)
+            except Exception as e:
+                logger.error(f"网页重新向量化入队失败，文件ID: {db_file.id}，错误信息: {e}")
+    logger.info(f"网页刷新完成，检查: {stats['checked']}，未变化: {stats['unchanged']}，"
+                f"已变化: {stats['changed']}，重试失败文件: {stats['retried']}，抓取失败: {stats['failed']}")
+    return stats
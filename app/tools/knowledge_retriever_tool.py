@@ -1,11 +1,14 @@
 import asyncio
 import logging
 from langchain.tools import tool
+from langchain_core.documents import Document
 from typing import List,Dict,Any
 from langchain_milvus import Milvus
 
 from app.core.config import settings
-from app.services.milvus_service import milvus_service, DEFAULT_COLLECTION_NAME
+from app.services.milvus_service import MilvusService, DEFAULT_COLLECTION_NAME
+from app.services.vector_codec import VectorStorageType
+from app.services.vector_store import get_vector_store
 from app.services.vectorization_service import embeddings
 from pydantic import BaseModel,Field
 
@@ -25,30 +28,22 @@ async def knowledge_retriever_tool(query:str) -> str:
     logging.info(f"检查milvus连接信息：{settings.MILVUS_HOST}")
     if not embeddings:
         return "错误：Embedding模型未初始化，无法执行知识库查询"
-    if not milvus_service:
-        return "错误：Milvus服务未初始化，无法执行知识库查询"
+    vector_store = get_vector_store()
     try:
-        vector_store = Milvus(
-            embedding_function=embeddings,
-            collection_name=DEFAULT_COLLECTION_NAME,
-            connection_args={"uri": f"http://{settings.MILVUS_HOST}:{settings.MILVUS_PORT}"},
-            text_field="chunk_text",
-            primary_field="id",
-        )
-        # 将向量存储对象转换为一个配置了MMR的Retriever（检索器）
-        retriever = vector_store.as_retriever(
-            search_type="mmr",
-            search_kwargs={
-                'k': 5,
-                'fetch_k': 20,
-                'lambda_mult': 0.5
-            },
-        )
-        # 把用户的查询文本进行向量化
-        # query_vector = await embeddings.aembed_query(query)
-        relevant_docs = await retriever.ainvoke(query)
-        # 使用向量在milvus里面搜索，查询3个相关的结果
-        # search_results = await milvus_service.search(query_vector, 3)
+        # 别名切换到新版本后，按新版本的存储方式选择检索路径
+        vector_store.refresh_alias()
+        if isinstance(vector_store, MilvusService) and vector_store.storage_type == VectorStorageType.FLOAT \
+                and not vector_store.external_text:
+            relevant_docs = await _mmr_retrieve(query)
+        else:
+            # 半精度/二值存储、外部文本存储或本地向量库下langchain_milvus无法直接检索，
+            # 改用向量存储的search（Milvus含二值粗排+精排，只为最终结果读取文本）
+            query_vector = await embeddings.aembed_query(query)
+            search_results = await vector_store.search(query_vector, 5)
+            relevant_docs = [
+                Document(page_content=result["chunk_text"], metadata={"file_id": result["file_id"]})
+                for result in search_results
+            ]
         if not relevant_docs:
             return "在知识库中没有查询到相关信息"
         # 格式化处理，把检索到的文本块拼成一个字符串
@@ -63,4 +58,29 @@ async def knowledge_retriever_tool(query:str) -> str:
         return content
     except Exception as e:
         logging.error(f"知识库检索工具执行错误：{e}")
-        return "错误：知识库检索工具执行错误"
\ No newline at end of file
+        return "错误：知识库检索工具执行错误"
+
+
+async def _mmr_retrieve(query: str) -> List[Document]:
+    """
+    使用langchain_milvus按MMR检索，仅适用于float32向量存储
+    :param query:
+    :return:
+    """
+    vector_store = Milvus(
+        embedding_function=embeddings,
+        collection_name=DEFAULT_COLLECTION_NAME,
+        connection_args={"uri": f"http://{settings.MILVUS_HOST}:{settings.MILVUS_PORT}"},
+        text_field="chunk_text",
+        primary_field="id",
+    )
+    # 将向量存储对象转换为一个配置了MMR的Retriever（检索器）
+    retriever = vector_store.as_retriever(
+        search_type="mmr",
+        search_kwargs={
+            'k': 5,
+            'fetch_k': 20,
+            'lambda_mult': 0.5
+        },
+    )
+    return await retriever.ainvoke(query)
@@ -0,0 +1,231 @@
+import logging
+import os
+import resource
+import signal
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.constants import FileStatus
+from app.db.db import engine
+from app.models.knowledge import KnowledgeFile
+from app.services.image_embedding import image_embedding_client
+from app.services.ingestion_pipeline import shutdown_process_pool
+from app.services.ingestion_queue import ingestion_queue, IngestionJob
+from app.services.milvus_compaction import check_and_compact
+from app.services.milvus_insert_buffer import milvus_insert_buffer
+from app.services.vectorization_service import vectorize_file, clone_file
+from app.services.web_crawler import web_crawler
+from app.services.web_page_service import refresh_web_pages
+
+"""
+向量化任务worker进程
+
+从Redis任务队列中领取任务并执行向量化，可以在任意节点上启动多个进程来扩展处理能力：
+    python -m app.workers.ingestion_worker
+
+- 每个进程同时执行 INGESTION_WORKER_CONCURRENCY 个任务
+- 执行期间定期续约，进程崩溃后任务会在租约到期后被重新领取
+- 回收器（同一时间只有一个节点执行）负责回收过期租约，并把数据库中长时间卡在
+  processing/completed 状态、却不在队列中的文件重新入队
+- 网页刷新（同一时间只有一个节点执行）定期对到期的网页发送条件请求，内容变化的重新入队
+- compaction调度（同一时间只有一个节点执行）定期检查已删除记录的占比，超过阈值时触发compaction
+- 收到SIGTERM/SIGINT后不再领取新任务，等待执行中的任务结束并写完Milvus缓冲区后退出
+"""
+logger = logging.getLogger(__name__)
+
+
+def _current_rss_mb() -> float:
+    """
+    当前进程的常驻内存（MB），读取/proc，不支持时退化为峰值内存
+    :return:
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    """
+    进程启动以来的峰值常驻内存（MB），Linux下ru_maxrss单位为KB
+    :return:
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class IngestionWorker:
+
+    def __init__(self, concurrency: int = settings.INGESTION_WORKER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping = threading.Event()
+
+    def run(self):
+        """
+        启动消费线程和回收线程，阻塞直到收到退出信号
+        :return:
+        """
+        logger.info(f"向量化worker启动: {self.worker_id}，并发数: {self.concurrency}")
+        threads = [threading.Thread(target=self._reap_loop, name="ingestion-reaper", daemon=True)]
+        if settings.WEB_REFRESH_INTERVAL_SECONDS > 0:
+            threads.append(threading.Thread(target=self._web_refresh_loop, name="web-refresh", daemon=True))
+        if settings.MILVUS_COMPACTION_CHECK_INTERVAL_SECONDS > 0:
+            threads.append(threading.Thread(target=self._compaction_loop, name="milvus-compaction", daemon=True))
+        threads += [
+            threading.Thread(target=self._consume_loop, name=f"ingestion-consumer-{i}")
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            if not thread.daemon:
+                thread.join()
+        # 所有任务结束后写完缓冲区并关闭进程池
+        milvus_insert_buffer.close()
+        shutdown_process_pool()
+        image_embedding_client.close()
+        web_crawler.close()
+        logger.info(f"向量化worker已退出: {self.worker_id}")
+
+    def stop(self, *_):
+        """
+        优雅退出：不再领取新任务
+        :return:
+        """
+        logger.info("收到退出信号，等待执行中的任务完成")
+        self._stopping.set()
+
+    def _consume_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = ingestion_queue.claim(self.worker_id)
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+                self._stopping.wait(settings.INGESTION_POLL_INTERVAL_SECONDS * 5)
+                continue
+            if job is None:
+                self._stopping.wait(settings.INGESTION_POLL_INTERVAL_SECONDS)
+                continue
+            self._process(job)
+
+    def _process(self, job: IngestionJob):
+        """
+        执行一个任务，执行期间后台续约
+        :param job:
+        :return:
+        """
+        logger.info(f"开始执行向量化任务，文件ID: {job.file_id}，第{job.attempts}次尝试，"
+                    f"当前内存: {_current_rss_mb():.1f}MB，峰值内存: {_peak_rss_mb():.1f}MB")
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, finished), daemon=True)
+        heartbeat.start()
+        error = "向量化失败"
+        try:
+            source_file_id = job.payload.get("source_file_id")
+            if source_file_id:
+                success = clone_file(job.file_id, source_file_id, raise_errors=True)
+            else:
+                success = vectorize_file(job.file_id, raise_errors=True)
+        except Exception as e:
+            logger.error(f"向量化任务异常，文件ID: {job.file_id}，错误信息: {e}")
+            # 记录真实的失败原因，便于排查
+            error = f"{type(e).__name__}: {e}"
+            success = False
+        finally:
+            finished.set()
+            heartbeat.join()
+            logger.info(f"向量化任务结束，文件ID: {job.file_id}，"
+                        f"当前内存: {_current_rss_mb():.1f}MB，峰值内存: {_peak_rss_mb():.1f}MB")
+        try:
+            if success:
+                ingestion_queue.complete(job)
+            else:
+                ingestion_queue.retry(job, error)
+        except Exception as e:
+            # 队列状态更新失败时，租约到期后任务会被回收器重新调度
+            logger.error(f"更新任务状态失败，文件ID: {job.file_id}，错误信息: {e}")
+
+    @staticmethod
+    def _heartbeat(job: IngestionJob, finished: threading.Event):
+        interval = settings.INGESTION_LEASE_SECONDS / 3
+        while not finished.wait(interval):
+            try:
+                if not ingestion_queue.renew(job):
+                    logger.warning(f"任务租约已丢失，文件ID: {job.file_id}")
+                    return
+            except Exception as e:
+                logger.error(f"任务续约失败，文件ID: {job.file_id}，错误信息: {e}")
+
+    def _reap_loop(self):
+        interval = settings.INGESTION_REAPER_INTERVAL_SECONDS
+        while not self._stopping.wait(interval):
+            try:
+                if ingestion_queue.acquire_reaper_lock(self.worker_id, interval):
+                    self._reap()
+            except Exception as e:
+                logger.error(f"任务回收失败: {e}")
+
+    def _web_refresh_loop(self):
+        interval = settings.WEB_REFRESH_CHECK_INTERVAL_SECONDS
+        while not self._stopping.wait(interval):
+            try:
+                if ingestion_queue.acquire_web_refresh_lock(self.worker_id, interval):
+                    refresh_web_pages()
+            except Exception as e:
+                logger.error(f"网页刷新失败: {e}")
+
+    def _compaction_loop(self):
+        interval = settings.MILVUS_COMPACTION_CHECK_INTERVAL_SECONDS
+        while not self._stopping.wait(interval):
+            try:
+                if ingestion_queue.acquire_compaction_lock(self.worker_id, interval):
+                    check_and_compact()
+            except Exception as e:
+                logger.error(f"compaction检查失败: {e}")
+
+    def _reap(self):
+        """
+        回收过期租约，并把卡住的文件重新入队
+        :return:
+        """
+        dead_file_ids = ingestion_queue.reap_expired_leases()
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.INGESTION_STUCK_SECONDS)
+        with Session(engine) as session:
+            for file_id in dead_file_ids:
+                db_file = session.get(KnowledgeFile, file_id)
+                if db_file:
+                    db_file.status = FileStatus.FAILED
+                    session.add(db_file)
+            session.commit()
+            stuck_files = session.exec(
+                select(KnowledgeFile).where(
+                    KnowledgeFile.status.in_([FileStatus.PROCESSING, FileStatus.COMPLETED]),
+                    KnowledgeFile.is_deleted == False,
+                    KnowledgeFile.updated_at < cutoff,
+                )
+            ).all()
+        for db_file in stuck_files:
+            if not ingestion_queue.contains(db_file.id):
+                logger.warning(f"文件 {db_file.id} 状态为 {db_file.status} 且不在队列中，重新入队")
+                ingestion_queue.enqueue(db_file.id, db_file.knowledge_base_id)
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    worker = IngestionWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
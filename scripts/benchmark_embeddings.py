@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.embeddings import EMBEDDING_PROVIDERS, create_text_embeddings
+from app.services.document_loading import clean_chunks, get_text_splitter
+from app.services.embedding_client import create_embedding_client
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.services.local_vector_store import LocalVectorStore
+from app.services.milvus_insert_buffer import MilvusInsertBuffer
+
+"""
+Embedding / 入库 / 检索的离线基准测试
+
+不依赖Milvus和embedding接口（默认 hashing，也可用 onnx 本地模型；dashscope需要网络），
+在固定种子生成的文档（或指定的文本文件）上依次测量：
+- 模型吞吐：直接调用embeddings对全部文本块向量化的块/秒、MB/秒，只反映模型本身
+- 入库吞吐：与线上相同的路径——get_text_splitter切分、create_embedding_client批量向量化、
+  IngestionPipeline流水线和写入缓冲区，写入临时目录下的本地向量库（flat或ivf），统计文档/秒、块/秒、MB/秒
+  （文本文档不经过解析进程池，PDF等格式的加载耗时不在其中）
+- 检索：以文本块中截取的片段作为查询，统计embedding和检索的p50/p95延迟、recall@k（top-k中有包含该片段的文本块）和MRR
+相同参数下语料和查询完全一致，hashing的检索指标在任何机器上都相同，吞吐和延迟可作为该机器的基线；
+--output 保存结果和运行环境，便于对比不同版本
+
+    python scripts/benchmark_embeddings.py --documents 1000 --index ivf --output data/bench_hashing.json
+    python scripts/benchmark_embeddings.py --provider onnx --onnx-path models/bge-small-zh --dim 512
+    python scripts/benchmark_embeddings.py --texts docs/*.txt
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 合成语料使用的常用汉字范围
+_CJK_START, _CJK_SIZE = 0x4E00, 3000
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def synthetic_documents(documents: int, document_chars: int, vocabulary: int, seed: int) -> List[str]:
+    """
+    由固定种子生成文档：先生成词表（2~4个汉字的词），按Zipf分布抽词组成以句号分隔的句子
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(2, 5, size=vocabulary)
+    words = ["".join(chr(_CJK_START + code) for code in rng.integers(0, _CJK_SIZE, size=length)) for length in lengths]
+    weights = 1.0 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    words_per_document = max(1, document_chars // 3)
+    texts = []
+    for _ in range(documents):
+        picked = rng.choice(vocabulary, size=words_per_document, p=weights)
+        sentence_lengths = rng.integers(6, 16, size=words_per_document)
+        sentences, start = [], 0
+        for length in sentence_lengths:
+            if start >= words_per_document:
+                break
+            sentences.append("，".join(words[index] for index in picked[start:start + length]) + "。")
+            start += length
+        texts.append("".join(sentences)[:document_chars])
+    return texts
+
+
+def file_documents(paths: List[str]) -> List[str]:
+    """
+    读取文本文件，每个文件作为一个文档
+    """
+    texts = []
+    for path in sorted(paths):
+        with open(path, encoding="utf-8") as file:
+            texts.append(file.read())
+    return [text for text in texts if text.strip()]
+
+
+def make_queries(chunks: List[str], count: int, query_chars: int, seed: int) -> List[str]:
+    """
+    从随机文本块中截取片段作为查询
+    """
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for index in rng.choice(len(chunks), size=min(count, len(chunks)), replace=False):
+        text = chunks[int(index)]
+        start = int(rng.integers(0, max(1, len(text) - query_chars + 1)))
+        queries.append(text[start:start + query_chars])
+    return queries
+
+
+def measure_model(embeddings, chunks: List[str], batch_size: int) -> Dict[str, float]:
+    """
+    直接调用embeddings，测量模型本身的吞吐
+    """
+    started = time.monotonic()
+    for start in range(0, len(chunks), batch_size):
+        embeddings.embed_documents(chunks[start:start + batch_size])
+    elapsed = max(time.monotonic() - started, 1e-9)
+    megabytes = sum(len(text.encode("utf-8")) for text in chunks) / 2 ** 20
+    return {
+        "model_s": elapsed,
+        "model_chunks_per_s": len(chunks) / elapsed,
+        "model_mb_per_s": megabytes / elapsed,
+    }
+
+
+def ingest(pipeline: IngestionPipeline, documents: List[str], splitter: str, knowledge_bases: int,
+           concurrency: int) -> Tuple[List[str], Dict[str, float]]:
+    """
+    按线上路径切分、向量化并写入，每个文档作为一个文件，多个文件并发处理
+    :return: (全部文本块, 统计)
+    """
+    split = get_text_splitter(splitter)
+
+    def ingest_document(index: int) -> Tuple[List[str], int]:
+        chunks = clean_chunks(split([documents[index]]))
+        return chunks, pipeline.run(index + 1, index % knowledge_bases + 1, chunks)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(ingest_document, range(len(documents))))
+    pipeline.insert_buffer.close()
+    elapsed = max(time.monotonic() - started, 1e-9)
+    chunks = [chunk for document_chunks, _ in results for chunk in document_chunks]
+    megabytes = sum(len(text.encode("utf-8")) for text in documents) / 2 ** 20
+    return chunks, {
+        "ingest_s": elapsed,
+        "ingest_documents_per_s": len(documents) / elapsed,
+        "ingest_chunks_per_s": len(chunks) / elapsed,
+        "ingest_mb_per_s": megabytes / elapsed,
+        "ingest_inserted": sum(inserted for _, inserted in results),
+    }
+
+
+async def evaluate(embeddings, store: LocalVectorStore, queries: List[str], top_k: int) -> Dict[str, float]:
+    """
+    逐条查询，统计延迟和召回
+    """
+    embed_latencies, search_latencies = [], []
+    hits, reciprocal_ranks = 0, 0.0
+    for query in queries:
+        started = time.monotonic()
+        query_vector = embeddings.embed_query(query)
+        embed_latencies.append(time.monotonic() - started)
+        started = time.monotonic()
+        results = await store.search(query_vector, top_k=top_k)
+        search_latencies.append(time.monotonic() - started)
+        for rank, result in enumerate(results, start=1):
+            if query in result["chunk_text"]:
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+                break
+    total = max(len(queries), 1)
+    return {
+        "query_embed_p50_ms": percentile(embed_latencies, 50),
+        "query_embed_p95_ms": percentile(embed_latencies, 95),
+        "search_p50_ms": percentile(search_latencies, 50),
+        "search_p95_ms": percentile(search_latencies, 95),
+        "recall_at_k": hits / total,
+        "mrr": reciprocal_ranks / total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding/入库/检索离线基准测试")
+    parser.add_argument("--provider", default="hashing", choices=EMBEDDING_PROVIDERS)
+    parser.add_argument("--dim", type=int, default=settings.TEXT_EMBEDDING_DIMENSION)
+    parser.add_argument("--ngram", type=int, default=settings.HASHING_EMBEDDING_NGRAM, help="hashing的最大n-gram长度")
+    parser.add_argument("--onnx-path", default=settings.ONNX_EMBEDDING_MODEL_PATH, help="ONNX模型目录")
+    parser.add_argument("--texts", nargs="*", help="使用文本文件作为语料（每个文件一个文档），不指定时生成合成文档")
+    parser.add_argument("--documents", type=int, default=1000, help="合成文档数量")
+    parser.add_argument("--document-chars", type=int, default=8000, help="每个合成文档的字符数")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="合成语料的词表大小")
+    parser.add_argument("--splitter", default=settings.TEXT_SPLITTER, choices=("token", "recursive"))
+    parser.add_argument("--concurrency", type=int, default=4, help="同时入库的文档数")
+    parser.add_argument("--batch-size", type=int, default=settings.LOCAL_EMBEDDING_BATCH_SIZE, help="模型吞吐测试的批大小")
+    parser.add_argument("--index", default="flat", choices=("flat", "ivf"))
+    parser.add_argument("--nlist", type=int, default=settings.LOCAL_VECTOR_IVF_NLIST)
+    parser.add_argument("--nprobe", type=int, default=settings.LOCAL_VECTOR_IVF_NPROBE)
+    parser.add_argument("--knowledge-bases", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--query-chars", type=int, default=40, help="查询片段的字符数")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="保存结果的JSON文件")
+    args = parser.parse_args()
+
+    embeddings, model_name = create_text_embeddings(
+        args.provider, args.dim, model=settings.TEXT_EMBEDDING_MODEL, api_key=settings.MODEL_KEY,
+        onnx_model_path=args.onnx_path, hashing_ngram=args.ngram, batch_size=args.batch_size,
+    )
+    if args.texts:
+        documents = file_documents(args.texts)
+    else:
+        documents = synthetic_documents(args.documents, args.document_chars, args.vocabulary, args.seed)
+    corpus_digest = hashlib.sha256("\x00".join(documents).encode("utf-8")).hexdigest()[:16]
+    logger.info(f"语料: {len(documents)} 个文档（sha256 {corpus_digest}），模型: {model_name}")
+
+    with tempfile.TemporaryDirectory(prefix="bench_vectors_") as path:
+        store = LocalVectorStore(path, index_type=args.index, nlist=args.nlist, nprobe=args.nprobe)
+        pipeline = IngestionPipeline(create_embedding_client(embeddings, provider=args.provider), MilvusInsertBuffer(store))
+        chunks, result = ingest(pipeline, documents, args.splitter, args.knowledge_bases, args.concurrency)
+        result.update(measure_model(embeddings, chunks, args.batch_size))
+        queries = make_queries(chunks, args.queries, args.query_chars, args.seed)
+        result.update(asyncio.run(evaluate(embeddings, store, queries, args.top_k)))
+
+    print(f"模型: {model_name}，维度: {args.dim}，文档: {len(documents)}，文本块: {len(chunks)}，查询: {len(queries)}，"
+          f"切分: {args.splitter}，索引: {args.index}，语料sha256: {corpus_digest}")
+    print(f"入库: {result['ingest_documents_per_s']:.1f} 文档/秒，{result['ingest_chunks_per_s']:.1f} 块/秒，"
+          f"{result['ingest_mb_per_s']:.2f} MB/秒，写入 {result['ingest_inserted']} 条")
+    print(f"模型: {result['model_chunks_per_s']:.1f} 块/秒，{result['model_mb_per_s']:.2f} MB/秒")
+    print(f"查询向量化 p50/p95: {result['query_embed_p50_ms']:.2f}/{result['query_embed_p95_ms']:.2f} ms，"
+          f"检索 p50/p95: {result['search_p50_ms']:.2f}/{result['search_p95_ms']:.2f} ms")
+    print(f"recall@{args.top_k}: {result['recall_at_k']:.4f}，MRR: {result['mrr']:.4f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({
+                "args": vars(args),
+                "model": model_name,
+                "corpus_sha256": corpus_digest,
+                "environment": {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count(),
+                },
+                "result": result,
+            }, file, ensure_ascii=False, indent=2)
+        logger.info(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
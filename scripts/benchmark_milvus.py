@@ -0,0 +1,154 @@
+import argparse
+import logging
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+from pymilvus import Collection, utility
+
+from app.services.milvus_service import (
+    milvus_service,
+    VECTOR_DIMENSION,
+    build_collection_schema,
+    create_vector_indexes,
+    create_scalar_indexes,
+    encode_columns,
+)
+from app.services.vector_codec import VectorStorageType
+
+"""
+Milvus 标量索引 / mmap 基准测试
+
+用合成数据（默认20万行，文件和知识库的分布与线上相近）分别建立三种配置的临时Collection，
+对比加载耗时、查询节点内存、带知识库过滤的检索延迟、按file_id查询和删除的延迟：
+- baseline: 只有向量索引
+- scalar:   向量索引 + file_id/knowledge_base_id标量索引
+- mmap:     scalar + 向量和文本字段开启mmap
+
+    python scripts/benchmark_milvus.py --rows 1000000 --chunks-per-file 200 --knowledge-bases 20
+临时Collection在测试结束后删除（--keep 保留）
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    "baseline": {"scalar_index": False, "mmap": False},
+    "scalar": {"scalar_index": True, "mmap": False},
+    "mmap": {"scalar_index": True, "mmap": True},
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def build_collection(name: str, variant: Dict[str, bool], args) -> Collection:
+    """
+    创建并填充一个临时Collection
+    """
+    if utility.has_collection(name):
+        utility.drop_collection(name)
+    schema = build_collection_schema(VectorStorageType.FLOAT, args.dim, mmap_enabled=variant["mmap"])
+    collection = Collection(name=name, schema=schema)
+    rng = np.random.default_rng(42)
+    text = "示例文本" * (args.text_chars // 4)
+    started = time.monotonic()
+    for start in range(0, args.rows, args.batch_size):
+        rows = min(args.batch_size, args.rows - start)
+        file_ids = [(start + i) // args.chunks_per_file for i in range(rows)]
+        columns = [
+            file_ids,
+            [file_id % args.knowledge_bases for file_id in file_ids],
+            [text] * rows,
+            rng.standard_normal((rows, args.dim), dtype=np.float32),
+        ]
+        collection.insert(encode_columns(columns, VectorStorageType.FLOAT))
+    collection.flush()
+    create_vector_indexes(collection, VectorStorageType.FLOAT)
+    if variant["scalar_index"]:
+        create_scalar_indexes(collection)
+    for index in collection.indexes:
+        utility.wait_for_index_building_complete(name, index_name=index.index_name)
+    logger.info(f"{name}: 写入并建立索引耗时 {time.monotonic() - started:.1f}s")
+    return collection
+
+
+def run_variant(name: str, variant: Dict[str, bool], args) -> Dict[str, float]:
+    collection = build_collection(name, variant, args)
+    result = {}
+    started = time.monotonic()
+    collection.load()
+    result["load_s"] = time.monotonic() - started
+    result["memory_mb"] = sum(s.mem_size for s in utility.get_query_segment_info(name)) / 2 ** 20
+
+    rng = np.random.default_rng(7)
+    latencies = []
+    for _ in range(args.queries):
+        started = time.monotonic()
+        collection.search(
+            data=[rng.standard_normal(args.dim, dtype=np.float32).tolist()],
+            anns_field="vector",
+            param={"metric_type": "L2", "params": {"nprobe": 16}},
+            limit=args.top_k,
+            expr=f"knowledge_base_id == {random.randrange(args.knowledge_bases)}",
+            output_fields=["file_id", "chunk_text"],
+        )
+        latencies.append(time.monotonic() - started)
+    result["search_p50_ms"] = percentile(latencies, 50)
+    result["search_p95_ms"] = percentile(latencies, 95)
+
+    file_count = max(1, args.rows // args.chunks_per_file)
+    files = random.sample(range(file_count), min(args.deletes, file_count))
+    latencies = []
+    for file_id in files:
+        started = time.monotonic()
+        collection.query(expr=f"file_id == {file_id}", output_fields=["count(*)"])
+        latencies.append(time.monotonic() - started)
+    result["query_p50_ms"] = percentile(latencies, 50)
+    latencies = []
+    for file_id in files:
+        started = time.monotonic()
+        collection.delete(f"file_id == {file_id}")
+        latencies.append(time.monotonic() - started)
+    result["delete_p50_ms"] = percentile(latencies, 50)
+    result["delete_p95_ms"] = percentile(latencies, 95)
+
+    collection.release()
+    if not args.keep:
+        utility.drop_collection(name)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus标量索引/mmap基准测试")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=VECTOR_DIMENSION)
+    parser.add_argument("--chunks-per-file", type=int, default=200, help="每个文件的文本块数量")
+    parser.add_argument("--knowledge-bases", type=int, default=20, help="知识库数量")
+    parser.add_argument("--text-chars", type=int, default=400, help="每个文本块的字符数")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--deletes", type=int, default=50, help="按file_id查询和删除的次数")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--keep", action="store_true", help="保留临时Collection")
+    args = parser.parse_args()
+    milvus_service.connect()
+
+    results = {}
+    for variant_name in args.variants:
+        results[variant_name] = run_variant(f"bench_{variant_name}", VARIANTS[variant_name], args)
+        logger.info(f"{variant_name}: {results[variant_name]}")
+
+    print(f"行数: {args.rows}，维度: {args.dim}，文件: {args.rows // args.chunks_per_file}，知识库: {args.knowledge_bases}")
+    print(f"{'配置':<10}{'加载(s)':>10}{'内存(MB)':>10}{'检索p50':>10}{'检索p95':>10}{'查询p50':>10}{'删除p50':>10}{'删除p95':>10}")
+    for variant_name, result in results.items():
+        print(f"{variant_name:<10}{result['load_s']:>10.1f}{result['memory_mb']:>10.1f}"
+              f"{result['search_p50_ms']:>10.1f}{result['search_p95_ms']:>10.1f}{result['query_p50_ms']:>10.1f}"
+              f"{result['delete_p50_ms']:>10.1f}{result['delete_p95_ms']:>10.1f}")
+    print("延迟单位: ms")
+
+
+if __name__ == "__main__":
+    main()
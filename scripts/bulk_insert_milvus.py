@@ -0,0 +1,130 @@
+import argparse
+import logging
+import time
+import uuid
+from itertools import islice
+
+import ijson
+from pymilvus import Collection, utility
+
+from app.core.config import settings
+from app.core.llm import get_default_embeddings
+from app.services.document_loading import get_text_splitter, clean_chunks
+from app.services.embedding_client import create_embedding_client
+from app.services.milvus_bulk_insert import NumpyBulkWriter, BulkInsertTracker
+from app.services.milvus_service import (
+    milvus_service,
+    DEFAULT_COLLECTION_NAME,
+    create_collection,
+    create_vector_indexes,
+    create_scalar_indexes,
+    detect_storage_type,
+    has_external_text,
+    resolve_alias,
+)
+from app.services.structured_loading import render_template
+from app.services.vector_codec import VectorStorageType
+
+"""
+通过Milvus BulkInsert离线导入大规模问答数据
+
+    python scripts/bulk_insert_milvus.py --input data/train.json --collection health_documents_bulk
+
+1. ijson流式读取JSON数组，按模板拼接文本、切分、并发向量化
+2. 结果写成.npy列文件并上传到Milvus的MinIO桶，每组文件提交一个BulkInsert任务（导入与向量化并行进行）
+3. 等待全部任务完成；目标Collection由本脚本新建时，此时才建立向量索引并加载
+适合一次性的大批量导入；需要断点续传的增量导入使用 populate_knowledge_base.py
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = "问题：{instruction}\n详细信息：{input}\n回答：{output}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="通过BulkInsert离线导入问答数据")
+    parser.add_argument("--input", required=True, help="JSON文件，顶层为问答数组")
+    parser.add_argument("--item-path", default="item", help="ijson条目路径")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="文本模板，字段名用{}引用")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION_NAME, help="目标Collection，不存在时创建（延迟建索引）")
+    parser.add_argument("--vector-type", default=settings.MILVUS_VECTOR_TYPE, choices=[t.value for t in VectorStorageType],
+                        help="新建Collection时的向量存储类型")
+    parser.add_argument("--file-id", type=int, default=-1)
+    parser.add_argument("--kb-id", type=int, default=-1)
+    parser.add_argument("--batch-size", type=int, default=500, help="每次向量化的条目数")
+    parser.add_argument("--rows-per-file", type=int, default=settings.MILVUS_BULK_INSERT_ROWS_PER_FILE)
+    parser.add_argument("--embedding-concurrency", type=int, default=8)
+    parser.add_argument("--keep-files", action="store_true", help="导入完成后保留上传的.npy文件")
+    args = parser.parse_args()
+    milvus_service.connect()
+    # 指定的是别名（如默认的health_documents）时导入到其当前指向的版本
+    args.collection = resolve_alias(args.collection) or args.collection
+
+    deferred_index = not utility.has_collection(args.collection)
+    if deferred_index:
+        storage_type = VectorStorageType(args.vector_type)
+        external_text = settings.MILVUS_TEXT_STORE == "mysql"
+        collection = create_collection(args.collection, storage_type, with_index=False, external_text=external_text)
+        logger.info(f"已创建Collection '{args.collection}'，索引将在导入完成后建立")
+    else:
+        collection = Collection(args.collection)
+        storage_type = detect_storage_type(collection)
+        external_text = has_external_text(collection)
+        logger.warning(f"Collection '{args.collection}' 已存在，导入的数据会按已有索引逐段建立索引")
+
+    client = create_embedding_client(get_default_embeddings(), max_concurrency=args.embedding_concurrency)
+    split = get_text_splitter()
+    writer = NumpyBulkWriter(storage_type, prefix=f"bulk_insert/{args.collection}/{uuid.uuid4().hex}",
+                             rows_per_file=args.rows_per_file, external_text=external_text,
+                             collection_name=args.collection)
+    tracker = BulkInsertTracker(args.collection)
+
+    started = time.monotonic()
+    items_done = rows = failed = 0
+    with open(args.input, "rb") as file:
+        items = ijson.items(file, args.item_path, use_float=True)
+        while True:
+            batch = list(islice(items, args.batch_size))
+            if not batch:
+                break
+            texts = [render_template(args.template, item) for item in batch]
+            chunks = clean_chunks(split(texts))
+            vectors = client.embed(chunks)
+            kept = [(chunk, vector) for chunk, vector in zip(chunks, vectors) if vector is not None]
+            failed += len(chunks) - len(kept)
+            rows += len(kept)
+            items_done += len(batch)
+            columns = [
+                [args.file_id] * len(kept),
+                [args.kb_id] * len(kept),
+                # 外部文本存储不限制长度，inline时截断到chunk_text字段的4000字节
+                [chunk if external_text else chunk.encode("utf-8")[:4000].decode("utf-8", errors="ignore")
+                 for chunk, _ in kept],
+                [vector for _, vector in kept],
+            ]
+            for files in writer.append(columns):
+                tracker.submit(files)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            logger.info(f"已向量化 {items_done} 条，{rows} 行，失败 {failed} 块，{rows / elapsed:.1f} 行/秒")
+    files = writer.close()
+    if files:
+        tracker.submit(files)
+    imported = tracker.wait()
+    logger.info(f"BulkInsert完成，共导入 {imported} 行，总耗时 {time.monotonic() - started:.0f}s")
+
+    if deferred_index:
+        index_started = time.monotonic()
+        create_vector_indexes(collection, storage_type)
+        create_scalar_indexes(collection)
+        for index in collection.indexes:
+            utility.wait_for_index_building_complete(args.collection, index_name=index.index_name)
+        logger.info(f"索引建立完成，耗时 {time.monotonic() - index_started:.0f}s")
+    collection.load()
+    logger.info(f"Collection '{args.collection}' 已加载，共 {collection.num_entities} 行")
+    # 中途失败时保留已上传的文件，便于排查
+    if not args.keep_files:
+        writer.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import logging
+
+import numpy as np
+
+from app.core.embeddings import EmbeddingProjection
+
+"""
+离线拟合向量降维投影（PCA），并选择满足召回率目标的最小维度
+
+样本来源二选一：
+- --texts: 文本文件，每行一段文本，使用原始（未投影）embedding模型向量化
+- --from-milvus: 从当前Collection抽样已存储的原始向量（要求Collection中尚未应用投影）
+
+    python scripts/fit_embedding_projection.py --texts samples.txt --target-recall 0.95 --output data/projection.npy
+
+拟合完成后设置 EMBEDDING_PROJECTION_PATH 和 VECTOR_DIMENSION，并重建向量集合
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_text_sample(path: str, sample_size: int, batch_size: int) -> np.ndarray:
+    """
+    读取文本并用原始embedding模型向量化
+    :param path:
+    :param sample_size:
+    :param batch_size:
+    :return:
+    """
+    from app.core.llm import get_base_embeddings
+    base_embeddings = get_base_embeddings()
+    texts = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                texts.append(line)
+            if len(texts) >= sample_size:
+                break
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(base_embeddings.embed_documents(texts[i:i + batch_size]))
+        logger.info(f"已向量化 {min(i + batch_size, len(texts))}/{len(texts)} 条文本")
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def load_milvus_sample(sample_size: int) -> np.ndarray:
+    """
+    从当前Collection抽样原始向量
+    :param sample_size:
+    :return:
+    """
+    from app.services.milvus_service import milvus_service
+    from app.services.vector_codec import decode_from_storage
+    iterator = milvus_service.collection.query_iterator(batch_size=min(sample_size, 1000), limit=sample_size,
+                                                        expr="id >= 0", output_fields=["vector"])
+    vectors = []
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            vectors.append(decode_from_storage([row["vector"] for row in rows], milvus_service.storage_type))
+    finally:
+        iterator.close()
+    return np.vstack(vectors)
+
+
+def top_k_neighbors(matrix: np.ndarray, query_count: int, top_k: int) -> np.ndarray:
+    """
+    对前query_count条向量在全部样本中做精确L2检索（排除自身）
+    :return: (query_count, top_k) 近邻下标
+    """
+    squared = np.einsum("ij,ij->i", matrix, matrix)
+    neighbors = np.empty((query_count, top_k), dtype=np.int64)
+    for start in range(0, query_count, 256):
+        queries = matrix[start:start + 256]
+        distances = squared[None, :] - 2 * queries @ matrix.T
+        distances[np.arange(len(queries)), np.arange(start, start + len(queries))] = np.inf
+        neighbors[start:start + len(queries)] = np.argsort(distances, axis=1)[:, :top_k]
+    return neighbors
+
+
+def fit(args):
+    if args.texts:
+        sample = load_text_sample(args.texts, args.sample, args.batch_size)
+    else:
+        sample = load_milvus_sample(args.sample)
+    count, input_dim = sample.shape
+    query_count = min(args.queries, count - 1)
+    logger.info(f"样本数量: {count}，原始维度: {input_dim}，评估查询数: {query_count}")
+
+    mean = sample.mean(axis=0)
+    _, singular_values, components = np.linalg.svd(sample - mean, full_matrices=False)
+    explained = np.cumsum(singular_values ** 2) / np.sum(singular_values ** 2)
+    truth = top_k_neighbors(sample, query_count, args.top_k)
+
+    chosen = None
+    dims = sorted(dim for dim in args.dims if dim < min(input_dim, count))
+    print(f"{'维度':>6}{'方差解释率':>12}{'recall@' + str(args.top_k):>12}{'压缩比':>8}")
+    for dim in dims:
+        projection = EmbeddingProjection.from_pca(mean, components[:dim])
+        approx = top_k_neighbors(projection.apply(sample), query_count, args.top_k)
+        recall = np.mean([len(set(t) & set(a)) / args.top_k for t, a in zip(truth, approx)])
+        print(f"{dim:>6}{explained[dim - 1]:>12.4f}{recall:>12.4f}{input_dim / dim:>8.1f}")
+        if chosen is None and recall >= args.target_recall:
+            chosen = (dim, projection)
+
+    if chosen is None:
+        logger.warning(f"没有维度满足召回率目标 {args.target_recall}，建议保持原始维度 {input_dim}")
+        return
+    dim, projection = chosen
+    projection.save(args.output)
+    logger.info(f"已选择维度 {dim}，投影矩阵保存到 {args.output}")
+    logger.info(f"请设置 EMBEDDING_PROJECTION_PATH={args.output} VECTOR_DIMENSION={dim}，并重建向量集合")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="拟合PCA降维投影")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--texts", help="样本文本文件，每行一段")
+    source.add_argument("--from-milvus", action="store_true", help="从当前Collection抽样向量")
+    parser.add_argument("--sample", type=int, default=20000, help="样本数量")
+    parser.add_argument("--queries", type=int, default=500, help="评估召回率使用的查询数量")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256, 384, 512, 768])
+    parser.add_argument("--batch-size", type=int, default=10, help="文本向量化批大小")
+    parser.add_argument("--output", default="data/embedding_projection.npy")
+    fit(parser.parse_args())
@@ -0,0 +1,158 @@
+import argparse
+import hashlib
+import logging
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.constants import FileStatus
+from app.db.db import engine
+from app.models.knowledge import KnowledgeFile
+from app.services.image_embedding import image_embedding_client, prepare_image_url, to_storage_vector
+from app.services.milvus_insert_buffer import milvus_insert_buffer
+from app.services.minio_service import minio_service
+
+"""
+批量导入图片到知识库
+
+按批处理目录下的图片：上传MinIO -> 创建文件记录 -> 缩放过大的图片并生成预签名地址 ->
+并发请求图片embedding -> 写入Milvus缓冲区 -> 更新文件状态。
+同一知识库中已经向量化完成的相同图片（按内容MD5判断）会被跳过，中断后可以直接重新执行。
+
+    python scripts/import_images.py --dir ./images --kb-id 3 --admin-user-id 1
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def scan_images(directory: str) -> List[Tuple[Path, str]]:
+    """
+    递归扫描目录下的图片
+    :return: [(路径, MIME类型)]
+    """
+    images = []
+    for root, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            mime_type, _ = mimetypes.guess_type(filename)
+            if mime_type and mime_type.startswith("image/"):
+                images.append((Path(root) / filename, mime_type))
+    return images
+
+
+def import_batch(session: Session, batch: List[Tuple[Path, str]], kb_id: int, admin_user_id: int,
+                 executor: ThreadPoolExecutor) -> Tuple[int, int, int]:
+    """
+    导入一批图片
+    :return: (成功数, 跳过数, 失败数)
+    """
+    contents = [path.read_bytes() for path, _ in batch]
+    hashes = [hashlib.md5(data).hexdigest() for data in contents]
+    existing = set(session.exec(select(KnowledgeFile.file_hash).where(
+        KnowledgeFile.knowledge_base_id == kb_id,
+        KnowledgeFile.file_hash.in_(hashes),
+        KnowledgeFile.status == FileStatus.VECTORIZED,
+        KnowledgeFile.is_deleted == False,
+    )).all())
+
+    records = []
+    for (path, mime_type), data, file_hash in zip(batch, contents, hashes):
+        if file_hash in existing:
+            continue
+        existing.add(file_hash)
+        db_file = KnowledgeFile(
+            filename=path.name,
+            file_ext=path.suffix.lstrip(".") or None,
+            mime_type=mime_type,
+            size_in_bytes=len(data),
+            admin_user_id=admin_user_id,
+            knowledge_base_id=kb_id,
+            file_hash=file_hash,
+            status=FileStatus.PROCESSING,
+        )
+        session.add(db_file)
+        records.append((db_file, data))
+    skipped = len(batch) - len(records)
+    if not records:
+        return 0, skipped, 0
+    session.flush()
+    for db_file, _ in records:
+        db_file.file_path = f"kb_{kb_id}/{db_file.id}_{db_file.filename}"
+    session.commit()
+
+    def upload_and_prepare(record) -> str:
+        db_file, data = record
+        if not minio_service.upload_file(settings.MINIO_DEFAULT_BUCKET, db_file.file_path, data, db_file.mime_type):
+            raise ValueError(f"上传图片失败: {db_file.file_path}")
+        return prepare_image_url(db_file.file_path, db_file.mime_type, data=data, expires_in_minutes=30)
+
+    prepared = []
+    futures = [executor.submit(upload_and_prepare, record) for record in records]
+    for (db_file, _), future in zip(records, futures):
+        try:
+            prepared.append((db_file, future.result()))
+        except Exception as e:
+            logger.error(f"图片准备失败: {db_file.filename}，错误信息: {e}")
+            db_file.status = FileStatus.FAILED
+            session.add(db_file)
+
+    vectors = image_embedding_client.embed_urls([url for _, url in prepared])
+    entities, succeeded = [], []
+    for (db_file, _), vector in zip(prepared, vectors):
+        try:
+            if vector is None:
+                raise ValueError("图片向量化失败")
+            entities.append({
+                "file_id": db_file.id,
+                "knowledge_base_id": kb_id,
+                "chunk_text": f"Image: {db_file.filename}",
+                "vector": to_storage_vector(vector),
+            })
+            succeeded.append(db_file)
+        except Exception as e:
+            logger.error(f"图片向量化失败: {db_file.filename}，错误信息: {e}")
+            db_file.status = FileStatus.FAILED
+            session.add(db_file)
+    if entities:
+        milvus_insert_buffer.add(entities).result()
+    for db_file in succeeded:
+        db_file.status = FileStatus.VECTORIZED
+        session.add(db_file)
+    session.commit()
+    return len(succeeded), skipped, len(records) - len(succeeded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入图片到知识库")
+    parser.add_argument("--dir", required=True, help="图片目录（递归扫描）")
+    parser.add_argument("--kb-id", type=int, required=True, help="知识库ID")
+    parser.add_argument("--admin-user-id", type=int, required=True, help="导入人（管理员ID）")
+    parser.add_argument("--batch-size", type=int, default=32, help="每批处理的图片数量")
+    parser.add_argument("--upload-workers", type=int, default=8, help="上传/缩放图片的线程数")
+    args = parser.parse_args()
+
+    images = scan_images(args.dir)
+    logger.info(f"共发现 {len(images)} 张图片")
+    started = time.monotonic()
+    totals = [0, 0, 0]
+    try:
+        with ThreadPoolExecutor(max_workers=args.upload_workers) as executor, Session(engine) as session:
+            for start in range(0, len(images), args.batch_size):
+                result = import_batch(session, images[start:start + args.batch_size], args.kb_id, args.admin_user_id, executor)
+                totals = [total + value for total, value in zip(totals, result)]
+                done = min(start + args.batch_size, len(images))
+                elapsed = max(time.monotonic() - started, 1e-6)
+                logger.info(f"进度: {done}/{len(images)}，成功: {totals[0]}，跳过: {totals[1]}，失败: {totals[2]}，"
+                            f"速度: {done / elapsed:.1f} 张/秒")
+    finally:
+        milvus_insert_buffer.close()
+        image_embedding_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -65,12 +65,54 @@ CREATE TABLE IF NOT EXISTS `knowledge_file` (
   `admin_user_id` BIGINT COMMENT '上传文件的管理员ID',
   `knowledge_base_id` BIGINT COMMENT '所属知识库ID',
   `upload_id` BIGINT COMMENT '上传id',
+  `part_count` INT COMMENT '分片上传的总分片数',
   `status` varchar(10) NOT NULL DEFAULT 'uploading' COMMENT '文件处理状态',
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
   `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
   `is_deleted` BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否逻辑删除'
 ) COMMENT '知识库文件表';
 
+-- ----------------------------
+-- 4.1 网页抓取状态表
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `web_page` (
+  `id` BIGINT PRIMARY KEY COMMENT 'ID，雪花ID',
+  `knowledge_file_id` BIGINT NOT NULL UNIQUE COMMENT '对应的知识库文件ID',
+  `url` VARCHAR(1024) NOT NULL COMMENT '网页地址',
+  `etag` VARCHAR(255) COMMENT '上次响应的ETag',
+  `last_modified` VARCHAR(64) COMMENT '上次响应的Last-Modified',
+  `content_hash` VARCHAR(64) COMMENT '正文文本的SHA-256',
+  `http_status` INT COMMENT '上次抓取的HTTP状态码',
+  `fetched_at` DATETIME COMMENT '上次抓取时间',
+  `changed_at` DATETIME COMMENT '上次内容变化时间',
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  `is_deleted` BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否逻辑删除',
+  INDEX `idx_web_page_fetched_at` (`fetched_at`)
+) COMMENT '网页抓取状态表';
+
+-- ----------------------------
+-- 4.2 外部文本存储表（MILVUS_TEXT_STORE=mysql）
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `chunk_text_block` (
+  `id` BIGINT AUTO_INCREMENT PRIMARY KEY COMMENT '自增ID，Milvus中的引用为 (id << 12) | 块内序号',
+  `collection_name` VARCHAR(255) NOT NULL COMMENT '所属的Milvus Collection',
+  `file_id` BIGINT NOT NULL COMMENT '所属文件ID',
+  `chunk_count` INT NOT NULL COMMENT '块内文本块数量',
+  `raw_bytes` INT NOT NULL COMMENT '压缩前的文本字节数',
+  `data` MEDIUMBLOB NOT NULL COMMENT 'zstd压缩的数据',
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  INDEX `idx_chunk_text_block_file_id` (`collection_name`, `file_id`)
+) COMMENT '文本块压缩存储表';
+
+-- ----------------------------
+-- 4.3 文本块向量缓存表（EMBEDDING_CACHE_BACKEND=mysql）
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `chunk_embedding` (
+  `key` BINARY(32) PRIMARY KEY COMMENT 'sha256(规范化文本, 模型名, 输出维度)',
+  `vector` BLOB NOT NULL COMMENT 'float32向量'
+) COMMENT '文本块向量缓存表（EMBEDDING_CACHE_BACKEND=mysql）';
+
 -- ----------------------------
 -- 5. 患者上传文件表
 -- ----------------------------
@@ -0,0 +1,81 @@
+import argparse
+import logging
+import time
+
+from pymilvus import Collection, utility
+
+from app.core.config import settings
+from app.services.milvus_service import (
+    milvus_service,
+    DEFAULT_COLLECTION_NAME,
+    create_scalar_indexes,
+    missing_scalar_indexes,
+)
+
+"""
+为已有Collection补建标量索引、开启mmap
+
+    python scripts/migrate_milvus_indexes.py --collection health_documents --mmap
+
+1. 为 file_id / knowledge_base_id 建立标量索引（已有的跳过），等待索引建立完成。
+   标量索引在已加载的Collection上在线建立，建成后由查询节点自动加载，检索不中断
+2. 可选开启mmap：pymilvus的ORM接口只支持Collection级别的mmap属性，开启后全部字段的原始数据和索引都从磁盘映射；
+   新建的Collection按 MILVUS_MMAP_ENABLED 只对向量和文本字段开启。
+   修改mmap属性需要先释放Collection再重新加载，期间检索不可用，请在维护窗口执行，或在新版本Collection上执行后再切换别名
+3. 输出查询节点内存占用（开启mmap时还有重新加载耗时）
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def loaded_memory_mb(collection_name: str) -> float:
+    """
+    已加载segment占用的查询节点内存(MB)
+    :param collection_name:
+    :return:
+    """
+    return sum(segment.mem_size for segment in utility.get_query_segment_info(collection_name)) / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为已有Collection补建标量索引、开启mmap")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION_NAME)
+    parser.add_argument("--index-type", default=settings.MILVUS_SCALAR_INDEX_TYPE or "INVERTED", choices=["INVERTED", "STL_SORT"])
+    parser.add_argument("--mmap", action="store_true", help="开启Collection级别的mmap")
+    parser.add_argument("--dry-run", action="store_true", help="只输出需要执行的操作")
+    args = parser.parse_args()
+    milvus_service.connect()
+
+    collection = Collection(args.collection)
+    missing = missing_scalar_indexes(collection)
+    logger.info(f"Collection '{args.collection}' 共 {collection.num_entities} 行，缺少标量索引的字段: {missing or '无'}")
+    if not missing and not args.mmap:
+        logger.info("无需迁移")
+        return
+    if args.dry_run:
+        logger.info(f"将建立 {args.index_type} 索引: {missing}，开启mmap: {args.mmap}")
+        return
+
+    before_mb = loaded_memory_mb(args.collection)
+    if missing:
+        started = time.monotonic()
+        created = create_scalar_indexes(collection, args.index_type)
+        for field_name in created:
+            utility.wait_for_index_building_complete(args.collection, index_name=f"{field_name}_idx")
+        logger.info(f"标量索引建立完成: {created}，耗时 {time.monotonic() - started:.1f}s")
+    if not args.mmap:
+        logger.info(f"查询节点内存: {before_mb:.1f}MB -> {loaded_memory_mb(args.collection):.1f}MB")
+        return
+
+    # mmap属性只能在释放后修改
+    collection.release()
+    collection.set_properties({"mmap.enabled": True})
+    logger.info("已开启mmap")
+    started = time.monotonic()
+    collection.load()
+    logger.info(f"重新加载完成，耗时 {time.monotonic() - started:.1f}s，"
+                f"查询节点内存: {before_mb:.1f}MB -> {loaded_memory_mb(args.collection):.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+import zstandard
+from pymilvus import Collection, utility
+
+from app.core.config import settings
+from app.services.chunk_text_store import chunk_text_store, pack_texts
+from app.services.milvus_service import (
+    milvus_service,
+    DEFAULT_COLLECTION_NAME,
+    create_collection,
+    resolve_alias,
+    detect_storage_type,
+    encode_columns,
+    truncate_inline_text,
+)
+from app.services.vector_codec import (
+    VectorStorageType,
+    bytes_per_vector,
+    decode_from_storage,
+    roundtrip,
+    to_binary,
+    hamming_distances,
+    l2_rerank,
+)
+
+"""
+向量存储迁移工具
+
+report: 从现有Collection抽样，离线评估各存储类型节省的内存与召回率损失
+    python scripts/migrate_vector_storage.py report --sample 5000 --queries 200 --top-k 10
+text-report: 从现有Collection抽样，评估文本块移出Milvus（MILVUS_TEXT_STORE=mysql）后节省的内存
+    python scripts/migrate_vector_storage.py text-report --sample 5000
+migrate: 把现有Collection的数据复制到一个使用新存储类型（或文本存储方式）的Collection
+    已通过别名访问的部署请使用 scripts/rebuild_collection.py rebuild --mode copy 建立新版本后切换别名
+    python scripts/migrate_vector_storage.py migrate --target health_documents_fp16 --vector-type float16 --swap
+    python scripts/migrate_vector_storage.py migrate --target health_documents_ext --vector-type float --text-store mysql --swap
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Milvus中VARCHAR字段每行的额外开销（偏移量等）的估算值
+VARCHAR_OVERHEAD_BYTES = 16
+
+
+def iterate_source(collection: Collection, batch_size: int, limit: int = -1):
+    """
+    分页遍历源Collection中的全部数据
+    :param collection:
+    :param batch_size:
+    :param limit: 最多读取的行数，-1表示不限制
+    :return:
+    """
+    # 文本字段取决于当前Collection的文本存储方式，在这里解析（需要连接Milvus），不在导入时连接
+    output_fields = ["file_id", "knowledge_base_id", milvus_service.text_field, "vector"]
+    iterator = collection.query_iterator(batch_size=batch_size, limit=limit, expr="id >= 0", output_fields=output_fields)
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            yield rows
+    finally:
+        iterator.close()
+
+
+def load_sample(collection: Collection, sample_size: int) -> np.ndarray:
+    """
+    读取前sample_size条向量并解码为float32矩阵
+    :param collection:
+    :param sample_size:
+    :return:
+    """
+    source_type = detect_storage_type(collection)
+    vectors = []
+    for rows in iterate_source(collection, min(sample_size, 1000), sample_size):
+        vectors.append(decode_from_storage([row["vector"] for row in rows], source_type))
+    return np.vstack(vectors)
+
+
+def evaluate_recall(sample: np.ndarray, query_count: int, top_k: int, storage_type: VectorStorageType, rerank_factor: int) -> float:
+    """
+    以float32精确检索结果为基准，计算某种存储类型下的召回率recall@k
+    查询向量取自样本本身，计算时排除查询向量自身
+    :return:
+    """
+    stored = roundtrip(sample, storage_type)
+    bits = np.frombuffer(b"".join(to_binary(sample)), dtype=np.uint8).reshape(len(sample), -1) \
+        if storage_type == VectorStorageType.BINARY else None
+    hits = 0
+    for query_index in range(query_count):
+        query = sample[query_index]
+        exact = l2_rerank(query, sample)
+        exact[query_index] = np.inf
+        truth = set(np.argsort(exact)[:top_k].tolist())
+        if bits is not None:
+            coarse = hamming_distances(bits[query_index], bits).astype(np.float32)
+            coarse[query_index] = np.inf
+            candidates = np.argsort(coarse, kind="stable")[:top_k * rerank_factor]
+            order = np.argsort(l2_rerank(query, stored[candidates]))[:top_k]
+            approx = set(candidates[order].tolist())
+        else:
+            distances = l2_rerank(query, stored)
+            distances[query_index] = np.inf
+            approx = set(np.argsort(distances)[:top_k].tolist())
+        hits += len(truth & approx)
+    return hits / (query_count * top_k)
+
+
+def report(args):
+    """
+    输出各存储类型的内存占用与召回率对比
+    :param args:
+    :return:
+    """
+    collection = milvus_service.collection
+    sample = load_sample(collection, args.sample)
+    dim = sample.shape[1]
+    query_count = min(args.queries, len(sample) - 1)
+    total_rows = collection.num_entities
+    logger.info(f"样本数量: {len(sample)}，维度: {dim}，Collection总行数: {total_rows}，查询数量: {query_count}")
+    baseline = bytes_per_vector(VectorStorageType.FLOAT, dim)
+    print(f"{'类型':<10}{'字节/向量':>10}{'每百万向量(MB)':>16}{'当前数据(MB)':>14}{'节省':>8}{'recall@' + str(args.top_k):>12}")
+    for storage_type in VectorStorageType:
+        size = bytes_per_vector(storage_type, dim, args.mmap)
+        recall = evaluate_recall(sample, query_count, args.top_k, storage_type, args.rerank_factor)
+        print(f"{storage_type.value:<10}{size:>10}{size * 1_000_000 / 2 ** 20:>16.1f}"
+              f"{size * total_rows / 2 ** 20:>14.1f}{1 - size / baseline:>8.1%}{recall:>12.4f}")
+
+
+def text_report(args):
+    """
+    输出文本块保存在Milvus中与移到外部文本存储后，每百万文本块占用的查询节点内存
+    :param args:
+    :return:
+    """
+    collection = milvus_service.collection
+    texts = []
+    for rows in iterate_source(collection, min(args.sample, 1000), args.sample):
+        texts.extend(milvus_service.fetch_texts(rows))
+    texts = [text for text in texts if text is not None]
+    if not texts:
+        logger.warning("Collection中没有数据")
+        return
+    total_rows = collection.num_entities
+    text_bytes = [len(text.encode("utf-8")) for text in texts]
+    average = sum(text_bytes) / len(texts)
+    # 按外部存储的分块方式压缩样本，估算MySQL中的存储量
+    compressor = zstandard.ZstdCompressor(level=chunk_text_store.level)
+    raw = compressed = 0
+    for block in chunk_text_store.iter_blocks(texts):
+        packed = pack_texts(block)
+        raw += len(packed)
+        compressed += len(compressor.compress(packed))
+    inline_bytes = average + VARCHAR_OVERHEAD_BYTES
+    external_bytes = 8
+    per_million = 1_000_000 / 2 ** 20
+    print(f"样本: {len(texts)} 个文本块，平均 {average:.0f} 字节，最大 {max(text_bytes)} 字节，"
+          f"当前文本存储: {'mysql' if milvus_service.external_text else 'inline'}，Collection总行数: {total_rows}")
+    print(f"{'':<22}{'每百万文本块(MB)':>18}{'当前数据(MB)':>14}")
+    print(f"{'Milvus内存 inline':<22}{inline_bytes * per_million:>18.1f}{inline_bytes * total_rows / 2 ** 20:>14.1f}")
+    print(f"{'Milvus内存 mysql':<22}{external_bytes * per_million:>18.1f}{external_bytes * total_rows / 2 ** 20:>14.1f}")
+    print(f"{'节省的Milvus内存':<22}{(inline_bytes - external_bytes) * per_million:>18.1f}"
+          f"{(inline_bytes - external_bytes) * total_rows / 2 ** 20:>14.1f}")
+    stored = compressed / len(texts)
+    print(f"{'MySQL存储(zstd)':<22}{stored * per_million:>18.1f}{stored * total_rows / 2 ** 20:>14.1f}"
+          f"  压缩率 {compressed / raw:.1%}")
+    if milvus_service.external_text:
+        stats = chunk_text_store.stats(milvus_service.collection_name)
+        print(f"外部文本存储实际: {stats['blocks']} 块，{stats['chunks']} 个文本块，"
+              f"{stats['raw_bytes'] / 2 ** 20:.1f}MB -> {stats['stored_bytes'] / 2 ** 20:.1f}MB")
+
+
+def migrate(args):
+    """
+    把源Collection复制到新存储类型的目标Collection
+    :param args:
+    :return:
+    """
+    target_type = VectorStorageType(args.vector_type)
+    if utility.has_collection(args.target):
+        raise ValueError(f"目标Collection已存在: {args.target}")
+    if args.swap and resolve_alias(DEFAULT_COLLECTION_NAME):
+        raise ValueError(f"'{DEFAULT_COLLECTION_NAME}' 是别名，请使用 scripts/rebuild_collection.py 建立新版本并切换")
+    source = milvus_service.collection
+    source_type = detect_storage_type(source)
+    target_external = (args.text_store or ("mysql" if milvus_service.external_text else "inline")) == "mysql"
+    target = create_collection(args.target, target_type, external_text=target_external)
+    copied = 0
+    started = time.monotonic()
+    for rows in iterate_source(source, args.batch_size):
+        file_ids = [row["file_id"] for row in rows]
+        texts = milvus_service.fetch_texts(rows)
+        if target_external:
+            # 外部存储中的文本块按目标Collection重新保存，源Collection的文本块保持不变，便于回滚
+            texts = chunk_text_store.put(args.target, file_ids, texts)
+        else:
+            # 外部存储的文本块不限长度，写入inline的chunk_text字段前截断到VARCHAR上限
+            texts = [truncate_inline_text(text) for text in texts]
+        columns = [
+            file_ids,
+            [row["knowledge_base_id"] for row in rows],
+            texts,
+            decode_from_storage([row["vector"] for row in rows], source_type),
+        ]
+        target.insert(encode_columns(columns, target_type))
+        copied += len(rows)
+        logger.info(f"已迁移 {copied} 条，速度 {copied / (time.monotonic() - started):.0f} 行/秒")
+    target.flush()
+    logger.info(f"迁移完成，共 {copied} 条，目标Collection: {args.target}（{target_type.value}）")
+    if args.swap:
+        # 旧Collection改名备份，新Collection接管默认名称
+        backup_name = f"{DEFAULT_COLLECTION_NAME}_{source_type.value}_backup"
+        source.release()
+        utility.rename_collection(DEFAULT_COLLECTION_NAME, backup_name)
+        utility.rename_collection(args.target, DEFAULT_COLLECTION_NAME)
+        chunk_text_store.rename_collection(DEFAULT_COLLECTION_NAME, backup_name)
+        chunk_text_store.rename_collection(args.target, DEFAULT_COLLECTION_NAME)
+        logger.info(f"已切换：'{DEFAULT_COLLECTION_NAME}' -> {target_type.value}，旧数据保留在 '{backup_name}'")
+        logger.info(f"请将 MILVUS_VECTOR_TYPE 设置为 {target_type.value}、MILVUS_TEXT_STORE 设置为 "
+                    f"{'mysql' if target_external else 'inline'} 并重启服务")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向量存储类型迁移与评估工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = subparsers.add_parser("report", help="评估内存节省与召回率损失")
+    report_parser.add_argument("--sample", type=int, default=5000, help="抽样向量数量")
+    report_parser.add_argument("--queries", type=int, default=200, help="用于评估的查询数量")
+    report_parser.add_argument("--top-k", type=int, default=10)
+    report_parser.add_argument("--rerank-factor", type=int, default=settings.MILVUS_BINARY_RERANK_FACTOR)
+    report_parser.add_argument("--mmap", action=argparse.BooleanOptionalAction, default=settings.MILVUS_MMAP_ENABLED,
+                               help="按开启mmap计算（binary模式的float16精排副本不计入内存）")
+    report_parser.set_defaults(func=report)
+
+    text_report_parser = subparsers.add_parser("text-report", help="评估文本块移到外部存储后节省的内存")
+    text_report_parser.add_argument("--sample", type=int, default=5000, help="抽样文本块数量")
+    text_report_parser.set_defaults(func=text_report)
+
+    migrate_parser = subparsers.add_parser("migrate", help="迁移到新的存储类型")
+    migrate_parser.add_argument("--target", required=True, help="目标Collection名称")
+    migrate_parser.add_argument("--vector-type", required=True, choices=[t.value for t in VectorStorageType])
+    migrate_parser.add_argument("--text-store", choices=["inline", "mysql"], help="目标Collection的文本存储方式，默认与源相同")
+    migrate_parser.add_argument("--batch-size", type=int, default=1000)
+    migrate_parser.add_argument("--swap", action="store_true", help="迁移完成后用目标Collection替换默认Collection")
+    migrate_parser.set_defaults(func=migrate)
+
+    arguments = parser.parse_args()
+    arguments.func(arguments)
@@ -1,137 +1,261 @@
+import argparse
+import json
 import logging
-from typing import List
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import ijson
-from langchain_community.document_loaders import JSONLoader
-from langchain_community.embeddings import DashScopeEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType
 
-from app.core.config import settings
+from app.core.llm import get_default_embeddings
+from app.services.document_loading import get_text_splitter, clean_chunks
+from app.services.embedding_client import BatchEmbeddingClient, create_embedding_client
+from app.services.milvus_insert_buffer import milvus_insert_buffer
+from app.services.vector_store import get_vector_store
 
+"""
+批量导入问答数据到向量库（可断点续传）
+
+    python scripts/populate_knowledge_base.py --input data/train.json --kb-id -1 --workers 8
+
+- 用ijson流式解析JSON数组，内存占用与文件大小无关
+- 每条问答拼接为 "问题/详细信息/回答" 文本后按token切分，通过批量embedding客户端并发向量化，
+  写入共享的Milvus写入缓冲区；处理线程不等待写入，批次在写入完成的回调中才计入检查点
+- 检查点文件记录已完整写入的条目数，批次乱序完成时只推进连续完成的前缀；续传时按条目数重新解析并跳过。
+  检查点中的字节位置是ijson预读后的文件位置，只是近似值，仅用于估算进度。
+  中断后重新执行同一命令即从检查点继续。检查点之后、已写入但尚未记录的批次在续传时会重复写入（至少一次）
+- 向量化失败的文本块写入 <input>.failed.jsonl，便于单独重试
+"""
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-data_path = "/Users/longhao/Downloads/Chinese-medical-dialogue/data/train_0001_of_0001.json"
-batch_size = 500
-continue_position = 100890
-
-_embeddings = DashScopeEmbeddings(
-    model=settings.TEXT_EMBEDDING_MODEL,
-    max_retries=3,
-    dashscope_api_key=settings.MODEL_KEY,
-)
-
-connections.connect(
-    alias="default",
-    host=settings.MILVUS_HOST,
-    port=settings.MILVUS_PORT
-)
-logger.info(f"成功连接到Milvus")
-fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="file_id", dtype=DataType.INT64, description="关联的源文件id"),
-            FieldSchema(name="knowledge_base_id", dtype=DataType.INT64, description="关联的知识库id"),
-            FieldSchema(name="chunk_text", dtype=DataType.VARCHAR, max_length=4000, description="分块的文本内容"),
-            FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=1024, description="向量表示")
-        ]
-collection = Collection(name="health_documents", schema=CollectionSchema(fields=fields, description="医疗健康文档合集", enable_dynamic_field=False))
-
-def stream_json_data(data_path:str):
+
+# chunk_text字段的最大长度（字节）
+MAX_CHUNK_TEXT_BYTES = 4000
+
+
+class Checkpoint:
     """
-    流式读取大json文件
-    :param data_path:
-    :return:
+    检查点文件，原子写入
     """
-    with open(data_path,'rb') as file:
-        batch = []
-        parse = ijson.items(file,'item')
-        total_processed = 0
-        for item in parse:
-            batch.append(item)
-            # 添加中断机制，假设程序中断了 下次从中断的地方继续开始
-            if total_processed <= continue_position:
-                total_processed += len(batch)
-            if len(batch) >= batch_size:
-                # todo 开始转换
-                vector( batch)
-                total_processed += len(batch)
-                logger.info(f"已处理{total_processed}条数据...")
-                # 清空数据
-                batch = []
-    if batch:
-        # 处理最后一波数据
-        logger.info("处理最后的数据")
-
-def vector(data:List):
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, int]:
+        if not os.path.exists(self.path):
+            return {"items": 0, "approx_bytes": 0}
+        with open(self.path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def save(self, items: int, bytes_read: int):
+        """
+        :param items: 已完整写入的条目数，续传以此为准
+        :param bytes_read: 近似的已解析字节数（ijson有预读），只用于估算进度
+        """
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"items": items, "approx_bytes": bytes_read, "updated_at": time.time()}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+
+class ProgressTracker:
     """
-    向量化数据
-    :param data:
-    :return:
+    跟踪乱序完成的批次，只把连续完成的前缀写入检查点，并输出进度
     """
-    # 创建文本分块器
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=2500,      # 每块最大2500字符
-        chunk_overlap=200,    # 块之间重叠200字符
-    )
-    # 处理数据并进行文本分块
-    chunked_texts = []  # 存储分块后的文本
-    chunk_metadata = []  # 存储分块的元数据（如原始数据索引）
-    texts_to_embed = []
-    # 处理数据
-    for i,item in enumerate(data):
-        instruction = item.get("instruction", "")
-        input_text = item.get("input", "")
-        output_text = item.get("output", "")
-        full_text = f"问题：{instruction}\n详细信息：{input_text}\n回答：{output_text}"
-
-        # 对长文本进行分块
-        chunks = text_splitter.split_text(full_text)
-        # 对每个块保存文本和数据
-        for j,chunk in enumerate(chunks):
-            chunked_texts.append(chunk)
-            chunk_metadata.append({
-                "original_index": i,  # 原始数据索引
-                "chunk_index": j,  # 块索引
-                "total_chunks": len(chunks)  # 总块数
-            })
-        # texts_to_embed.append(full_text)
-    # 向量化数据
-    vectors = _embeddings.embed_documents(chunked_texts)
-    # 封装一个dict key为原始文本，value为向量
-    save_data = []
-    for i,(text, meta) in enumerate(zip(chunked_texts, chunk_metadata)):
-        # 确保文本长度不超过4000字符
-        truncated_text = text[:4000] if len(text) > 4000 else text
-        save_data.append({
-            "chunk_text": truncated_text,
-            "vector": vectors[i],
-            "file_id": -1,
-            "knowledge_base_id": -1
-        })
-
-    # 拿到了完整的向量，开始调用milvus数据存储
-    save_to_milvus(save_data)
-
-def save_to_milvus(data:List):
+
+    def __init__(self, checkpoint: Checkpoint, start_items: int, start_bytes: int, total_items: Optional[int],
+                 total_bytes: int, log_interval: float):
+        self.checkpoint = checkpoint
+        self.start_items = start_items
+        self.start_bytes = start_bytes
+        self.items = start_items
+        self.bytes_read = start_bytes
+        self.total_items = total_items
+        self.total_bytes = total_bytes
+        self.log_interval = log_interval
+        self.rows = 0
+        self.failed = 0
+        self._completed: Dict[int, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._logged_at = self._started
+
+    def complete(self, start: int, end: int, bytes_read: int, rows: int, failed: int):
+        """
+        批次 [start, end) 已写入
+        """
+        with self._lock:
+            self.rows += rows
+            self.failed += failed
+            self._completed[start] = (end, bytes_read)
+            advanced = False
+            while self.items in self._completed:
+                self.items, self.bytes_read = self._completed.pop(self.items)
+                advanced = True
+            if advanced:
+                self.checkpoint.save(self.items, self.bytes_read)
+            now = time.monotonic()
+            if now - self._logged_at >= self.log_interval:
+                self._logged_at = now
+                self.log()
+
+    def log(self):
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        items_per_second = (self.items - self.start_items) / elapsed
+        if self.total_items:
+            remaining = (self.total_items - self.items) / items_per_second if items_per_second else float("inf")
+            progress = f"{self.items}/{self.total_items} 条"
+        else:
+            # 未提供总条数时按已解析的字节数估算
+            fraction = self.bytes_read / self.total_bytes if self.total_bytes else 0
+            bytes_per_second = (self.bytes_read - self.start_bytes) / elapsed
+            remaining = (self.total_bytes - self.bytes_read) / bytes_per_second if bytes_per_second > 0 else float("inf")
+            progress = f"{self.items} 条（{fraction:.1%}）"
+        if remaining == float("inf"):
+            eta = "未知"
+        else:
+            eta = f"{int(remaining // 3600)}:{int(remaining % 3600 // 60):02d}:{int(remaining % 60):02d}"
+        logger.info(f"进度: {progress}，写入 {self.rows} 行，失败 {self.failed} 块，"
+                    f"速度: {self.rows / elapsed:.1f} 行/秒，{items_per_second:.1f} 条/秒，预计剩余: {eta}")
+
+
+def iter_batches(path: str, item_path: str, skip: int, batch_size: int) -> Iterator[Tuple[int, List[Dict[str, Any]], int]]:
     """
-    保存数据到数据库
-    :param data:
-    :return:
+    流式读取JSON数组并跳过已完成的条目
+    :return: (批次起始条目序号, 条目列表, 近似的已读取字节数（含ijson预读）)
     """
-    # 提取字段
-
-    # 处理数据
-    data_to_insert = [
-        [item["file_id"] for item in data],
-        [item["knowledge_base_id"] for item in data],
-        [item["chunk_text"] for item in data],
-        [item["vector"] for item in data]
-    ]
-    # for item in data:
-    # )
-    # transposed_data = list(zip(*data_to_insert))
-    collection.insert(data_to_insert)
-    logger.info(f"向量保存成功")
-
-
-stream_json_data(data_path)
\ No newline at end of file
+    with open(path, "rb") as file:
+        items = ijson.items(file, item_path, use_float=True)
+        for _ in islice(items, skip):
+            pass
+        offset = skip
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                return
+            yield offset, batch, file.tell()
+            offset += len(batch)
+
+
+def build_text(item: Dict[str, Any]) -> str:
+    return f"问题：{item.get('instruction', '')}\n详细信息：{item.get('input', '')}\n回答：{item.get('output', '')}"
+
+
+def truncate_bytes(text: str, max_bytes: int = MAX_CHUNK_TEXT_BYTES) -> str:
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore")
+
+
+class BulkLoader:
+
+    def __init__(self, client: BatchEmbeddingClient, file_id: int, knowledge_base_id: int, failed_path: str):
+        self.client = client
+        self.file_id = file_id
+        self.knowledge_base_id = knowledge_base_id
+        self.split = get_text_splitter()
+        self._failed_path = failed_path
+        self._failed_lock = threading.Lock()
+
+    def process(self, batch: List[Dict[str, Any]]) -> Tuple[Future, int, int]:
+        """
+        切分、向量化一批条目并送入写入缓冲区，不等待写入完成
+        :return: (写入缓冲区返回的Future, 写入行数, 失败块数)
+        """
+        chunks = clean_chunks(self.split([build_text(item) for item in batch]))
+        vectors = self.client.embed(chunks)
+        entities, failed = [], []
+        for chunk, vector in zip(chunks, vectors):
+            if vector is None:
+                failed.append(chunk)
+                continue
+            entities.append({
+                "file_id": self.file_id,
+                "knowledge_base_id": self.knowledge_base_id,
+                # 外部文本存储不限制长度
+                "chunk_text": chunk if get_vector_store().external_text else truncate_bytes(chunk),
+                "vector": vector,
+            })
+        if failed:
+            with self._failed_lock, open(self._failed_path, "a", encoding="utf-8") as file:
+                for chunk in failed:
+                    file.write(json.dumps({"chunk_text": chunk}, ensure_ascii=False) + "\n")
+        return milvus_insert_buffer.add(entities), len(entities), len(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入问答数据到向量库（可断点续传）")
+    parser.add_argument("--input", required=True, help="JSON文件，顶层为问答数组")
+    parser.add_argument("--item-path", default="item", help="ijson条目路径，默认顶层数组元素")
+    parser.add_argument("--checkpoint", help="检查点文件，默认 <input>.checkpoint")
+    parser.add_argument("--restart", action="store_true", help="忽略已有检查点，从头开始")
+    parser.add_argument("--file-id", type=int, default=-1)
+    parser.add_argument("--kb-id", type=int, default=-1)
+    parser.add_argument("--batch-size", type=int, default=200, help="每批条目数")
+    parser.add_argument("--workers", type=int, default=4, help="同时处理的批次数")
+    parser.add_argument("--embedding-concurrency", type=int, default=8, help="embedding并发请求数")
+    parser.add_argument("--total", type=int, help="总条目数，用于计算预计剩余时间")
+    parser.add_argument("--log-interval", type=float, default=10.0, help="进度输出间隔（秒）")
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint")
+    state = {"items": 0, "approx_bytes": 0} if args.restart else checkpoint.load()
+    start_items = state["items"]
+    if start_items:
+        logger.info(f"从检查点继续，跳过前 {start_items} 条")
+    tracker = ProgressTracker(checkpoint, start_items, state.get("approx_bytes", 0), args.total, os.path.getsize(args.input),
+                              args.log_interval)
+    client = create_embedding_client(get_default_embeddings(), max_concurrency=args.embedding_concurrency)
+    loader = BulkLoader(client, args.file_id, args.kb_id, f"{args.input}.failed.jsonl")
+
+    inflight = threading.BoundedSemaphore(args.workers * 2)
+    errors: List[BaseException] = []
+
+    def on_written(future: Future, start: int, end: int, bytes_read: int, rows: int, failed: int):
+        """
+        批次写入完成（在写入缓冲区的线程中回调）后才推进检查点
+        """
+        error = future.exception()
+        if error is not None:
+            errors.append(error)
+            logger.error(f"批次 {start}-{end} 写入失败: {error}")
+            return
+        tracker.complete(start, end, bytes_read, rows, failed)
+
+    def run(start: int, batch: List[Dict[str, Any]], bytes_read: int):
+        try:
+            future, rows, failed = loader.process(batch)
+            end = start + len(batch)
+            future.add_done_callback(lambda done: on_written(done, start, end, bytes_read, rows, failed))
+        except BaseException as e:
+            errors.append(e)
+            logger.error(f"批次 {start}-{start + len(batch)} 处理失败: {e}")
+        finally:
+            # 向量化完成即释放，写入的积压由写入缓冲区的背压控制
+            inflight.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for start, batch, bytes_read in iter_batches(args.input, args.item_path, start_items, args.batch_size):
+                if errors:
+                    break
+                # 在途批次达到上限时阻塞，解析速度不会远超写入速度
+                inflight.acquire()
+                executor.submit(run, start, batch, bytes_read)
+    finally:
+        milvus_insert_buffer.close()
+        tracker.log()
+    if errors:
+        logger.error(f"导入中断，已写入检查点 {tracker.items} 条，重新执行即可继续")
+        raise SystemExit(1)
+    logger.info(f"导入完成，共 {tracker.items} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+import argparse
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from pymilvus import Collection, utility
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.constants import FileStatus
+from app.core.llm import get_default_embeddings
+from app.db.db import engine
+from app.models.knowledge import KnowledgeFile
+from app.services.chunk_text_store import chunk_text_store
+from app.services.embedding_client import create_embedding_client
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.services.milvus_insert_buffer import MilvusInsertBuffer
+from app.services.milvus_service import (
+    milvus_service,
+    MilvusService,
+    DEFAULT_COLLECTION_NAME,
+    collection_version,
+    create_collection,
+    create_vector_indexes,
+    create_scalar_indexes,
+    list_versions,
+    resolve_alias,
+    versioned_collection_name,
+)
+from app.services.vector_codec import VectorStorageType, decode_from_storage
+from app.services.vectorization_service import ingest_file_content
+
+"""
+版本化Collection的重建与切换（蓝绿部署）
+
+服务通过别名 health_documents 访问当前版本（health_documents_v1、health_documents_v2...），
+新版本在后台重建、验证通过后原子地切换别名，旧版本保留用于回滚：
+
+    python scripts/rebuild_collection.py bootstrap                  # 把未版本化的health_documents改名为v1并建立别名
+    python scripts/rebuild_collection.py rebuild --mode reembed     # 按当前配置（模型、切分、存储类型）重建新版本
+    python scripts/rebuild_collection.py rebuild --mode copy --vector-type float16 --text-store mysql
+    python scripts/rebuild_collection.py validate --version 2
+    python scripts/rebuild_collection.py catch-up --version 2 --since 2026-10-19T08:00:00+00:00
+    python scripts/rebuild_collection.py switch --version 2
+    python scripts/rebuild_collection.py rollback
+    python scripts/rebuild_collection.py drop --version 1
+
+- copy: 从当前版本复制向量和文本，只改变存储方式（向量类型、文本存储、索引、mmap）
+- reembed: 从对象存储重新加载、切分、向量化全部已向量化的文件；模型和维度不变时向量从embedding缓存读取，
+  只有切分结果变化的文本块需要请求embedding接口。不属于任何文件的数据（如批量导入的问答）从当前版本读取文本后重新向量化
+- 重建期间服务继续读写当前版本；重建开始后有变化的文件在结束时补做一次（catch-up）。
+  重建的开始时间和模式保存在新版本Collection的属性中，switch在切换别名前从该时间再做一次catch-up，
+  只剩catch-up结束到切换之间的短暂窗口（没有双写），该窗口内的变化可在切换后对新版本再执行一次 catch-up
+- 切换时新旧版本都处于加载状态，服务在 MILVUS_ALIAS_REFRESH_SECONDS 内跟随别名，检索不中断
+"""
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 保存在新版本Collection属性中的重建信息
+REBUILD_STARTED_AT_PROPERTY = "rebuild.started_at"
+REBUILD_MODE_PROPERTY = "rebuild.mode"
+
+
+def save_rebuild_info(collection: Collection, started_at: datetime, mode: str):
+    """
+    记录重建的开始时间和模式，供切换前的catch-up使用
+    """
+    collection.set_properties({REBUILD_STARTED_AT_PROPERTY: started_at.isoformat(), REBUILD_MODE_PROPERTY: mode})
+
+
+def load_rebuild_info(name: str) -> Tuple[Optional[datetime], Optional[str]]:
+    """
+    :return: (重建开始时间, 重建模式)，没有记录时为None
+    """
+    properties = Collection(name).describe().get("properties") or {}
+    if not isinstance(properties, dict):
+        properties = {item.key: item.value for item in properties}
+    started_at = properties.get(REBUILD_STARTED_AT_PROPERTY)
+    return (datetime.fromisoformat(started_at) if started_at else None), properties.get(REBUILD_MODE_PROPERTY)
+
+
+def load_version(name: str):
+    """
+    等待索引建立完成并加载Collection
+    """
+    collection = Collection(name)
+    for index in collection.indexes:
+        utility.wait_for_index_building_complete(name, index_name=index.index_name)
+    collection.load()
+    utility.wait_for_loading_complete(name)
+    return collection
+
+
+def vectorized_files(since: Optional[datetime] = None) -> List[KnowledgeFile]:
+    """
+    :param since: 只返回该时间之后有变化（含删除）的文件
+    :return:
+    """
+    with Session(engine) as session:
+        statement = select(KnowledgeFile)
+        if since:
+            statement = statement.where(KnowledgeFile.updated_at >= since)
+        else:
+            statement = statement.where(KnowledgeFile.status == FileStatus.VECTORIZED, KnowledgeFile.is_deleted == False)
+        return list(session.exec(statement).all())
+
+
+def copy_rows(target: MilvusService, batch_size: int, file_ids: Optional[Set[int]] = None,
+              files_per_query: int = settings.MILVUS_DELETE_BATCH_SIZE) -> int:
+    """
+    从当前版本复制数据到目标版本
+    :param target:
+    :param batch_size:
+    :param file_ids: 为空时复制全部数据，否则按 file_id in [...] 分批查询，只读取这些文件的数据
+    :param files_per_query: 每个查询表达式中的文件数量
+    :return: 复制的行数
+    """
+    if file_ids is None:
+        expressions = ["id >= 0"]
+    else:
+        ordered = sorted(file_ids)
+        expressions = [f"file_id in {ordered[start:start + files_per_query]}"
+                       for start in range(0, len(ordered), files_per_query)]
+    copied = 0
+    started = time.monotonic()
+    for expr in expressions:
+        copied += _copy_matching(target, batch_size, expr, copied, started)
+    return copied
+
+
+def _copy_matching(target: MilvusService, batch_size: int, expr: str, copied_before: int, started: float) -> int:
+    """
+    复制当前版本中满足表达式的数据
+    :return: 复制的行数
+    """
+    source = milvus_service
+    iterator = source.collection.query_iterator(
+        batch_size=batch_size,
+        expr=expr,
+        output_fields=["file_id", "knowledge_base_id", source.text_field, "vector"],
+    )
+    copied = 0
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            texts = source.fetch_texts(rows)
+            rows = [(row, text) for row, text in zip(rows, texts) if text is not None]
+            if not rows:
+                continue
+            target.insert_columns([
+                [row["file_id"] for row, _ in rows],
+                [row["knowledge_base_id"] for row, _ in rows],
+                [text for _, text in rows],
+                decode_from_storage([row["vector"] for row, _ in rows], source.storage_type),
+            ])
+            copied += len(rows)
+            total = copied_before + copied
+            logger.info(f"已复制 {total} 条，速度 {total / (time.monotonic() - started):.0f} 行/秒")
+    finally:
+        iterator.close()
+    return copied
+
+
+def reembed_orphans(pipeline: IngestionPipeline, file_ids: Set[int], batch_size: int) -> int:
+    """
+    不属于任何已向量化文件的数据（如populate/bulk导入的问答）：从当前版本读取文本后重新向量化
+    """
+    source = milvus_service
+    iterator = source.collection.query_iterator(
+        batch_size=batch_size,
+        expr="id >= 0",
+        output_fields=["file_id", "knowledge_base_id", source.text_field],
+    )
+    inserted = 0
+    try:
+        while True:
+            page = iterator.next()
+            if not page:
+                break
+            rows = [row for row in page if row["file_id"] not in file_ids]
+            groups: Dict[tuple, List[str]] = defaultdict(list)
+            for row, text in zip(rows, source.fetch_texts(rows)):
+                if text is not None:
+                    groups[(row["file_id"], row["knowledge_base_id"])].append(text)
+            for (file_id, knowledge_base_id), texts in groups.items():
+                inserted += pipeline.run(file_id, knowledge_base_id, texts)
+    finally:
+        iterator.close()
+    return inserted
+
+
+def rebuild_files(target: MilvusService, pipeline: IngestionPipeline, files: List[KnowledgeFile],
+                  workers: int) -> Dict[str, int]:
+    """
+    在目标版本中重新向量化一批文件，跳过已删除或未完成向量化的文件
+    目标版本中这些文件已有的数据需由调用方预先批量删除（catch-up时）
+    """
+    stats = {"files": 0, "vectors": 0, "removed": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def count(key: str, value: int = 1):
+        with lock:
+            stats[key] += value
+
+    def rebuild(file: KnowledgeFile):
+        if file.is_deleted or file.status != FileStatus.VECTORIZED:
+            count("removed")
+            return
+        try:
+            with Session(engine) as session:
+                db_file = session.get(KnowledgeFile, file.id)
+                # 不记录网页的抓取状态，避免当前版本的定期刷新错过内容变化
+                count("vectors", ingest_file_content(session, db_file, pipeline, record_web_state=False))
+            count("files")
+        except Exception as e:
+            logger.error(f"重建文件失败，文件ID: {file.id}，错误信息: {e}")
+            count("failed")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, _ in enumerate(executor.map(rebuild, files), start=1):
+            if index % 100 == 0:
+                logger.info(f"已处理 {index}/{len(files)} 个文件: {stats}")
+    return stats
+
+
+def new_pipeline(target: MilvusService) -> IngestionPipeline:
+    return IngestionPipeline(create_embedding_client(get_default_embeddings()), MilvusInsertBuffer(target))
+
+
+def catch_up_version(name: str, since: datetime, workers: int, mode: str, batch_size: int) -> Dict[str, int]:
+    """
+    同步since之后有变化的文件到目标版本
+    """
+    target = MilvusService(name)
+    files = vectorized_files(since)
+    logger.info(f"{since.isoformat()} 之后有变化的文件: {len(files)} 个")
+    # 先批量删除这些文件在目标版本中的旧数据（file_id in [...]，只flush一次），再复制或重新向量化
+    target.delete_files([file.id for file in files])
+    if mode == "copy":
+        stats = {"files": 0, "vectors": 0, "removed": 0, "failed": 0}
+        current = [file for file in files if not file.is_deleted and file.status == FileStatus.VECTORIZED]
+        stats["removed"] = len(files) - len(current)
+        stats["files"] = len(current)
+        stats["vectors"] = copy_rows(target, batch_size, {file.id for file in current})
+    else:
+        pipeline = new_pipeline(target)
+        stats = rebuild_files(target, pipeline, files, workers)
+        pipeline.insert_buffer.close()
+    target.flush()
+    return stats
+
+
+def bootstrap(args):
+    """
+    把未版本化的Collection改名为v1并建立别名
+    """
+    if resolve_alias(DEFAULT_COLLECTION_NAME):
+        logger.info(f"'{DEFAULT_COLLECTION_NAME}' 已是别名，指向 '{resolve_alias(DEFAULT_COLLECTION_NAME)}'")
+        return
+    name = versioned_collection_name(1)
+    if utility.has_collection(name):
+        raise ValueError(f"Collection已存在: {name}")
+    # 改名与建立别名之间有短暂的不可用窗口
+    utility.rename_collection(DEFAULT_COLLECTION_NAME, name)
+    utility.create_alias(name, DEFAULT_COLLECTION_NAME)
+    moved = chunk_text_store.rename_collection(DEFAULT_COLLECTION_NAME, name)
+    Collection(name).load()
+    logger.info(f"已将 '{DEFAULT_COLLECTION_NAME}' 改名为 '{name}' 并建立别名，外部文本存储中 {moved} 个块已归属新名称")
+
+
+def rebuild(args):
+    """
+    按当前配置建立新版本，重建完成后建立索引并补做重建期间有变化的文件
+    """
+    current = resolve_alias(DEFAULT_COLLECTION_NAME)
+    if current is None:
+        raise ValueError(f"'{DEFAULT_COLLECTION_NAME}' 尚未版本化，请先执行 bootstrap")
+    version = args.version or max(list_versions(), default=0) + 1
+    name = versioned_collection_name(version)
+    if utility.has_collection(name):
+        raise ValueError(f"Collection已存在: {name}")
+    storage_type = VectorStorageType(args.vector_type)
+    external_text = args.text_store == "mysql"
+    create_collection(name, storage_type, with_index=False, external_text=external_text)
+    target = MilvusService(name)
+    started_at = datetime.now(timezone.utc)
+    save_rebuild_info(target.collection, started_at, args.mode)
+    started = time.monotonic()
+    logger.info(f"开始重建 '{name}'（当前版本 '{current}'），模式: {args.mode}，开始时间: {started_at.isoformat()}")
+
+    if args.mode == "copy":
+        copied = copy_rows(target, args.batch_size)
+        logger.info(f"复制完成，共 {copied} 条")
+    else:
+        files = vectorized_files()
+        pipeline = new_pipeline(target)
+        stats = rebuild_files(target, pipeline, files, args.workers)
+        logger.info(f"文件重建完成: {stats}")
+        orphans = reembed_orphans(pipeline, {file.id for file in files}, args.batch_size)
+        logger.info(f"不属于文件的数据重新向量化 {orphans} 条")
+        pipeline.insert_buffer.close()
+    target.flush()
+
+    # 数据写入完成后再建立索引，避免边写边建
+    create_vector_indexes(target.collection, storage_type)
+    create_scalar_indexes(target.collection)
+    load_version(name)
+    stats = catch_up_version(name, started_at, args.workers, args.mode, args.batch_size)
+    logger.info(f"catch-up完成: {stats}")
+    logger.info(f"重建完成，'{name}' 共 {target.collection.num_entities} 行，耗时 {time.monotonic() - started:.0f}s")
+    logger.info(f"验证: python scripts/rebuild_collection.py validate --version {version}")
+    logger.info(f"切换: python scripts/rebuild_collection.py switch --version {version}（切换前自动从 "
+                f"{started_at.isoformat()} 再做一次catch-up）")
+
+
+def catch_up(args):
+    since = datetime.fromisoformat(args.since)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    stats = catch_up_version(versioned_collection_name(args.version), since, args.workers, args.mode, args.batch_size)
+    logger.info(f"catch-up完成: {stats}")
+
+
+def validate(args) -> bool:
+    """
+    切换前验证新版本：行数与当前版本的差异、已向量化文件的覆盖率、自检索召回率和检索延迟
+    """
+    name = versioned_collection_name(args.version)
+    current = resolve_alias(DEFAULT_COLLECTION_NAME)
+    target = MilvusService(name)
+    load_version(name)
+    passed = True
+
+    current_rows = milvus_service.collection.num_entities
+    target_rows = target.collection.num_entities
+    diff = abs(target_rows - current_rows) / max(current_rows, 1)
+    logger.info(f"行数: 当前版本 '{current}' {current_rows}，'{name}' {target_rows}，差异 {diff:.1%}")
+    if target_rows == 0 or diff > args.max_row_diff:
+        logger.error(f"行数差异超过 {args.max_row_diff:.0%}")
+        passed = False
+
+    files = vectorized_files()
+    sample_files = random.sample(files, min(args.files, len(files)))
+    missing = [
+        file.id for file in sample_files
+        if not target.collection.query(expr=f"file_id == {file.id}", output_fields=["count(*)"])[0]["count(*)"]
+    ]
+    logger.info(f"抽样 {len(sample_files)} 个已向量化文件，缺少向量的: {len(missing)} 个 {missing[:20]}")
+    if missing:
+        passed = False
+
+    # 自检索：用新版本中的文本块作为查询，检查其自身是否出现在top-k中
+    rows = target.collection.query(expr="id >= 0", limit=args.queries, output_fields=["id", target.text_field])
+    texts = target.fetch_texts(rows)
+    queries = [(row["id"], text) for row, text in zip(rows, texts) if text]
+    if queries:
+        vectors = get_default_embeddings().embed_documents([text for _, text in queries])
+        hits, latencies = 0, []
+        for (row_id, _), vector in zip(queries, vectors):
+            started = time.monotonic()
+            # 与线上相同的检索路径（含二值粗排+精排、外部文本读取）
+            results = asyncio.run(target.search(vector, args.top_k))
+            latencies.append(time.monotonic() - started)
+            hits += any(result["id"] == row_id for result in results)
+        recall = hits / len(queries)
+        logger.info(f"自检索recall@{args.top_k}: {recall:.3f}（{len(queries)} 个查询），"
+                    f"延迟p50 {np.percentile(latencies, 50) * 1000:.1f}ms，p95 {np.percentile(latencies, 95) * 1000:.1f}ms")
+        if recall < args.min_recall:
+            logger.error(f"自检索召回率低于 {args.min_recall}")
+            passed = False
+    logger.info(f"验证{'通过' if passed else '未通过'}: '{name}'")
+    return passed
+
+
+def switch_alias(name: str):
+    """
+    加载目标版本后原子地切换别名
+    """
+    load_version(name)
+    if resolve_alias(DEFAULT_COLLECTION_NAME) is None:
+        if utility.has_collection(DEFAULT_COLLECTION_NAME):
+            raise ValueError(f"'{DEFAULT_COLLECTION_NAME}' 尚未版本化，请先执行 bootstrap")
+        utility.create_alias(name, DEFAULT_COLLECTION_NAME)
+    else:
+        utility.alter_alias(name, DEFAULT_COLLECTION_NAME)
+    logger.info(f"别名 '{DEFAULT_COLLECTION_NAME}' 已切换到 '{name}'，服务将在 {settings.MILVUS_ALIAS_REFRESH_SECONDS}s 内跟随；"
+                f"旧版本保持加载以便回滚，确认后使用 drop 删除")
+
+
+def switch(args):
+    """
+    验证后从重建开始时间再做一次catch-up，然后切换别名
+    """
+    name = versioned_collection_name(args.version)
+    if not args.skip_validate and not validate(args):
+        raise SystemExit(1)
+    if not args.skip_catch_up:
+        started_at, mode = load_rebuild_info(name)
+        if args.since:
+            started_at = datetime.fromisoformat(args.since)
+        if started_at is None:
+            raise ValueError(f"'{name}' 没有记录重建开始时间，请用 --since 指定，或用 --skip-catch-up 跳过")
+        if started_at.tzinfo is None:
+            started_at = started_at.replace(tzinfo=timezone.utc)
+        stats = catch_up_version(name, started_at, args.workers, args.mode or mode or "reembed", args.batch_size)
+        logger.info(f"切换前catch-up完成: {stats}")
+    switch_alias(name)
+
+
+def rollback(args):
+    """
+    切换回当前版本之前的最新版本
+    """
+    current_version = collection_version(resolve_alias(DEFAULT_COLLECTION_NAME))
+    if current_version is None:
+        raise ValueError(f"'{DEFAULT_COLLECTION_NAME}' 没有指向版本化的Collection")
+    previous = [version for version in list_versions() if version < current_version]
+    if not previous:
+        raise ValueError(f"没有早于v{current_version}的版本")
+    switch_alias(versioned_collection_name(previous[-1]))
+
+
+def list_all(args):
+    current = resolve_alias(DEFAULT_COLLECTION_NAME)
+    for version in list_versions():
+        name = versioned_collection_name(version)
+        collection = Collection(name)
+        state = utility.load_state(name)
+        print(f"{name:<32}{collection.num_entities:>12} 行  {state.name:<10}{'<- ' + DEFAULT_COLLECTION_NAME if name == current else ''}")
+
+
+def drop(args):
+    name = versioned_collection_name(args.version)
+    if name == resolve_alias(DEFAULT_COLLECTION_NAME):
+        raise ValueError(f"'{name}' 是当前版本，不能删除")
+    Collection(name).release()
+    utility.drop_collection(name)
+    removed = chunk_text_store.delete_collection(name)
+    logger.info(f"已删除 '{name}'，外部文本存储中删除了 {removed} 个块")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="版本化Collection的重建与切换")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="列出全部版本").set_defaults(func=list_all)
+    subparsers.add_parser("bootstrap", help="把未版本化的Collection转换为v1+别名").set_defaults(func=bootstrap)
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="重建新版本")
+    rebuild_parser.add_argument("--mode", choices=["copy", "reembed"], default="reembed")
+    rebuild_parser.add_argument("--version", type=int, help="新版本号，默认为已有最大版本+1")
+    rebuild_parser.add_argument("--vector-type", default=settings.MILVUS_VECTOR_TYPE, choices=[t.value for t in VectorStorageType])
+    rebuild_parser.add_argument("--text-store", default=settings.MILVUS_TEXT_STORE, choices=["inline", "mysql"])
+    rebuild_parser.add_argument("--workers", type=int, default=4, help="同时重建的文件数")
+    rebuild_parser.add_argument("--batch-size", type=int, default=1000, help="从当前版本读取数据的分页大小")
+    rebuild_parser.set_defaults(func=rebuild)
+
+    catch_up_parser = subparsers.add_parser("catch-up", help="同步指定时间之后有变化的文件")
+    catch_up_parser.add_argument("--version", type=int, required=True)
+    catch_up_parser.add_argument("--since", required=True, help="ISO格式时间，一般为rebuild输出的开始时间")
+    catch_up_parser.add_argument("--mode", choices=["copy", "reembed"], default="reembed")
+    catch_up_parser.add_argument("--workers", type=int, default=4)
+    catch_up_parser.add_argument("--batch-size", type=int, default=1000)
+    catch_up_parser.set_defaults(func=catch_up)
+
+    for command, func, help_text in [("validate", validate, "验证新版本"), ("switch", switch, "验证并切换到新版本")]:
+        validate_parser = subparsers.add_parser(command, help=help_text)
+        validate_parser.add_argument("--version", type=int, required=True)
+        validate_parser.add_argument("--max-row-diff", type=float, default=0.2, help="与当前版本行数的最大相对差异")
+        validate_parser.add_argument("--files", type=int, default=200, help="抽样检查的文件数")
+        validate_parser.add_argument("--queries", type=int, default=100, help="自检索的查询数")
+        validate_parser.add_argument("--top-k", type=int, default=10)
+        validate_parser.add_argument("--min-recall", type=float, default=0.9)
+        if command == "switch":
+            validate_parser.add_argument("--skip-validate", action="store_true")
+            validate_parser.add_argument("--skip-catch-up", action="store_true", help="切换前不做catch-up")
+            validate_parser.add_argument("--since", help="catch-up的起始时间，默认为重建开始时间")
+            validate_parser.add_argument("--mode", choices=["copy", "reembed"], help="catch-up模式，默认与重建相同")
+            validate_parser.add_argument("--workers", type=int, default=4)
+            validate_parser.add_argument("--batch-size", type=int, default=1000)
+        validate_parser.set_defaults(func=func)
+
+    subparsers.add_parser("rollback", help="切换回上一个版本").set_defaults(func=rollback)
+
+    drop_parser = subparsers.add_parser("drop", help="删除一个非当前版本")
+    drop_parser.add_argument("--version", type=int, required=True)
+    drop_parser.set_defaults(func=drop)
+
+    arguments = parser.parse_args()
+    milvus_service.connect()
+    result = arguments.func(arguments)
+    if result is False:
+        raise SystemExit(1)
@@ -0,0 +1,46 @@
+import os
+
+"""
+测试环境配置
+
+导入app模块时会实例化Settings（必填项没有默认值）并创建数据库引擎、Redis连接池等，
+这里在收集测试之前为必填项设置占位值，使测试不依赖 .env 文件和真实的MySQL/Redis/MinIO。
+这些客户端都是懒连接的，测试中需要的依赖（数据库、队列、网站）由各测试替换为本地替身。
+已存在的环境变量不会被覆盖。
+"""
+
+_TEST_ENV = {
+    # 数据库（只用于创建懒连接的引擎，测试中替换为SQLite）
+    "DB_HOST": "127.0.0.1",
+    "DB_PORT": "3306",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "DB_NAME": "healthlink_test",
+    # Redis
+    "REDIS_HOST": "127.0.0.1",
+    "REDIS_PORT": "6379",
+    "REDIS_DB": "15",
+    "REDIS_PASSWORD": "test",
+    # MinIO
+    "MINIO_ENDPOINT": "127.0.0.1:9000",
+    "MINIO_ACCESS_KEY": "test",
+    "MINIO_SECRET_KEY": "test",
+    "MINIO_SECURE": "false",
+    "MINIO_DEFAULT_BUCKET": "test",
+    # 模型
+    "MODEL_KEY": "test",
+    "EMBEDDING_MODEL": "test",
+    "EMBEDDING_MODEL_URL": "http://127.0.0.1:1",
+    "MODEL_URL": "http://127.0.0.1:1",
+    "MODE_NAME": "test",
+    # 其他
+    "TEMP_MEMORY_SIZE": "10",
+    "PROJECT_NAME": "healthlink-test",
+    "JWT_SECRET_KEY": "test",
+    "JWT_ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "JWT_LOGIN_SUBJECT": "test",
+}
+
+for _name, _value in _TEST_ENV.items():
+    os.environ.setdefault(_name, _value)
@@ -0,0 +1,210 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import httpx
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.core.constants import FileStatus, SupportedMimeTypes
+from app.models.knowledge import KnowledgeFile, WebPage
+from app.services import web_page_service
+from app.services.web_crawler import WebCrawler, extract_text, text_hash
+
+"""
+网页抓取与定期刷新的测试，用httpx.MockTransport代替真实网站，SQLite内存库代替MySQL
+"""
+
+PER_HOST_DELAY = 0.2
+
+
+class FakeSite:
+    """
+    本地网站替身：按URL返回HTML，支持ETag条件请求，并记录收到的请求
+    """
+
+    def __init__(self):
+        self.pages: Dict[str, Tuple[str, str]] = {}
+        self.requests: List[Tuple[str, httpx.Headers, float]] = []
+
+    def publish(self, url: str, html: str, etag: str):
+        self.pages[url] = (html, etag)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        self.requests.append((url, request.headers, time.monotonic()))
+        if url not in self.pages:
+            return httpx.Response(404)
+        html, etag = self.pages[url]
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, content=html.encode("utf-8"),
+                              headers={"ETag": etag, "Content-Type": "text/html; charset=utf-8"})
+
+
+class FakeQueue:
+    def __init__(self):
+        self.enqueued: List[int] = []
+
+    def enqueue(self, file_id: int, knowledge_base_id=None, **kwargs) -> bool:
+        self.enqueued.append(file_id)
+        return True
+
+
+def page_html(body: str, script: str = "") -> str:
+    return f"<html><head><script>{script}</script></head><body><p>{body}</p></body></html>"
+
+
+def html_hash(html: str) -> str:
+    return text_hash(extract_text(html.encode("utf-8"), "text/html", "utf-8"))
+
+
+@pytest.fixture
+def site():
+    return FakeSite()
+
+
+@pytest.fixture
+def crawler(site):
+    crawler = WebCrawler(per_host_delay_seconds=PER_HOST_DELAY, transport=httpx.MockTransport(site.handle))
+    yield crawler
+    crawler.close()
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = FakeQueue()
+    monkeypatch.setattr(web_page_service, "ingestion_queue", queue)
+    return queue
+
+
+@pytest.fixture
+def engine(monkeypatch, crawler, queue):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine, tables=[KnowledgeFile.__table__, WebPage.__table__])
+    monkeypatch.setattr(web_page_service, "engine", engine)
+    monkeypatch.setattr(web_page_service, "web_crawler", crawler)
+    web_page_service._prefetched.clear()
+    yield engine
+    web_page_service._prefetched.clear()
+
+
+def add_web_file(engine, url: str, status: str, html: str = None, etag: str = None, fetched_ago: int = 2 * 86400) -> int:
+    """
+    写入一个网页文件及其上次抓取状态（html为None时没有抓取记录）
+    """
+    with Session(engine) as session:
+        db_file = KnowledgeFile(filename=url, mime_type=SupportedMimeTypes.WEB_URL.value, file_path=url,
+                                knowledge_base_id=1, status=status)
+        session.add(db_file)
+        if html is not None:
+            session.add(WebPage(
+                knowledge_file_id=db_file.id, url=url, etag=etag, content_hash=html_hash(html), http_status=200,
+                fetched_at=datetime.now(timezone.utc) - timedelta(seconds=fetched_ago),
+            ))
+        session.commit()
+        return db_file.id
+
+
+def test_conditional_get_returns_not_modified(site, crawler):
+    url = "http://a.example/page"
+    site.publish(url, page_html("正文"), '"v1"')
+    first = crawler.fetch(url)
+    assert first.status == 200 and first.etag == '"v1"' and first.text == "正文"
+    second = crawler.fetch(url, etag=first.etag)
+    assert second.not_modified and second.text is None
+    assert site.requests[-1][1]["if-none-match"] == '"v1"'
+
+
+def test_content_hash_ignores_scripts(site, crawler):
+    site.publish("http://a.example/1", page_html("正文", script="var a = 1;"), '"v1"')
+    site.publish("http://a.example/2", page_html("正文", script="var a = 2;"), '"v2"')
+    first, second = crawler.fetch_many([("http://a.example/1", None, None), ("http://a.example/2", None, None)])
+    assert first.content_hash == second.content_hash
+    site.publish("http://a.example/3", page_html("新正文"), '"v3"')
+    assert crawler.fetch("http://a.example/3").content_hash != first.content_hash
+
+
+def test_requests_to_same_host_are_spaced(site, crawler):
+    urls = [f"http://a.example/{index}" for index in range(3)] + ["http://b.example/0"]
+    for url in urls:
+        site.publish(url, page_html(url), '"v1"')
+    results = crawler.fetch_many([(url, None, None) for url in urls])
+    assert all(result.status == 200 for result in results)
+    times = {}
+    for url, _, at in site.requests:
+        times.setdefault(httpx.URL(url).host, []).append(at)
+    same_host = sorted(times["a.example"])
+    assert all(later - earlier >= PER_HOST_DELAY * 0.9 for earlier, later in zip(same_host, same_host[1:]))
+    # 其他网站的请求不受限速影响
+    assert times["b.example"][0] - same_host[0] < PER_HOST_DELAY
+
+
+def test_refresh_skips_unchanged_page(site, engine, queue):
+    url = "http://a.example/page"
+    html = page_html("正文")
+    site.publish(url, html, '"v1"')
+    add_web_file(engine, url, FileStatus.VECTORIZED, html=html, etag='"v1"')
+    stats = web_page_service.refresh_web_pages()
+    assert stats["checked"] == 1 and stats["unchanged"] == 1
+    assert queue.enqueued == []
+    assert site.requests[0][1]["if-none-match"] == '"v1"'
+
+
+def test_refresh_skips_same_text_with_new_etag(site, engine, queue):
+    url = "http://a.example/page"
+    site.publish(url, page_html("正文", script="track(2)"), '"v2"')
+    add_web_file(engine, url, FileStatus.VECTORIZED, html=page_html("正文", script="track(1)"), etag='"v1"')
+    stats = web_page_service.refresh_web_pages()
+    assert stats["unchanged"] == 1 and queue.enqueued == []
+    with Session(engine) as session:
+        assert session.exec(select(WebPage)).one().etag == '"v2"'
+
+
+def test_refresh_requeues_changed_page_and_reuses_body(site, engine, queue):
+    url = "http://a.example/page"
+    site.publish(url, page_html("新正文"), '"v2"')
+    file_id = add_web_file(engine, url, FileStatus.VECTORIZED, html=page_html("正文"), etag='"v1"')
+    stats = web_page_service.refresh_web_pages()
+    assert stats["changed"] == 1 and queue.enqueued == [file_id]
+    requests = len(site.requests)
+    with Session(engine) as session:
+        db_file = session.get(KnowledgeFile, file_id)
+        assert db_file.status == FileStatus.COMPLETED
+        assert web_page_service.fetch_web_page(session, db_file) == "新正文"
+        # 向量化使用刷新时抓取的正文，不再请求网站
+        assert len(site.requests) == requests
+        page = session.exec(select(WebPage)).one()
+        assert page.content_hash == html_hash(page_html("新正文")) and page.etag == '"v2"'
+
+
+def test_refresh_retries_failed_page(site, engine, queue):
+    url = "http://a.example/page"
+    html = page_html("正文")
+    site.publish(url, html, '"v1"')
+    # 抓取状态已在失败前记录，内容未变化也要重新向量化
+    file_id = add_web_file(engine, url, FileStatus.FAILED, html=html, etag='"v1"')
+    stats = web_page_service.refresh_web_pages()
+    assert stats["retried"] == 1 and queue.enqueued == [file_id]
+    assert "if-none-match" not in site.requests[0][1]
+    with Session(engine) as session:
+        assert session.get(KnowledgeFile, file_id).status == FileStatus.COMPLETED
+
+
+def test_refresh_postpones_unreachable_page(site, engine, queue):
+    file_id = add_web_file(engine, "http://a.example/missing", FileStatus.VECTORIZED, html=page_html("正文"))
+    stats = web_page_service.refresh_web_pages()
+    assert stats["failed"] == 1 and queue.enqueued == []
+    # 失败的网页推迟到下一个周期
+    assert web_page_service.refresh_web_pages()["checked"] == 0
+    with Session(engine) as session:
+        assert session.get(KnowledgeFile, file_id).status == FileStatus.VECTORIZED
+
+
+def test_refresh_ignores_recently_fetched_page(site, engine, queue):
+    url = "http://a.example/page"
+    site.publish(url, page_html("新正文"), '"v2"')
+    add_web_file(engine, url, FileStatus.VECTORIZED, html=page_html("正文"), fetched_ago=60)
+    assert web_page_service.refresh_web_pages()["checked"] == 0
+    assert site.requests == []